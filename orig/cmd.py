@@ -11,12 +11,17 @@
 import sys
 import subprocess
 
+from gateway import find_ispinfo, ispinfo_rc
+from stream import OutputStream, IspinfoFilter
+
 # A wrapper class to ensure that we have proper exception handling in place when
 # running commands.
 class Cmd:
-    def __init__(self,log,cmd):
+    def __init__(self,log,cmd,gateway=None):
         self.log = log
         self.cmd = cmd;
+        self.gateway = gateway
+        self.stream = False
         self.out = None
         self.err = None
         self.rc = 0;
@@ -28,10 +33,11 @@ class Cmd:
     # Run a task in the pipeline.  Peek at the task to see what kind of command
     # it is, and handle it accordingly.
     def run(self, cmd_env):
-        if self.cmd.split(' ')[0] == 'TSO':
-            rc = self.run_tso(cmd_env)
-        else:
-            rc = self.run_linux(cmd_env)
+        with self.log.tracer.span('cmd', {'cmd': self.cmd}):
+            if self.is_tso():
+                rc = self.run_tso(cmd_env)
+            else:
+                rc = self.run_linux(cmd_env)
         return rc
 
     # TSO commands run through the ISPF Gateway.  This is an interactive interface,
@@ -39,6 +45,11 @@ class Cmd:
     def run_tso(self, cmd_env):
         self.log.log('info','[TSO]> %s',self.cmd.replace('TSO ', ''))
 
+        # With a gateway pool, hand the command to a gateway session that is
+        # already running instead of starting ISPZINT just for this command.
+        if self.gateway != None:
+            return self.run_tso_session()
+
         # Need to run in the shell to get the env we want to set up.
         proc = subprocess.Popen(args='ISPZINT',
                                 stdin=subprocess.PIPE,
@@ -48,23 +59,12 @@ class Cmd:
                                 shell=True)
 
         try:
+            if self.stream:
+                return self.stream_output(proc, bytes(self.cmd, 'utf-8'), True)
+
             self.out, self.err = proc.communicate(input=bytes(self.cmd, 'utf-8'))
             self.rc = proc.returncode
-
-            # The gateway is very verbose by default, but the actual output of the
-            # TSO command is returned in an XML object <ISPINFO/>.  Skip over all
-            # other text in STDOUT and return just the good stuff.
-            if self.rc == 0:
-                stdout = self.out.decode()
-                i_out_start = stdout.find('<ISPINFO>')
-                i_out_end = stdout.find('</ISPINFO>') + len('</ISPINFO>')
-                self.log.log('info', '%s', (stdout[i_out_start:i_out_end]))
-                return 0
-            else:
-                if len(self.err) > 0:
-                   self.log.log('err','%s',self.err.decode())
-                self.log.log('err','retcode: %d',self.rc)
-                return self.rc
+            return self.log_result(True)
         except OSError as e:
             self.log.log('err',
                 'OSError: output = %s, error code = %s',
@@ -84,6 +84,39 @@ class Cmd:
                 (e))
         return 1
 
+    # TSO command sent to a pooled gateway session over its STDIN.
+    def run_tso_session(self):
+        try:
+            self.rc, self.out, self.err = self.gateway.run(self.cmd)
+            if self.rc == 0:
+                # The session outlives the command, so the command's return
+                # code comes from the <ISPINFO/> block instead of the process.
+                blocks = find_ispinfo(self.out.decode())
+                info = '\n'.join(blocks)
+                if len(blocks) > 0:
+                    self.rc = ispinfo_rc(blocks[0])
+                if self.rc == 0:
+                    self.log.log('info', '%s', (info))
+                    return 0
+                self.log.log('err', '%s', (info))
+                self.log.log('err','retcode: %d',self.rc)
+                return self.rc
+            else:
+                if len(self.err) > 0:
+                   self.log.log('err','%s',self.err.decode())
+                self.log.log('err','retcode: %d',self.rc)
+                return self.rc
+        except OSError as e:
+            self.log.log('err',
+                'OSError: error code = %s, %s',
+                (e.errno, e.strerror))
+        except:
+            e = sys.exc_info()[0]
+            self.log.log('err',
+                'Error - exception type: %s',
+                (e))
+        return 1
+
     # Vanilla Unix/Linux command, so run this through the shell.
     def run_linux(self, cmd_env):
         self.log.log('info','[Shell]> %s',self.cmd)
@@ -96,16 +129,12 @@ class Cmd:
                                 shell=True)
 
         try:
+            if self.stream:
+                return self.stream_output(proc)
+
             self.out, self.err = proc.communicate()
             self.rc = proc.returncode
-            if self.rc == 0:
-                self.log.log('info','%s',self.out.decode())
-                return 0
-            else:
-                if len(self.err) > 0:
-                   self.log.log('err','%s',self.err.decode())
-                self.log.log('err','retcode: %d',self.rc)
-                return self.rc
+            return self.log_result()
         except OSError as e:
             self.log.log('err',
                 'OSError: output = %s, error code = %s',
@@ -125,9 +154,152 @@ class Cmd:
                 (e))
         return 1
 
+    # Log the output of a command after it has finished.  The gateway is very
+    # verbose by default, but the actual output of a TSO command is returned in
+    # an XML object <ISPINFO/>.  Skip over all other text in STDOUT and log just
+    # the good stuff.
+    def log_result(self, tso=False):
+        if self.rc == 0:
+            stdout = self.out.decode()
+            if tso:
+                i_out_start = stdout.find('<ISPINFO>')
+                i_out_end = stdout.find('</ISPINFO>') + len('</ISPINFO>')
+                stdout = stdout[i_out_start:i_out_end]
+            self.log.log('info', '%s', (stdout))
+        else:
+            if len(self.err) > 0:
+               self.log.log('err','%s',self.err.decode())
+            self.log.log('err','retcode: %d',self.rc)
+        return self.rc
+
+    # Log the output of a running command as it arrives instead of collecting
+    # all of it first.  Only the tail of STDOUT and STDERR is kept in self.out
+    # and self.err, and the STDERR tail is what gets logged if the command fails.
+    def stream_output(self, proc, input=None, ispinfo=False):
+        forward = lambda line: self.log.log('info','%s',(line))
+        if ispinfo:
+            forward = IspinfoFilter(forward)
+        out = OutputStream(proc.stdout, forward)
+        err = OutputStream(proc.stderr)
+        err.start()
+        try:
+            if input != None:
+                try:
+                    proc.stdin.write(input)
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            out.read()
+        finally:
+            out.cleanup()
+            err.cleanup()
+            self.rc = proc.wait()
+
+        self.out = out.get_tail()
+        self.err = err.get_tail()
+        if self.rc != 0:
+            if len(self.err) > 0:
+               self.log.log('err','%s',self.err.decode())
+            self.log.log('err','retcode: %d',self.rc)
+        return self.rc
+
+    def is_tso(self):
+        return self.cmd.split(' ')[0] == 'TSO'
+
     def get_cmd(self):
         return self.cmd
 
+    def get_log(self):
+        return self.log
+
+    def set_log(self,log):
+        self.log = log
+        return
+
+    def set_stream(self,stream):
+        self.stream = stream
+        return
+
     def show(self):
         self.log.log('info', '       cmd: %s',self.cmd)
         return
+
+
+# A run of adjacent TSO commands from a stage, sent to the ISPF gateway in a
+# single request - one command per line on STDIN.  The gateway answers with one
+# <ISPINFO/> block per command, in order, and the blocks are handed back to the
+# commands they belong to.
+class TsoBatch:
+    def __init__(self,log,cmds,gateway=None):
+        self.log = log
+        self.cmds = cmds
+        self.gateway = gateway
+        self.out = None
+        self.err = None
+        self.rc = 0
+        return
+
+    def cleanup(self):
+        return
+
+    # Run the batch and return the list of command return codes, in order.
+    def run(self, cmd_env):
+        with self.log.tracer.span('tso batch', {'commands': len(self.cmds)}):
+            return self.run_batch(cmd_env)
+
+    def run_batch(self, cmd_env):
+        request = '\n'.join(cmd.get_cmd() for cmd in self.cmds)
+        try:
+            if self.gateway != None:
+                self.rc, self.out, self.err = self.gateway.run(request, len(self.cmds))
+            else:
+                proc = subprocess.Popen(args='ISPZINT',
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        env=cmd_env,
+                                        shell=True)
+                self.out, self.err = proc.communicate(input=bytes(request + '\n', 'utf-8'))
+                self.rc = proc.returncode
+            blocks = find_ispinfo(self.out.decode())
+        except OSError as e:
+            self.log.log('err',
+                'OSError: error code = %s, %s',
+                (e.errno, e.strerror))
+            self.rc = 1
+            blocks = []
+        except:
+            e = sys.exc_info()[0]
+            self.log.log('err',
+                'Error - exception type: %s',
+                (e))
+            self.rc = 1
+            blocks = []
+
+        # Commands that got an answer take their return code from it.  If the
+        # gateway stopped early, the rest of the batch gets the gateway's rc.
+        cmd_rcs = []
+        for i, cmd in enumerate(self.cmds):
+            self.log.log('info','[TSO]> %s',cmd.get_cmd().replace('TSO ', ''))
+            if i < len(blocks):
+                cmd.out = blocks[i]
+                cmd.rc = ispinfo_rc(blocks[i])
+                if cmd.rc == 0:
+                    self.log.log('info', '%s', (blocks[i]))
+                else:
+                    self.log.log('err', '%s', (blocks[i]))
+                    self.log.log('err','retcode: %d',cmd.rc)
+            else:
+                cmd.rc = self.rc if self.rc != 0 else 1
+                if i == len(blocks) and (self.err != None) and (len(self.err) > 0):
+                    self.log.log('err','%s',self.err.decode())
+                self.log.log('err','retcode: %d',cmd.rc)
+            cmd_rcs.append(cmd.rc)
+        return cmd_rcs
+
+    def get_log(self):
+        return self.log
+
+    def set_log(self,log):
+        self.log = log
+        return
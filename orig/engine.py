@@ -0,0 +1,226 @@
+"""
+  engine.py - the zTron AsyncEngine class.  The engine runs a pipeline on an
+              asyncio event loop instead of a thread per stage and command.
+              Commands are started with asyncio subprocesses, so one process
+              can keep many shell and gateway commands in flight at once.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import asyncio, os, signal, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cmd import TsoBatch
+from log import LogBuffer
+from stream import DEFAULT_TAIL_LINES, IspinfoFilter
+
+# Default number of commands that can be running at once across the pipeline.
+DEFAULT_MAX_INFLIGHT = 16
+
+class AsyncEngine:
+    def __init__(self,log,cmd_env,max_inflight=None):
+        self.log = log
+        self.cmd_env = cmd_env
+        self.max_inflight = DEFAULT_MAX_INFLIGHT if max_inflight == None else int(max_inflight)
+        self.inflight = None
+        self.loop = None
+        self.task = None
+
+        if self.max_inflight < 1:
+            self.log.log('err','Error - max_inflight must be at least 1, not %d',
+                         (self.max_inflight))
+            raise Exception
+        return
+
+    def cleanup(self):
+        return
+
+    # Run the stages of a scheduler's graph and wait for them to finish.  From
+    # the command line there is no event loop yet, so start one.  In a Jupyter
+    # kernel the loop is already running and can't be blocked on, so run the
+    # pipeline on a loop of its own in another thread.  Notebooks that would
+    # rather not block can await run_async() directly.
+    def run(self,sched):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run_async(sched))
+
+        with ThreadPoolExecutor(max_workers=1,thread_name_prefix='ztron-engine') as pool:
+            return pool.submit(asyncio.run, self.run_async(sched)).result()
+
+    # Stop a running pipeline.  Commands in flight are killed, and stages that
+    # haven't started yet never will.  Safe to call from any thread.
+    def cancel(self):
+        if (self.loop != None) and (self.task != None):
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        return
+
+    async def run_async(self,sched):
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.inflight = asyncio.Semaphore(self.max_inflight)
+        stage_slots = asyncio.Semaphore(sched.workers)
+        done = {num: asyncio.Event() for num in sched.deps}
+
+        async def run_when_ready(stage):
+            for num in sched.deps[stage.num]:
+                await done[num].wait()
+            try:
+                async with stage_slots:
+                    with sched.stage_log(stage):
+                        await self.run_stage(stage)
+            except Exception:
+                self.log.log('err','Error - stage %d (%s) did not complete',
+                             (stage.num,stage.name))
+                if stage.rc == 0:
+                    stage.rc = 1
+            finally:
+                done[stage.num].set()
+
+        try:
+            await asyncio.gather(*[run_when_ready(stage) for stage in sched.stages])
+        except asyncio.CancelledError:
+            self.log.log('err','Pipeline cancelled',None)
+            raise
+        finally:
+            self.task = None
+        return sched.get_rc()
+
+    # Run the units of a stage, at most stage.parallel at a time.  Like the
+    # threaded stage runner, each unit logs to its own buffer, and the buffers
+    # are written out in command order.
+    async def run_stage(self,stage):
+        start_time = stage.start()
+        units = stage.build_units()
+        slots = asyncio.Semaphore(stage.parallel)
+        bufs = []
+        for unit in units:
+            buf = LogBuffer(unit.get_log())
+            unit.set_log(buf)
+            bufs.append(buf)
+
+        async def run_unit(unit):
+            async with slots:
+                start_time = time.time()
+                cmd_rcs = await self.run_unit(unit)
+                stage.log_unit_events(unit, cmd_rcs, start_time)
+                return cmd_rcs
+
+        tasks = [asyncio.ensure_future(run_unit(unit)) for unit in units]
+        cmd_rcs = []
+        try:
+            for task, unit, buf in zip(tasks, units, bufs):
+                try:
+                    cmd_rcs += await task
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    buf.log('err','Error - command did not complete',None)
+                    cmd_rcs += [1] * (len(unit.cmds) if isinstance(unit, TsoBatch) else 1)
+                buf.flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for unit, buf in zip(units, bufs):
+                unit.set_log(buf.target)
+                buf.cleanup()
+
+        stage.finish(cmd_rcs,start_time)
+        return
+
+    # Gateway sessions and batches talk to the gateway through blocking pipes,
+    # so they run on a thread.  Everything else is an asyncio subprocess.
+    async def run_unit(self,unit):
+        async with self.inflight:
+            if isinstance(unit, TsoBatch):
+                return await asyncio.to_thread(unit.run, self.cmd_env)
+            if unit.is_tso() and (unit.gateway != None):
+                return [await asyncio.to_thread(unit.run, self.cmd_env)]
+            with unit.log.tracer.span('cmd', {'cmd': unit.get_cmd()}):
+                return [await self.run_cmd(unit)]
+
+    async def run_cmd(self,cmd):
+        tso = cmd.is_tso()
+        if tso:
+            cmd.log.log('info','[TSO]> %s',cmd.get_cmd().replace('TSO ', ''))
+            args = 'ISPZINT'
+            input = bytes(cmd.get_cmd(), 'utf-8')
+        else:
+            cmd.log.log('info','[Shell]> %s',cmd.get_cmd())
+            args = cmd.get_cmd()
+            input = None
+
+        try:
+            proc = await asyncio.create_subprocess_shell(
+                                args,
+                                stdin=asyncio.subprocess.PIPE if tso else asyncio.subprocess.DEVNULL,
+                                stdout=asyncio.subprocess.PIPE,
+                                stderr=asyncio.subprocess.PIPE,
+                                env=self.cmd_env,
+                                start_new_session=True)
+        except OSError as e:
+            cmd.log.log('err',
+                'OSError: error code = %s, %s',
+                (e.errno, e.strerror))
+            cmd.rc = 1
+            return cmd.rc
+
+        try:
+            if cmd.stream:
+                return await self.stream_output(cmd, proc, input, tso)
+            cmd.out, cmd.err = await proc.communicate(input=input)
+            cmd.rc = proc.returncode
+        except asyncio.CancelledError:
+            # Kill the whole process group, not just the shell, so nothing is
+            # left holding the pipes open.
+            if proc.returncode == None:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            await proc.wait()
+            raise
+        return cmd.log_result(tso)
+
+    # The asyncio version of Cmd.stream_output - log STDOUT a line at a time
+    # and keep only the tails of STDOUT and STDERR.
+    async def stream_output(self,cmd,proc,input,tso):
+        forward = lambda line: cmd.log.log('info','%s',(line))
+        if tso:
+            forward = IspinfoFilter(forward)
+        out_tail = deque(maxlen=DEFAULT_TAIL_LINES)
+        err_tail = deque(maxlen=DEFAULT_TAIL_LINES)
+
+        async def read(pipe,tail,forward=None):
+            while True:
+                raw = await pipe.readline()
+                if len(raw) == 0:
+                    return
+                line = raw.decode(errors='replace').rstrip('\n')
+                tail.append(line)
+                if forward != None:
+                    forward(line)
+
+        if input != None:
+            try:
+                proc.stdin.write(input)
+                await proc.stdin.drain()
+                proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        await asyncio.gather(read(proc.stdout, out_tail, forward),
+                             read(proc.stderr, err_tail))
+        cmd.rc = await proc.wait()
+        cmd.out = bytes('\n'.join(out_tail), 'utf-8')
+        cmd.err = bytes('\n'.join(err_tail), 'utf-8')
+        if cmd.rc != 0:
+            if len(cmd.err) > 0:
+               cmd.log.log('err','%s',cmd.err.decode())
+            cmd.log.log('err','retcode: %d',cmd.rc)
+        return cmd.rc
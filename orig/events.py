@@ -0,0 +1,59 @@
+"""
+  events.py - the zTron EventLog class.  The event log is a structured record
+              of a pipeline run, one JSON object per line, written next to the
+              log files so dashboards can get timings and return codes without
+              scraping text.  Every record has the kind of event, when it was
+              written, and the fields of that kind of event:
+
+        stage   - num, name, start, end, duration, rc, commands
+        command - stage, cmd, kind (tso or shell), start, end, duration, rc
+
+              Times are UTC ISO 8601, and durations are in seconds.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import json, time, threading
+
+def iso_time(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(t)) + '.%03dZ' % (int(t % 1 * 1000))
+
+def timing(start, end):
+    return {'start': iso_time(start), 'end': iso_time(end), 'duration': round(end - start, 6)}
+
+class EventLog:
+    def __init__(self,file_name):
+        self.file_name = file_name
+        self.f = open(file_name, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        return
+
+    def cleanup(self):
+        with self.lock:
+            if self.f != None:
+                self.f.close()
+                self.f = None
+        return
+
+    # Write a record.  Anything that isn't JSON is written as its string.
+    def emit(self,event,fields):
+        record = {'event': event, 'ts': iso_time(time.time())}
+        record.update(fields)
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            if self.f != None:
+                self.f.write(line)
+        return
+
+    def flush(self):
+        with self.lock:
+            if self.f != None:
+                self.f.flush()
+        return
+
+    # Getters
+    def get_file_name(self):
+        return self.file_name
@@ -0,0 +1,280 @@
+"""
+  gateway.py - the zTron GatewaySession and GatewayPool classes.  A gateway
+               session is a long-lived ISPF gateway (ISPZINT) process that TSO
+               commands are sent to over STDIN, one after the other.  The pool
+               keeps a few of them around so that the cost of starting the
+               gateway and the TSO address space is paid once per session
+               instead of once per command.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, re, time, queue, signal, threading, subprocess
+from collections import deque
+
+ISPINFO_START = '<ISPINFO>'
+ISPINFO_END = '</ISPINFO>'
+ISPINFO_RC = re.compile(r'<RC>\s*(-?\d+)\s*</RC>')
+
+# Recycle a session after this many commands or this many seconds, whichever
+# comes first, so a long pipeline doesn't ride on one TSO address space forever.
+DEFAULT_MAX_USES = 100
+DEFAULT_MAX_AGE = 15*60
+
+# Give up on a request after this many seconds without the gateway finishing
+# its reply.  The hung gateway is killed, and the pool starts a new one.
+DEFAULT_TIMEOUT = 10*60
+
+# Lines of gateway STDERR kept for error reporting.
+STDERR_LINES = 50
+
+
+# Pull the <ISPINFO/> blocks out of the gateway output, skipping over all of
+# the other text the gateway writes to STDOUT.
+def find_ispinfo(stdout):
+    blocks = []
+    i_start = stdout.find(ISPINFO_START)
+    while i_start >= 0:
+        i_end = stdout.find(ISPINFO_END, i_start)
+        if i_end < 0:
+            break
+        i_end += len(ISPINFO_END)
+        blocks.append(stdout[i_start:i_end])
+        i_start = stdout.find(ISPINFO_START, i_end)
+    return blocks
+
+# The return code of a TSO command, if the gateway reported one in the block.
+def ispinfo_rc(block):
+    m = ISPINFO_RC.search(block)
+    return 0 if m == None else int(m.group(1))
+
+
+class GatewaySession:
+    def __init__(self,log,cmd_env,gateway_cmd='ISPZINT',
+                 max_uses=DEFAULT_MAX_USES,max_age=DEFAULT_MAX_AGE,
+                 timeout=DEFAULT_TIMEOUT):
+        self.log = log
+        self.cmd_env = cmd_env
+        self.gateway_cmd = gateway_cmd
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.timeout = timeout
+        self.proc = None
+        self.uses = 0
+        self.start_time = None
+        self.err_lines = deque(maxlen=STDERR_LINES)
+        self.err_thread = None
+        self.out_lines = None
+        self.out_thread = None
+
+        self.start()
+        return
+
+    def start(self):
+        self.log.log('trace','   starting gateway session: %s',(self.gateway_cmd))
+        self.proc = subprocess.Popen(args=self.gateway_cmd,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     env=self.cmd_env,
+                                     shell=True,
+                                     start_new_session=True)
+        self.uses = 0
+        self.start_time = time.time()
+
+        # Keep STDERR drained so the gateway never blocks on a full pipe.
+        self.err_thread = threading.Thread(target=self.drain_err,
+                                           name='ztron-gateway-err',
+                                           daemon=True)
+        self.err_thread.start()
+
+        # STDOUT is read on a thread too, so that send() can stop waiting on a
+        # gateway that never answers.  An empty line means the gateway is gone.
+        self.out_lines = queue.Queue()
+        self.out_thread = threading.Thread(target=self.drain_out,
+                                           args=(self.proc, self.out_lines),
+                                           name='ztron-gateway-out',
+                                           daemon=True)
+        self.out_thread.start()
+        return
+
+    def drain_err(self):
+        for line in self.proc.stderr:
+            self.err_lines.append(line.decode(errors='replace').rstrip('\n'))
+        return
+
+    def drain_out(self,proc,out_lines):
+        try:
+            for line in proc.stdout:
+                out_lines.put(line)
+        except (OSError, ValueError):
+            pass
+        out_lines.put(b'')
+        return
+
+    def cleanup(self):
+        if self.proc == None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except:
+            self.kill()
+            self.proc.wait()
+        self.err_thread.join(timeout=1)
+        self.out_thread.join(timeout=1)
+        self.proc.stdout.close()
+        self.proc = None
+        return
+
+    # The gateway runs under a shell, so stop the whole process group, or the
+    # gateway itself lives on and holds its pipes open.
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            self.proc.kill()
+        return
+
+    # A session can take another command if the gateway is still running and
+    # it hasn't been used too long.
+    def is_healthy(self):
+        if (self.proc == None) or (self.proc.poll() != None):
+            return False
+        if self.uses >= self.max_uses:
+            return False
+        if time.time() - self.start_time >= self.max_age:
+            return False
+        return True
+
+    # Send 1 request to the gateway and collect STDOUT up to the end of the
+    # expected number of <ISPINFO/> blocks.  If the gateway goes away first, the
+    # session is finished and the rc is the gateway's exit code.  If it doesn't
+    # finish within the timeout, it's killed, and the session is finished too.
+    def send(self,request,n_blocks=1):
+        self.uses += 1
+        out_lines = []
+        seen = 0
+        timed_out = False
+        deadline = time.time() + self.timeout
+        try:
+            self.proc.stdin.write(bytes(request.rstrip('\n') + '\n', 'utf-8'))
+            self.proc.stdin.flush()
+
+            while seen < n_blocks:
+                try:
+                    line = self.out_lines.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    timed_out = True
+                    break
+                if len(line) == 0:
+                    break
+                out_lines.append(line)
+                seen += line.count(bytes(ISPINFO_END, 'utf-8'))
+        except OSError:
+            pass
+
+        out = b''.join(out_lines)
+        if seen < n_blocks:
+            if timed_out:
+                self.log.log('warn','Warning - gateway session timed out after %d seconds, stopping it',
+                             (self.timeout))
+                self.err_lines.append('ztron: gateway timed out after %d seconds' % (self.timeout))
+                self.kill()
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            rc = self.proc.wait()
+            self.err_thread.join(timeout=1)
+            self.out_thread.join(timeout=1)
+            self.proc.stdout.close()
+            self.proc = None
+            return (rc if rc > 0 else 1), out, self.get_err()
+        return 0, out, b''
+
+    def get_err(self):
+        return bytes('\n'.join(self.err_lines), 'utf-8')
+
+
+class GatewayPool:
+    def __init__(self,log,cmd_env,size,gateway_cmd='ISPZINT',
+                 max_uses=DEFAULT_MAX_USES,max_age=DEFAULT_MAX_AGE,
+                 timeout=DEFAULT_TIMEOUT):
+        self.log = log
+        self.cmd_env = cmd_env
+        self.size = int(size)
+        self.gateway_cmd = gateway_cmd
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.sessions = []
+
+        if self.size < 1:
+            self.log.log('err','Error - gateway sessions must be at least 1, not %d',(self.size))
+            raise Exception
+        return
+
+    # Sessions are started the first time they're needed, and stopped at the
+    # end of the pipeline.
+    def cleanup(self):
+        with self.lock:
+            for session in self.sessions:
+                session.cleanup()
+            self.sessions = []
+        while not self.idle.empty():
+            self.idle.get_nowait()
+        return
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    session = self.idle.get_nowait()
+                except queue.Empty:
+                    session = None
+                if session == None:
+                    session = GatewaySession(self.log, self.cmd_env, self.gateway_cmd,
+                                             self.max_uses, self.max_age, self.timeout)
+                    with self.lock:
+                        self.sessions.append(session)
+                    return session
+                if session.is_healthy():
+                    return session
+                self.log.log('trace','   recycling gateway session after %d uses',
+                             (session.uses))
+                self.discard(session)
+        except:
+            self.slots.release()
+            raise
+
+    def release(self,session):
+        if session.proc != None:
+            self.idle.put(session)
+        else:
+            self.discard(session)
+        self.slots.release()
+        return
+
+    def discard(self,session):
+        session.cleanup()
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+        return
+
+    # Run a request on whichever session is free, and return (rc, out, err).
+    def run(self,request,n_blocks=1):
+        with self.log.tracer.span('gateway call', {'commands': n_blocks}):
+            session = self.acquire()
+            try:
+                return session.send(request, n_blocks)
+            finally:
+                self.release(session)
@@ -8,9 +8,12 @@
 
   SPDX-License-Identifier: Apache-2.0
 """
-import subprocess, time, os, sys
+import subprocess, time, os, sys, threading
 
-from log_file import LogFile
+from events import EventLog
+from metrics import Metrics
+from tracer import Tracer
+from log_file import LogFile, FLUSH_LINE, DEFAULT_FLUSH_RECORDS, DEFAULT_FLUSH_INTERVAL
 
 class Log:
     def __init__(self, log_name, log_path, log_level):
@@ -21,6 +24,10 @@ class Log:
         self.main_log_file_name = ''
         self.log_level = log_level
         self.f_staged = False
+        self.events = None
+        self.metrics = Metrics()
+        self.tracer = Tracer()
+        self.flush_policy = (FLUSH_LINE, DEFAULT_FLUSH_RECORDS, DEFAULT_FLUSH_INTERVAL)
 
         # Work with the absolute path to the log directory.
         try:
@@ -58,20 +65,36 @@ class Log:
             #     print('---- open failed for %s/%s' % (self.full_path, self.pipeline_log_name))
             #     raise Exception
             self.main_log_file = LogFile('main', self.abs_log_path, self.log_level)
+
+            # Structured records of each stage and command, for dashboards.
+            self.events = EventLog(self.abs_log_path + '/events.jsonl')
         return
 
     # Close the current log file, and open a new one to log the next stage in the
     # pipeline.
-    def new_log_file(file_prefix):
+    def new_log_file(self, file_prefix):
         if self.stage_log_file != None:
             self.stage_log_file.cleanup()
-        self.stage_log_file = LogFile(file_prefix, self.abs_log_path, self.log_level)
+        self.stage_log_file = LogFile(file_prefix, self.abs_log_path, self.log_level,
+                                      *self.flush_policy)
+
+    # A stage is done, so write out everything it logged, whatever the flush
+    # policy.
+    def stage_end(self):
+        for log_file in (self.main_log_file, self.stage_log_file):
+            if log_file != None:
+                log_file.flush()
+        if self.events != None:
+            self.events.flush()
+        return
 
     def cleanup(self):
         if self.main_log_file != None:
             self.main_log_file.cleanup()
         if self.stage_log_file != None:
             self.stage_log_file.cleanup()
+        if self.events != None:
+            self.events.cleanup()
         return
 
     # Log to the appropriate file - the main log file if this is a single-stage
@@ -83,11 +106,25 @@ class Log:
             self.main_log_file.log(level, fmt, args)
         return
 
+    # Write a record to the event log.
+    def event(self, event, fields):
+        if self.events != None:
+            self.events.emit(event, fields)
+        return
+
     # Getters
     def get_full_path(self):
         return self.abs_log_path
 
     # Setters
+    def set_flush_policy(self, flush_policy, flush_records=DEFAULT_FLUSH_RECORDS,
+                         flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.flush_policy = (flush_policy, flush_records, flush_interval)
+        for log_file in (self.main_log_file, self.stage_log_file):
+            if log_file != None:
+                log_file.set_flush_policy(*self.flush_policy)
+        return
+
     def set_staged_log(self):
         self.f_staged_log = True
         return
@@ -97,3 +134,43 @@ class Log:
         print('-- Log (%s) -------------------------' % self.pipeline_log_name)
         print('     full log path: %s' % (self.full_path))
         print('     log level: %s' % (self.level))
+
+
+# Buffers write to their log one at a time, so what each one holds stays together.
+_flush_lock = threading.Lock()
+
+# Hold the records logged while a command or a stage runs, so that commands and
+# stages running at the same time can have their output written to the real log
+# one after the other - commands in the order they appear in the stage, and
+# stages as they finish.  Everything besides log records, like events and
+# metrics, goes straight to the real log.
+class LogBuffer:
+    def __init__(self, log):
+        self.target = log
+        self.tracer = log.tracer
+        self.records = []
+        return
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def log(self, level, fmt, args):
+        self.records.append((level, fmt, args))
+        return
+
+    def flush(self):
+        with _flush_lock:
+            for level, fmt, args in self.records:
+                self.target.log(level, fmt, args)
+            self.records = []
+        return
+
+    # The stage is done, so its records go out before the log is flushed.
+    def stage_end(self):
+        self.flush()
+        self.target.stage_end()
+        return
+
+    def cleanup(self):
+        self.flush()
+        return
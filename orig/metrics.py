@@ -0,0 +1,100 @@
+"""
+  metrics.py - the zTron Metrics class.  Counters, gauges and latency histograms
+               for a pipeline run, written at the end of the run in the
+               Prometheus text format, for the node exporter's textfile
+               collector:
+
+        ztron_pipeline_duration_seconds          - gauge
+        ztron_stage_duration_seconds{stage}      - histogram
+        ztron_command_duration_seconds{kind}     - histogram, tso or shell
+        ztron_commands_total{kind,rc}            - counter
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, threading
+
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key in sorted(labels):
+        value = str(labels[key]).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append('%s="%s"' % (key, value))
+    return '{' + ','.join(pairs) + '}'
+
+class Metrics:
+    def __init__(self):
+        # name -> [kind, help, {label tuple: value}]
+        self.metrics = {}
+        self.lock = threading.Lock()
+        return
+
+    def declare(self, name, kind, help):
+        if name not in self.metrics:
+            self.metrics[name] = [kind, help, {}]
+        return self.metrics[name][2]
+
+    def inc(self, name, help, labels=None, amount=1):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            values = self.declare(name, 'counter', help)
+            values[key] = values.get(key, 0) + amount
+        return
+
+    def set(self, name, help, value, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            self.declare(name, 'gauge', help)[key] = value
+        return
+
+    # Histogram values are the bucket counts, the sum and the count.
+    def observe(self, name, help, value, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            values = self.declare(name, 'histogram', help)
+            counts, total, n = values.get(key, ([0] * len(BUCKETS), 0.0, 0))
+            for i in range(len(BUCKETS)):
+                if value <= BUCKETS[i]:
+                    counts[i] += 1
+            values[key] = (counts, total + value, n + 1)
+        return
+
+    def to_text(self, labels=None):
+        lines = []
+        with self.lock:
+            for name in sorted(self.metrics):
+                kind, help, values = self.metrics[name]
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for key in sorted(values):
+                    sample_labels = dict(labels or {})
+                    sample_labels.update(key)
+                    if kind != 'histogram':
+                        lines.append('%s%s %s' % (name, format_labels(sample_labels), values[key]))
+                        continue
+                    counts, total, n = values[key]
+                    for bound, count in zip(BUCKETS, counts):
+                        le = dict(sample_labels, le=repr(float(bound)))
+                        lines.append('%s_bucket%s %d' % (name, format_labels(le), count))
+                    lines.append('%s_bucket%s %d' % (name, format_labels(dict(sample_labels, le='+Inf')), n))
+                    lines.append('%s_sum%s %r' % (name, format_labels(sample_labels), total))
+                    lines.append('%s_count%s %d' % (name, format_labels(sample_labels), n))
+        return '\n'.join(lines) + '\n'
+
+    # Write the metrics under a temporary name and rename the file into place,
+    # since the textfile collector can read it at any time.
+    def export(self, file_name, labels=None):
+        dir_name = os.path.dirname(file_name)
+        if dir_name != '':
+            os.makedirs(dir_name, exist_ok=True)
+        temp_name = '%s.%d.tmp' % (file_name, os.getpid())
+        with open(temp_name, 'w', encoding='utf-8') as f:
+            f.write(self.to_text(labels))
+        os.replace(temp_name, file_name)
+        return
@@ -13,6 +13,10 @@ from IPython.core.getipython import get_ipython
 
 from stage import Stage
 from cmd import Cmd
+from scheduler import Scheduler
+from gateway import GatewayPool, DEFAULT_TIMEOUT
+from engine import AsyncEngine
+from log_file import DEFAULT_FLUSH_RECORDS, DEFAULT_FLUSH_INTERVAL
 
 class Pipeline:
     def __init__(self,log,arg_pipeline,env):
@@ -22,11 +26,22 @@ class Pipeline:
         self.env = env
         self.file_name = arg_pipeline
         self.desc_name = ''
+        self.workers = None
+        self.gateway = None
+        self.gateway_sessions = 0
+        self.gateway_cmd = 'ISPZINT'
+        self.gateway_timeout = DEFAULT_TIMEOUT
+        self.engine = 'threads'
+        self.max_inflight = None
+        self.metrics_file = None
 
         self.read()
         return
 
     def cleanup(self):
+        if self.gateway != None:
+            self.gateway.cleanup()
+            self.gateway = None
         return
 
     # File operations
@@ -38,12 +53,53 @@ class Pipeline:
 
     def build_pipeline(self):
         self.log.log('trace','--- building pipeline',None)
+        stgs = None
+        log_flush = None
+        log_flush_records = DEFAULT_FLUSH_RECORDS
+        log_flush_interval = DEFAULT_FLUSH_INTERVAL
         for k in self.pln:
             self.log.log('trace','   --- pipe [%s] %s',(k,self.pln[k]))
             if k.upper() == 'NAME':
                 self.desc_name = self.pln[k]
+            elif k.upper() == 'WORKERS':
+                self.workers = self.pln[k]
+            elif k.upper() == 'GATEWAY_SESSIONS':
+                self.gateway_sessions = int(self.pln[k])
+            elif k.upper() == 'GATEWAY_CMD':
+                self.gateway_cmd = self.pln[k]
+            elif k.upper() == 'GATEWAY_TIMEOUT':
+                self.gateway_timeout = float(self.pln[k])
+            elif k.upper() == 'ENGINE':
+                self.engine = str(self.pln[k]).lower()
+                if self.engine not in ('threads', 'async'):
+                    self.log.log('err','Error - engine must be threads or async, not %s',
+                                 (self.engine))
+                    raise Exception
+            elif k.upper() == 'MAX_INFLIGHT':
+                self.max_inflight = self.pln[k]
+            elif k.upper() == 'LOG_FLUSH':
+                log_flush = str(self.pln[k]).lower()
+            elif k.upper() == 'LOG_FLUSH_RECORDS':
+                log_flush_records = int(self.pln[k])
+            elif k.upper() == 'LOG_FLUSH_INTERVAL':
+                log_flush_interval = float(self.pln[k])
+            elif k.upper() == 'METRICS_TEXTFILE':
+                self.metrics_file = str(self.pln[k])
             elif k.upper() == 'STAGES':
-                self.build_stages(self.pln[k])
+                stgs = self.pln[k]
+
+        # Flushing the log after every line is slow on USS terminals and over
+        # SSH, so a pipeline can ask for the log to be flushed less often.
+        if log_flush != None:
+            self.log.set_flush_policy(log_flush,log_flush_records,log_flush_interval)
+
+        # TSO commands share a pool of long-lived gateway sessions if the
+        # pipeline asks for one.  Otherwise each one starts its own gateway.
+        if self.gateway_sessions > 0:
+            self.gateway = GatewayPool(self.log,self.env,self.gateway_sessions,
+                                       self.gateway_cmd,timeout=self.gateway_timeout)
+        if stgs != None:
+            self.build_stages(stgs)
         return
 
     def build_stages(self, stgs):
@@ -54,7 +110,7 @@ class Pipeline:
             self.log.log('trace','   --- stg_dict %s',(stg_dict))
             # Make sure we handle case of the key, whatever it is ...
             k = list(stg_dict)[0]
-            stg = Stage(self.log,stg_dict[k],stg_num)
+            stg = Stage(self.log,stg_dict[k],stg_num,self.gateway)
             stg_num += 1
             self.stages.append(stg)
 
@@ -90,11 +146,64 @@ class Pipeline:
     def run(self):
         self.log.log('info','Running pipeline %s',(self.desc_name))
         start_time = time.time()
-        for stage in self.stages:
-            stage.run(self.env)
+
+        # Stages run as soon as the stages they depend on are done, so the
+        # pipeline takes as long as its longest chain of dependent stages.
+        sched = Scheduler(self.log,self.stages,self.workers)
+        if self.engine == 'async':
+            engine = AsyncEngine(self.log,self.env,self.max_inflight)
+            engine.run(sched)
+            engine.cleanup()
+        else:
+            sched.run(self.env)
+        sched.cleanup()
         elapsed_time = time.strftime("%H:%M:%S", time.gmtime(time.time()-start_time))
         self.log.log('info','--- %s complete (%s pipeline run time)',
                      (self.desc_name,elapsed_time))
+        self.export_metrics(start_time)
+        self.write_trace(start_time)
+
+    # Run the pipeline on the event loop that is already running, for callers
+    # like a Jupyter kernel that can await it.
+    async def run_async(self):
+        self.log.log('info','Running pipeline %s',(self.desc_name))
+        start_time = time.time()
+        sched = Scheduler(self.log,self.stages,self.workers)
+        engine = AsyncEngine(self.log,self.env,self.max_inflight)
+        await engine.run_async(sched)
+        engine.cleanup()
+        sched.cleanup()
+        elapsed_time = time.strftime("%H:%M:%S", time.gmtime(time.time()-start_time))
+        self.log.log('info','--- %s complete (%s pipeline run time)',
+                     (self.desc_name,elapsed_time))
+        self.export_metrics(start_time)
+        self.write_trace(start_time)
+
+    # Write the metrics of the run for the node exporter's textfile collector,
+    # to Metrics_textfile if the pipeline names one, or to the log directory.
+    def export_metrics(self,start_time):
+        self.log.metrics.set('ztron_pipeline_duration_seconds', 'Time to run the pipeline',
+                             time.time() - start_time)
+        file_name = self.metrics_file
+        if file_name == None:
+            file_name = self.log.get_full_path() + '/metrics.prom'
+        try:
+            self.log.metrics.export(file_name, {'pipeline': self.desc_name})
+        except OSError as e:
+            self.log.log('warn','Warning - failed to write metrics to %s: %s',
+                         (file_name,e.strerror))
+        return
+
+    # Write the spans of the run to trace.json in the log directory.
+    def write_trace(self,start_time):
+        self.log.tracer.complete('pipeline', start_time, time.time(), {'name': self.desc_name})
+        file_name = self.log.get_full_path() + '/trace.json'
+        try:
+            self.log.tracer.write(file_name)
+        except OSError as e:
+            self.log.log('warn','Warning - failed to write the trace to %s: %s',
+                         (file_name,e.strerror))
+        return
 
     # Getters
     def get_desc_name(self):
@@ -107,6 +216,13 @@ class Pipeline:
     def show(self):
         self.log.log('info','-- Pipeline (%s) -------------------------',(self.desc_name))
         self.log.log('info','     file name: %s',(self.file_name))
+        if self.workers != None:
+            self.log.log('info','     workers: %s',(self.workers))
+        if self.engine != 'threads':
+            self.log.log('info','     engine: %s',(self.engine))
+        if self.gateway != None:
+            self.log.log('info','     gateway sessions: %d (%s)',
+                         (self.gateway_sessions,self.gateway_cmd))
         for stage in self.stages:
             stage.show()
 
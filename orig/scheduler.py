@@ -0,0 +1,153 @@
+"""
+  scheduler.py - the zTron Scheduler class.  The scheduler runs the stages of a
+                 pipeline as a dependency graph, so that stages that don't depend
+                 on each other can run at the same time.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+
+from log import LogBuffer
+
+# Default number of stages that can be in flight at once.
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+class Scheduler:
+    def __init__(self,log,stages,workers=None):
+        self.log = log
+        self.stages = stages
+        self.workers = DEFAULT_WORKERS if workers == None else int(workers)
+        self.deps = {}
+
+        if self.workers < 1:
+            self.log.log('err','Error - workers must be at least 1, not %d',(self.workers))
+            raise Exception
+
+        self.build_graph()
+        return
+
+    def cleanup(self):
+        return
+
+    # Resolve the depends_on list of each stage into the stage numbers it is
+    # waiting on.  Stages can be referenced by name or by number.  A stage that
+    # doesn't say what it depends on waits for the stage ahead of it, so that
+    # pipelines written before depends_on existed still run in order.
+    def build_graph(self):
+        by_name = {}
+        by_num = {}
+        for stage in self.stages:
+            by_num[stage.num] = stage
+            if stage.name != None:
+                by_name[str(stage.name).casefold()] = stage
+
+        prev = None
+        for stage in self.stages:
+            if stage.depends_on == None:
+                self.deps[stage.num] = set() if prev == None else {prev.num}
+            else:
+                self.deps[stage.num] = set()
+                for ref in stage.depends_on:
+                    if isinstance(ref, int) and ref in by_num:
+                        dep = by_num[ref]
+                    elif str(ref).casefold() in by_name:
+                        dep = by_name[str(ref).casefold()]
+                    else:
+                        self.log.log('err','Error - stage %d (%s) depends on unknown stage: %s',
+                                     (stage.num,stage.name,ref))
+                        raise Exception
+                    if dep is stage:
+                        self.log.log('err','Error - stage %d (%s) depends on itself',
+                                     (stage.num,stage.name))
+                        raise Exception
+                    self.deps[stage.num].add(dep.num)
+            prev = stage
+
+        self.check_cycles()
+        return
+
+    # Walk the graph once without running anything, so a bad pipeline fails
+    # before any command is started.
+    def check_cycles(self):
+        pending = {num: set(deps) for num, deps in self.deps.items()}
+        while pending:
+            ready = [num for num, deps in pending.items() if len(deps) == 0]
+            if len(ready) == 0:
+                self.log.log('err','Error - circular depends_on between stages: %s',
+                             (sorted(pending)))
+                raise Exception
+            for num in ready:
+                del pending[num]
+            for deps in pending.values():
+                deps.difference_update(ready)
+        return
+
+    # Run every stage whose dependencies have completed, keeping at most
+    # self.workers stages in flight.  A failing stage doesn't stop the stages
+    # that depend on it, the same as a failing stage in a serial pipeline.
+    def run(self,cmd_env):
+        self.log.log('trace','--- scheduling %d stages on %d workers',
+                     (len(self.stages),self.workers))
+        start_time = time.time()
+        stages = {stage.num: stage for stage in self.stages}
+        pending = {num: set(deps) for num, deps in self.deps.items()}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='ztron-stage') as pool:
+            while pending or running:
+                for num in sorted(pending):
+                    if len(pending[num]) == 0:
+                        del pending[num]
+                        running[pool.submit(self.run_stage, stages[num], cmd_env)] = num
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    num = running.pop(future)
+                    try:
+                        future.result()
+                    except:
+                        self.log.log('err','Error - stage %d (%s) did not complete',
+                                     (num,stages[num].name))
+                        if stages[num].rc == 0:
+                            stages[num].rc = 1
+                    for deps in pending.values():
+                        deps.discard(num)
+
+        elapsed_time = time.strftime("%H:%M:%S",time.gmtime(time.time()-start_time))
+        self.log.log('trace','--- all stages complete (%s)',(elapsed_time))
+        return self.get_rc()
+
+    def run_stage(self,stage,cmd_env):
+        with self.stage_log(stage):
+            stage.run(cmd_env)
+        return
+
+    # When stages can run at the same time, each one logs to a buffer that is
+    # written to the log when the stage finishes, so the log reads stage by
+    # stage instead of with the lines of several stages mixed together.
+    @contextmanager
+    def stage_log(self,stage):
+        if self.workers == 1:
+            yield
+            return
+        buf = LogBuffer(stage.log)
+        stage.set_log(buf)
+        try:
+            yield
+        finally:
+            stage.set_log(buf.target)
+            buf.cleanup()
+
+    # Return code for the pipeline is the first non-zero stage return code.
+    def get_rc(self):
+        for stage in self.stages:
+            if stage.rc != 0:
+                return stage.rc
+        return 0
@@ -9,15 +9,23 @@
   SPDX-License-Identifier: Apache-2.0
 """
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from cmd import Cmd
+from cmd import Cmd, TsoBatch
+from events import timing
+from log import LogBuffer
 
 class Stage:
-    def __init__(self,log,stg,num):
+    def __init__(self,log,stg,num,gateway=None):
         self.log = log
+        self.gateway = gateway
         self.name = None
         self.num = num
         self.cmds = []
+        self.depends_on = None
+        self.parallel = 1
+        self.batch = 1
+        self.stream = False
         self.rc = 0
 
         self.build_stage(stg)
@@ -31,20 +39,120 @@ class Stage:
             self.log.log('trace','   build_stage, item: %s',(item))
             for k in item:
                 if k.casefold() == 'cmd':
-                    cmd = Cmd(self.log,item[k])
+                    cmd = Cmd(self.log,item[k],self.gateway)
                     self.cmds.append(cmd)
                 elif k.casefold() == 'name':
                     self.name = item[k]
+                elif k.casefold() == 'depends_on':
+                    # A single stage can be given without the list brackets.
+                    # An empty list means the stage can start right away.
+                    if item[k] == None:
+                        self.depends_on = []
+                    elif isinstance(item[k], list):
+                        self.depends_on = item[k]
+                    else:
+                        self.depends_on = [item[k]]
+                elif k.casefold() == 'parallel':
+                    self.parallel = int(item[k])
+                    if self.parallel < 1:
+                        self.log.log('err','Error - parallel must be at least 1, not %d',
+                                     (self.parallel))
+                        raise Exception
+                elif k.casefold() == 'batch':
+                    self.batch = int(item[k])
+                    if self.batch < 1:
+                        self.log.log('err','Error - batch must be at least 1, not %d',
+                                     (self.batch))
+                        raise Exception
+                elif k.casefold() == 'stream':
+                    self.stream = bool(item[k])
+
+        # Streaming keeps a command's output out of memory, but parallel
+        # commands hold their output until it's their turn to be logged, so
+        # the two don't go together.
+        if self.stream and (self.parallel > 1):
+            self.log.log('err','Error - stage %s can\'t both stream and run commands in parallel',
+                         (self.name))
+            raise Exception
+
+        # Stage options can come after the commands they apply to.
+        for cmd in self.cmds:
+            cmd.set_stream(self.stream)
+        return
+
+    # Group the commands into the units of work that get run.  Each command is
+    # its own unit, except that with batch > 1, up to that many adjacent TSO
+    # commands share one trip through the ISPF gateway.
+    def build_units(self):
+        units = []
+        tso_cmds = []
+        for cmd in self.cmds + [None]:
+            if (cmd != None) and (self.batch > 1) and cmd.is_tso():
+                tso_cmds.append(cmd)
+                if len(tso_cmds) < self.batch:
+                    continue
+            if len(tso_cmds) == 1:
+                units.append(tso_cmds[0])
+            elif len(tso_cmds) > 1:
+                units.append(TsoBatch(self.log,tso_cmds,self.gateway))
+            tso_cmds = []
+            if (cmd != None) and ((self.batch == 1) or not cmd.is_tso()):
+                units.append(cmd)
+        return units
+
+    # Run a unit of work, and return the return codes of its commands.
+    def run_unit(self,unit,cmd_env):
+        start_time = time.time()
+        if isinstance(unit, TsoBatch):
+            cmd_rcs = unit.run(cmd_env)
+        else:
+            cmd_rcs = [unit.run(cmd_env)]
+        self.log_unit_events(unit,cmd_rcs,start_time)
+        return cmd_rcs
+
+    # Write a command record to the event log for each command of a unit.
+    # The commands of a batch share the batch's times.
+    def log_unit_events(self,unit,cmd_rcs,start_time):
+        end_time = time.time()
+        cmds = unit.cmds if isinstance(unit, TsoBatch) else [unit]
+        for cmd, cmd_rc in zip(cmds, cmd_rcs):
+            fields = {'stage': self.name,
+                      'stage_num': self.num,
+                      'cmd': cmd.get_cmd(),
+                      'kind': 'tso' if cmd.is_tso() else 'shell',
+                      'batch': len(cmds),
+                      'rc': cmd_rc}
+            fields.update(timing(start_time, end_time))
+            self.log.event('command', fields)
+            self.log.metrics.observe('ztron_command_duration_seconds',
+                                     'Time to run a command, or the batch it ran in',
+                                     end_time - start_time, {'kind': fields['kind']})
+            self.log.metrics.inc('ztron_commands_total', 'Commands run, by kind and rc',
+                                 {'kind': fields['kind'], 'rc': cmd_rc})
         return
 
     def run(self,cmd_env):
+        start_time = self.start()
+
+        units = self.build_units()
+        if (self.parallel > 1) and (len(units) > 1):
+            cmd_rcs = self.run_parallel(units,cmd_env)
+        else:
+            cmd_rcs = []
+            for unit in units:
+                cmd_rcs += self.run_unit(unit,cmd_env)
+
+        self.finish(cmd_rcs,start_time)
+        return
+
+    def start(self):
         self.log.log('info','--- %s ---------------------------',(self.name))
-        start_time = time.time()
+        return time.time()
 
-        for cmd in self.cmds:
-            # Return code for the stage is the first non-zero return code from a
-            # command in the stage.
-            cmd_rc = cmd.run(cmd_env)
+    def finish(self,cmd_rcs,start_time):
+        # Return code for the stage is the first non-zero return code from a
+        # command in the stage.
+        for cmd_rc in cmd_rcs:
             if (self.rc == 0) and (cmd_rc != 0):
                 self.rc = cmd_rc
         elapsed_time = time.strftime("%H:%M:%S",time.gmtime(time.time()-start_time))
@@ -53,10 +161,62 @@ class Stage:
             self.log.log('err','    Non-zero return code for this stage: %d',self.rc)
         self.log.log('info','--- %s complete (%s stage run time)\n\n',(self.name,elapsed_time))
 
+        end_time = time.time()
+        fields = {'num': self.num, 'name': self.name, 'rc': self.rc, 'commands': len(cmd_rcs)}
+        fields.update(timing(start_time, end_time))
+        self.log.event('stage', fields)
+        self.log.metrics.observe('ztron_stage_duration_seconds', 'Time to run a stage',
+                                 end_time - start_time, {'stage': self.name})
+        self.log.tracer.complete('stage', start_time, end_time,
+                                 {'num': self.num, 'name': self.name, 'rc': self.rc})
+        self.log.stage_end()
+        return
+
+    # Run the units of the stage on a pool of self.parallel workers.  Each
+    # unit logs to its own buffer, and the buffers are written to the stage
+    # log in command order, so the log reads the same as a serial run.
+    def run_parallel(self,units,cmd_env):
+        self.log.log('trace','   running %d commands as %d units, %d at a time',
+                     (len(self.cmds),len(units),self.parallel))
+        bufs = []
+        for unit in units:
+            buf = LogBuffer(unit.get_log())
+            unit.set_log(buf)
+            bufs.append(buf)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallel,
+                                    thread_name_prefix='ztron-cmd') as pool:
+                futures = [pool.submit(self.run_unit, unit, cmd_env) for unit in units]
+                cmd_rcs = []
+                for future, unit, buf in zip(futures, units, bufs):
+                    try:
+                        cmd_rcs += future.result()
+                    except:
+                        buf.log('err','Error - command did not complete',None)
+                        cmd_rcs += [1] * (len(unit.cmds) if isinstance(unit, TsoBatch) else 1)
+                    buf.flush()
+        finally:
+            for unit, buf in zip(units, bufs):
+                unit.set_log(buf.target)
+                buf.cleanup()
+        return cmd_rcs
+
+    # Send the output of the stage and its commands to another log, like a
+    # LogBuffer while stages run side by side.
+    def set_log(self,log):
+        self.log = log
+        for cmd in self.cmds:
+            cmd.set_log(log)
+        return
+
     def add_command(self,cmd):
         self.cmd.append(cmd)
         return
 
+    def get_depends_on(self):
+        return self.depends_on
+
     def get_stage_contents(self,stg_num):
         contents = '# Stage ' + str(stg_num) + ': ' + self.name + '\n'
         for cmd in self.cmds:
@@ -67,6 +227,14 @@ class Stage:
     # Show ourselves
     def show(self):
         self.log.log('info', '     Stage: %s',self.name)
+        if self.depends_on != None:
+            self.log.log('info', '       depends on: %s',(self.depends_on,))
+        if self.parallel > 1:
+            self.log.log('info', '       parallel: %d',(self.parallel))
+        if self.batch > 1:
+            self.log.log('info', '       batch: %d',(self.batch))
+        if self.stream:
+            self.log.log('info', '       stream: on',None)
 
         for cmd in self.cmds:
             cmd.show()
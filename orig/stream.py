@@ -0,0 +1,79 @@
+"""
+  stream.py - the zTron OutputStream class.  An output stream reads the output
+              of a running command a line at a time, hands each line to the log
+              as it arrives, and keeps only the last few lines around for error
+              reporting.  This keeps memory flat no matter how much a command
+              writes.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import threading
+from collections import deque
+
+# Lines of output kept from the end of a command's STDOUT and STDERR.
+DEFAULT_TAIL_LINES = 100
+
+class OutputStream:
+    def __init__(self,pipe,forward=None,tail_lines=DEFAULT_TAIL_LINES):
+        self.pipe = pipe
+        self.forward = forward
+        self.tail = deque(maxlen=tail_lines)
+        self.n_lines = 0
+        self.thread = None
+        return
+
+    def cleanup(self):
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        self.pipe.close()
+        return
+
+    # Read the pipe to the end in the calling thread.
+    def read(self):
+        for raw in self.pipe:
+            line = raw.decode(errors='replace').rstrip('\n')
+            self.n_lines += 1
+            self.tail.append(line)
+            if self.forward != None:
+                self.forward(line)
+        return
+
+    # Read the pipe to the end in a thread of its own, so that STDOUT and STDERR
+    # can both be drained without either one filling up and blocking the command.
+    def start(self):
+        self.thread = threading.Thread(target=self.read,
+                                       name='ztron-stream',
+                                       daemon=True)
+        self.thread.start()
+        return
+
+    def get_tail(self):
+        return bytes('\n'.join(self.tail), 'utf-8')
+
+
+# Pass along only the <ISPINFO/> part of the ISPF gateway output, a line at a
+# time, the same part a TSO command logs when its output is collected at once.
+class IspinfoFilter:
+    def __init__(self,forward):
+        self.forward = forward
+        self.inside = False
+        return
+
+    def __call__(self,line):
+        if not self.inside:
+            i_start = line.find('<ISPINFO>')
+            if i_start < 0:
+                return
+            line = line[i_start:]
+            self.inside = True
+        i_end = line.find('</ISPINFO>')
+        if i_end >= 0:
+            line = line[:i_end+len('</ISPINFO>')]
+            self.inside = False
+        self.forward(line)
+        return
@@ -0,0 +1,85 @@
+"""
+  tracer.py - the zTron Tracer class.  Timing spans of a pipeline run, written to
+              trace.json in the log directory as Chrome trace events, to open
+              in chrome://tracing or https://ui.perfetto.dev:
+
+        pipeline
+          stage
+            cmd / tso batch
+              gateway call
+
+              Each span is on the track of the thread that ran it, or of the
+              asyncio task on the async engine, so the timeline shows how many
+              stages and commands really ran at once.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, json, time, asyncio, threading
+
+class Span:
+    def __init__(self,tracer,name,args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start_time = None
+        return
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type != None:
+            self.args['error'] = '%s: %s' % (exc_type.__name__, exc_value)
+        self.tracer.complete(self.name, self.start_time, time.time(), self.args)
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self.tracks = {}
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        return
+
+    def span(self,name,args=None):
+        return Span(self, name, dict(args or {}))
+
+    # The track of a span is its asyncio task if there is one, or its thread.
+    def track(self):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task != None:
+            return ('task', id(task)), task.get_name()
+        thread = threading.current_thread()
+        return ('thread', threading.get_native_id()), thread.name
+
+    # Add a span that has already ended.  Times are time.time() values.
+    def complete(self,name,start_time,end_time,args=None):
+        key, track_name = self.track()
+        with self.lock:
+            if key not in self.tracks:
+                self.tracks[key] = (len(self.tracks) + 1, track_name)
+            event = {'name': name, 'cat': 'ztron', 'ph': 'X',
+                     'ts': round(start_time * 1e6), 'dur': round((end_time - start_time) * 1e6),
+                     'pid': self.pid, 'tid': self.tracks[key][0]}
+            if args:
+                event['args'] = args
+            self.events.append(event)
+        return
+
+    def write(self,file_name):
+        with self.lock:
+            events = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                       'args': {'name': track_name}}
+                      for tid, track_name in self.tracks.values()]
+            events += sorted(self.events, key=lambda event: event['ts'])
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        return
@@ -60,6 +60,10 @@ class Mcp:
     def run_pipeline(self):
         self.pipeline.run()
 
+    # From a notebook cell: await mcp.run_pipeline_async()
+    async def run_pipeline_async(self):
+        await self.pipeline.run_async()
+
     def getenv(self,env_var):
         try:
             return os.environ[env_var]
@@ -1,6 +1,17 @@
 __all__ = [
+    'batch',
+    'bench',
+    'daemon',
+    'descriptor',
+    'events',
     'job',                # primary ztron job object
+    'ledger',
     'log',
+    'log_archive',
+    'log_queue',
+    'metrics',
+    'reap',
     'run',
+    'trace',
     'util'
 ]
\ No newline at end of file
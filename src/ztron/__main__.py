@@ -1,5 +1,5 @@
 import sys
-from ztron.run import run_job
+from ztron.run import main
 
 if __name__ == '__main__':
-    sys.exit(run_job(len(sys.argv), sys.argv))
+    sys.exit(main())
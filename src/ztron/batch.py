@@ -0,0 +1,142 @@
+"""
+  batch.py - run many jobs in one ztron process.
+
+    Starting a process for every job pays for interpreter startup, imports and
+    ZOAU initialization every time, which adds up quickly across hundreds of
+    small jobs.  A batch loads the job descriptors from a directory or a glob,
+    and runs them on a pool of worker threads in this one process.  Each job
+    keeps its own log, spool and temporary resources, just as it would when
+    run on its own.  When the batch is done, a summary of every job is printed,
+    and the exit status is the highest rc of any job.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, sys, glob, time, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs run at once when no worker count is given.
+DEFAULT_WORKERS = 4
+
+# Descriptor file suffixes picked up from a directory.
+DESCRIPTOR_SUFFIXES = ('.yml', '.yaml')
+
+
+def find_job_descriptors(patterns: list) -> list:
+    """
+    Find the job descriptors to run.
+
+    Params:
+        patterns: Directories, globs, or descriptor file names.  A directory
+                  stands for all of the descriptors in it.
+    Returns:
+        A list of descriptor file names, in order and without duplicates.
+    """
+    job_files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                     if name.endswith(DESCRIPTOR_SUFFIXES)]
+        else:
+            found = glob.glob(pattern)
+        for job_file in sorted(found):
+            if os.path.isfile(job_file) and (job_file not in job_files):
+                job_files.append(job_file)
+    return job_files
+
+
+def run_one(job_file: str, userid: str='', log_type: str='warning') -> dict:
+    """
+    Run one job of a batch.  Anything that goes wrong is caught and reported
+    in the results, so that one bad job doesn't stop the rest of the batch.
+
+    Returns:
+        results: A dictionary with the descriptor, job name, rc, elapsed
+                 seconds, and the error if the job failed.
+    """
+    from ztron.job import Job
+    from ztron.run import run_application
+
+    results = {'job_file': job_file, 'name': '', 'rc': 0, 'seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        with Job({'job': job_file, 'userid': userid, 'log_type': log_type}) as job:
+            results['name'] = job.get_job_name()
+            results['rc'] = run_application(job)
+    except Exception as e:
+        results['rc'] = max(results['rc'], 1)
+        results['error'] = f'{type(e).__name__}: {e}'
+    results['seconds'] = time.perf_counter() - start
+    return results
+
+
+def run_batch(job_files: list, workers: int=DEFAULT_WORKERS, userid: str='',
+              log_type: str='warning') -> list:
+    """
+    Run a batch of jobs, up to workers of them at once.
+
+    Params:
+        job_files: The job descriptors to run.
+        workers: The most jobs to run at once.
+        userid: Run every job as this userid, instead of its descriptor's.
+        log_type: The log level for every job.
+    Returns:
+        A list of the results of each job (see run_one()), in the order of
+        job_files.
+    """
+    # Importing here, before the workers start, keeps each worker from
+    # waiting on the import lock.
+    import ztron.job, ztron.run
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ztron-batch') as pool:
+        futures = [pool.submit(run_one, job_file, userid, log_type) for job_file in job_files]
+        return [future.result() for future in futures]
+
+
+def show_summary(all_results: list, seconds: float, out=sys.stdout) -> None:
+    out.write('Batch summary:\n')
+    for results in all_results:
+        status = 'ok' if results['rc'] == 0 else 'FAILED'
+        name = results['name'] if len(results['name']) > 0 else '-'
+        out.write(f"    {status:6s} rc: {results['rc']:<3d} {results['seconds']:8.2f}s  "
+                  f"{name}  ({results['job_file']})\n")
+        if results['error'] is not None:
+            out.write(f"           {results['error']}\n")
+    n_failed = len([results for results in all_results if results['rc'] != 0])
+    rate = len(all_results)/seconds if seconds > 0 else 0.0
+    out.write(f'    {len(all_results)} jobs, {n_failed} failed, {seconds:.2f}s '
+              f'({rate:.1f} jobs/s)\n')
+    return
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser('ztron',
+                                 description='Run many job descriptors in one process')
+    ap.add_argument('--jobs', nargs='+', required=True, metavar='DIR_OR_GLOB',
+                    help='directories, globs, or job descriptors to run')
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                    help=f'jobs to run at once (default: {DEFAULT_WORKERS})')
+    ap.add_argument('--userid', default='',
+                    help='run as this userid instead of the one in each descriptor')
+    ap.add_argument('--log_type', default='warning',
+                    help='info, warning, error, critical or debug')
+    return ap
+
+
+def main(argv: list=None) -> int:
+    args = arg_parser().parse_args(argv)
+
+    job_files = find_job_descriptors(args.jobs)
+    if len(job_files) == 0:
+        sys.stderr.write(f"No job descriptors found in {' '.join(args.jobs)}\n")
+        return 1
+
+    start = time.perf_counter()
+    all_results = run_batch(job_files, args.workers, args.userid, args.log_type.lower())
+    show_summary(all_results, time.perf_counter() - start)
+
+    # Exit statuses only go up to 255.
+    return min(max(results['rc'] for results in all_results), 255)
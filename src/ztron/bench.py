@@ -0,0 +1,340 @@
+"""
+  bench.py - measure ztron's performance off-host, against a simulated MVS.
+
+    ztron bench runs real ztron jobs, each copying members between two PDSs
+    with IEBCOPY, on the simulator backend (see mvs/simulator.py) instead of
+    ZOAU.  Datasets are files in a scratch directory, and each operation takes
+    as long as it's told to:
+
+        execute - sleeps for the execute latency, copies the members, and
+                  writes spool lines to the SYSPRINT dataset
+        create, read, tmp_name - sleep for their latencies
+
+    It reports:
+
+        jobs/sec - jobs finished per second of wall clock
+        phases - latency percentiles (p50, p90, p99, max) of each span of the
+                 jobs' traces: job, descriptor parse, DD allocation,
+                 mvscmd.execute, spool read, ...
+        peak RSS - the most memory the process used, in KB
+        log throughput - records and MB per second written by a Log, both
+                         synchronous and queued
+
+    The results can be saved as a baseline, and a later run compared against
+    it, failing when anything got slower than the tolerance allows:
+
+        ztron bench --save-baseline bench.json
+        ztron bench --baseline bench.json --tolerance 10
+
+    Everything the bench creates is in a scratch directory that is removed
+    when it's done.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, sys, json, time
+
+DEFAULT_JOBS = 20
+DEFAULT_WORKERS = 1
+DEFAULT_MEMBERS = 20
+DEFAULT_SHARDS = 2
+DEFAULT_SPOOL_LINES = 200
+DEFAULT_EXECUTE_MS = 5.0
+DEFAULT_CREATE_MS = 1.0
+DEFAULT_READ_MS = 0.5
+DEFAULT_TMP_NAME_MS = 0.2
+DEFAULT_LOG_RECORDS = 20000
+DEFAULT_TOLERANCE = 10.0
+
+# The bench's own userid, so that its temporary names don't look like anybody's.
+BENCH_USERID = 'ZTBENCH'
+
+# The PDSs each bench job copies members between.
+SOURCE_PDS = f'{BENCH_USERID}.BENCH.SOURCE'
+TARGET_PDS = f'{BENCH_USERID}.BENCH.TARGET'
+
+# Measurements where bigger is better.  For everything else, smaller is better.
+HIGHER_IS_BETTER = ('jobs_per_sec', 'records_per_sec', 'mb_per_sec')
+
+
+def percentiles(values: list) -> dict:
+    # Nearest rank percentiles, in milliseconds.
+    import math
+    values = sorted(values)
+    def rank(p):
+        return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+    return {'count': len(values),
+            'p50_ms': round(rank(50) * 1000, 3),
+            'p90_ms': round(rank(90) * 1000, 3),
+            'p99_ms': round(rank(99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3)}
+
+
+def peak_rss_kb() -> int:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def write_job_descriptor(file_name: str, home: str, members: int, shards: int,
+                         spool_pool: bool, backend_opts: dict) -> None:
+    lines = ['Name: BenchCopy',
+             'Description: ztron bench job',
+             'Environment:',
+             f'  userid: {BENCH_USERID}',
+             '  home:',
+             f'    Root: {home}',
+             '    Logs: logs',
+             '    Spool: spool',
+             '  log_type: info',
+             '  spool_output:',
+             '    policy: always']
+    if spool_pool:
+        lines += ['  spool_pool:', f'    size: {max(1, shards)}']
+    lines += ['  backend:'] + [f'    {key}: {value}' for key, value in backend_opts.items()]
+    lines += ['Application:',
+              '  name: copy_pds.py',
+              '  args:',
+              f'    from_pds: {SOURCE_PDS}',
+              f'    to_pds: {TARGET_PDS}',
+              f'    shards: {shards}',
+              '    members:']
+    lines += [f'      - M{i:07d}' for i in range(members)]
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return
+
+
+def run_job(job_file: str) -> tuple:
+    """
+    Run one bench job.  Returns its rc and the spans of its trace, as
+    (name, seconds) pairs.
+    """
+    from ztron.job import Job
+    from ztron.run import run_application
+
+    with Job({'job': job_file, 'userid': '', 'log_type': 'info'}) as job:
+        rc = run_application(job)
+    spans = []
+    if job.tracer is not None:
+        spans = [(event['name'], event['dur'] / 1e6) for event in job.tracer.events]
+    return rc, spans
+
+
+def bench_jobs(job_file: str, jobs: int, workers: int) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+
+    # One job first, so imports and the descriptor cache are warm, the way
+    # they are for all but the first job of a day.
+    run_job(job_file)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ztron-bench') as pool:
+        results = list(pool.map(lambda _: run_job(job_file), range(jobs)))
+    seconds = time.perf_counter() - start
+
+    phases = {}
+    for rc, spans in results:
+        for name, span_seconds in spans:
+            phases.setdefault(name, []).append(span_seconds)
+    return {'jobs': jobs,
+            'workers': workers,
+            'failed': sum(1 for rc, _ in results if rc != 0),
+            'seconds': round(seconds, 3),
+            'jobs_per_sec': round(jobs / seconds, 3),
+            'phases': {name: percentiles(values) for name, values in sorted(phases.items())}}
+
+
+def bench_log(log_path: str, records: int, queue_opts: dict=None) -> dict:
+    from ztron.log import Log
+
+    log = Log('bench.log', log_path, 'info', 'ztron.bench', queue_opts)
+    message = 'SPOOL LINE %08d - ' + 'X' * 40
+    start = time.perf_counter()
+    for i in range(records):
+        log.info(message, i)
+    log.close()
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(log.get_full_name())
+    return {'records': records,
+            'seconds': round(seconds, 3),
+            'records_per_sec': round(records / seconds, 1),
+            'mb_per_sec': round(size / seconds / (1024 * 1024), 3)}
+
+
+def run_bench(args) -> dict:
+    """
+    Run the benchmarks in a scratch directory, on the simulator backend.
+    """
+    import tempfile, shutil, contextlib
+    from ztron.mvs import backend
+
+    scratch = tempfile.mkdtemp(prefix='ztron_bench_')
+    saved_environ = dict(os.environ)
+    try:
+        # Keep the ledger and descriptor cache of the bench to itself.
+        os.environ['ZTRON_LEDGER_PATH'] = os.path.join(scratch, 'ledger')
+        os.environ['ZTRON_CACHE_PATH'] = os.path.join(scratch, 'cache')
+        os.environ.pop('ZTRON_BACKEND', None)
+
+        # The jobs name the simulator in their descriptor.  Get the same one
+        # here, which they then share, to put the members to copy in the
+        # source PDS, and make the target a PDSE so the copies can be sharded.
+        backend_opts = {'name': backend.BACKEND_SIMULATOR,
+                        'path': os.path.join(scratch, 'datasets'),
+                        'execute_ms': args.execute_ms,
+                        'create_ms': args.create_ms,
+                        'read_ms': args.read_ms,
+                        'tmp_name_ms': args.tmp_name_ms,
+                        'spool_lines': args.spool_lines}
+        simulator = backend.select(backend_opts)
+        simulator.create(TARGET_PDS, backend.DSNTYPE_PDSE)
+        for i in range(args.members):
+            simulator.write(f'{SOURCE_PDS}(M{i:07d})', f'MEMBER M{i:07d}\n')
+
+        job_file = os.path.join(scratch, 'bench.yml')
+        write_job_descriptor(job_file, os.path.join(scratch, 'home'),
+                             args.members, args.shards, args.spool_pool, backend_opts)
+
+        # The logs go to the console as well as their files.  That's not what's
+        # being measured, so the console is thrown away while the bench runs.
+        results = {'settings': {key: value for key, value in vars(args).items()
+                                if key not in ('baseline', 'save_baseline', 'json', 'tolerance')}}
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            results['jobs'] = bench_jobs(job_file, args.jobs, args.workers)
+            log_path = os.path.join(scratch, 'log_throughput')
+            results['log'] = {'sync': bench_log(log_path, args.log_records),
+                              'queued': bench_log(log_path, args.log_records, {})}
+        results['peak_rss_kb'] = peak_rss_kb()
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def flatten(results: dict, prefix: str='') -> dict:
+    # {'jobs': {'jobs_per_sec': 1}} -> {'jobs.jobs_per_sec': 1}, numbers only.
+    flat = {}
+    for key, value in results.items():
+        if key == 'settings':
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float=DEFAULT_TOLERANCE) -> list:
+    """
+    Compare results against a baseline.
+
+    Params:
+        results, baseline: Results of run_bench().
+        tolerance: How many percent worse a measurement can get before it
+                   counts as a regression.
+    Returns:
+        A list of (measurement, baseline value, value, percent change,
+        regressed) for the measurements that are in both.
+    """
+    current = flatten(results)
+    comparisons = []
+    for key, base_value in flatten(baseline).items():
+        # Counts are settings, not measurements.
+        if (key not in current) or key.endswith(('.count', '.jobs', '.workers', '.records', '.failed')):
+            continue
+        value = current[key]
+        change = 0.0 if base_value == 0 else (value - base_value) / base_value * 100
+        worse = -change if key.rsplit('.', 1)[-1] in HIGHER_IS_BETTER else change
+        comparisons.append((key, base_value, value, round(change, 1), worse > tolerance))
+    return comparisons
+
+
+def show_results(results: dict, out=sys.stdout) -> None:
+    jobs = results['jobs']
+    out.write(f"Jobs:  {jobs['jobs']} jobs, {jobs['workers']} workers, "
+              f"{jobs['seconds']}s, {jobs['jobs_per_sec']} jobs/sec, {jobs['failed']} failed\n")
+    out.write(f"{'span':24} {'count':>7} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}\n")
+    for name, p in jobs['phases'].items():
+        out.write(f"{name:24} {p['count']:>7} {p['p50_ms']:>10} {p['p90_ms']:>10} "
+                  f"{p['p99_ms']:>10} {p['max_ms']:>10}\n")
+    for mode, log in results['log'].items():
+        out.write(f"Log ({mode}):  {log['records']} records, {log['records_per_sec']} records/sec, "
+                  f"{log['mb_per_sec']} MB/sec\n")
+    out.write(f"Peak RSS:  {results['peak_rss_kb']} KB\n")
+    return
+
+
+def show_comparisons(comparisons: list, tolerance: float, out=sys.stdout) -> None:
+    out.write(f'Compared with the baseline (tolerance {tolerance}%):\n')
+    for key, base_value, value, change, regressed in comparisons:
+        flag = '  REGRESSED' if regressed else ''
+        out.write(f'    {key:40} {base_value:>12} -> {value:>12} ({change:+.1f}%){flag}\n')
+    return
+
+
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser('ztron bench',
+                                 description='Benchmark ztron jobs against a simulated MVS')
+    ap.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help=f'jobs to run (default: {DEFAULT_JOBS})')
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                    help=f'jobs to run at once (default: {DEFAULT_WORKERS})')
+    ap.add_argument('--members', type=int, default=DEFAULT_MEMBERS,
+                    help=f'members copied by each job (default: {DEFAULT_MEMBERS})')
+    ap.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                    help=f'IEBCOPY runs per job (default: {DEFAULT_SHARDS})')
+    ap.add_argument('--spool-pool', action='store_true', help='reuse spool datasets from a spool pool')
+    ap.add_argument('--spool-lines', type=int, default=DEFAULT_SPOOL_LINES,
+                    help=f'lines of spool output per IEBCOPY (default: {DEFAULT_SPOOL_LINES})')
+    ap.add_argument('--execute-ms', type=float, default=DEFAULT_EXECUTE_MS,
+                    help=f'latency of a program run (default: {DEFAULT_EXECUTE_MS})')
+    ap.add_argument('--create-ms', type=float, default=DEFAULT_CREATE_MS,
+                    help=f'latency of a dataset create (default: {DEFAULT_CREATE_MS})')
+    ap.add_argument('--read-ms', type=float, default=DEFAULT_READ_MS,
+                    help=f'latency of a dataset read (default: {DEFAULT_READ_MS})')
+    ap.add_argument('--tmp-name-ms', type=float, default=DEFAULT_TMP_NAME_MS,
+                    help=f'latency of a temporary dataset name (default: {DEFAULT_TMP_NAME_MS})')
+    ap.add_argument('--log-records', type=int, default=DEFAULT_LOG_RECORDS,
+                    help=f'records written by the log throughput test (default: {DEFAULT_LOG_RECORDS})')
+    ap.add_argument('--baseline', default=None, metavar='FILE',
+                    help='compare the results with a saved baseline, and exit 1 on a regression')
+    ap.add_argument('--save-baseline', default=None, metavar='FILE',
+                    help='save the results as a baseline')
+    ap.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                    help=f'percent worse than the baseline that counts as a regression (default: {DEFAULT_TOLERANCE})')
+    ap.add_argument('--json', action='store_true', help='write the results as JSON')
+    return ap
+
+
+def main(argv: list) -> int:
+    args = arg_parser().parse_args(argv)
+
+    results = run_bench(args)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        show_results(results)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    rc = 0 if results['jobs']['failed'] == 0 else 1
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        out = sys.stderr if args.json else sys.stdout
+        if baseline.get('settings') != results['settings']:
+            out.write('Note: the baseline was run with different settings, so it may not compare\n')
+        comparisons = compare(results, baseline, args.tolerance)
+        show_comparisons(comparisons, args.tolerance, out)
+        if any(regressed for *_, regressed in comparisons):
+            rc = 1
+    return rc
@@ -0,0 +1,304 @@
+"""
+  daemon.py - a long-lived ztron process that runs jobs submitted over a Unix
+              domain socket.
+
+    Even a batch pays for Python startup, imports and ZOAU initialization once
+    per run.  The daemon pays for them once, when it starts: modules are
+    imported up front, and the spool pool of a warm-up job descriptor can be
+    filled ahead of time.  After that, a job submitted to it starts in
+    milliseconds.
+
+        ztron serve [--socket PATH] [--workers N] [--warm JOB]
+        ztron submit --job JOB [--userid USERID] [--log_type LOG_TYPE] [--socket PATH]
+
+    The protocol is a JSON object per line.  The client sends one request:
+
+        {"op": "submit", "job": "/abs/path.yml", "userid": "", "log_type": "info"}
+        {"op": "ping"}
+        {"op": "shutdown"}
+
+    and the daemon answers a submit with the job's log records as they are
+    written, followed by the result, whose rc the client exits with:
+
+        {"event": "log", "level": "info", "message": "..."}
+        {"event": "done", "rc": 0, "name": "...", "seconds": 0.42, "error": null}
+
+    The socket is only accessible to the userid running the daemon.  Its path
+    is ZTRON_SOCKET, or /tmp/<userid>_ZTSOCK.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, sys, json, socket
+
+from ztron.uss.user import get_userid
+
+# Jobs the daemon runs at once.  Submissions beyond this wait their turn.
+DEFAULT_WORKERS = 4
+
+
+def get_socket_path() -> str:
+    return os.environ.get('ZTRON_SOCKET', f'/tmp/{get_userid()}_ZTSOCK')
+
+
+def send_message(f, message: dict) -> None:
+    f.write(json.dumps(message) + '\n')
+    f.flush()
+    return
+
+
+def warm_up(warm_job: str=None) -> None:
+    """
+    Do the work that every job would otherwise pay for the first time it runs
+    in a process: import the job machinery and the backend (ZOAU), and fill
+    the spool pool of a warm-up job descriptor.
+    """
+    import ztron.job, ztron.run, ztron.mvs.pds
+    from ztron.mvs import backend
+
+    # Warm up the backend of the warm-up job, if there is one.
+    warm_backend = backend.get_backend()
+    if warm_job is not None:
+        job = ztron.job.Job({'job': warm_job, 'userid': '', 'log_type': 'warning'})
+        try:
+            warm_backend = job.backend
+            if job.spool_pool is not None:
+                job.spool_pool.prefill()
+        finally:
+            job.term()
+    warm_backend.warm_up()
+    return
+
+
+def run_submitted(request: dict, f) -> dict:
+    """
+    Run a submitted job, sending its log records back as they're written.
+    """
+    import logging, time
+    from ztron.job import Job
+    from ztron.run import run_application
+
+    class ForwardHandler(logging.Handler):
+        def emit(self, record):
+            try:
+                send_message(f, {'event': 'log',
+                                 'level': record.levelname.lower(),
+                                 'message': record.getMessage()})
+            except OSError:
+                # The client went away.  The job still runs to the end, so
+                # that it cleans up after itself.
+                pass
+
+    results = {'event': 'done', 'rc': 0, 'name': '', 'seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        with Job({'job': request['job'],
+                  'userid': request.get('userid', ''),
+                  'log_type': request.get('log_type', 'warning')}) as job:
+            handler = ForwardHandler(job.log.get_log_level())
+            job.log.logger.addHandler(handler)
+            results['name'] = job.get_job_name()
+            results['rc'] = run_application(job)
+    except Exception as e:
+        results['rc'] = max(results['rc'], 1)
+        results['error'] = f'{type(e).__name__}: {e}'
+    results['seconds'] = time.perf_counter() - start
+    return results
+
+
+def serve(socket_path: str=None, workers: int=DEFAULT_WORKERS, warm_job: str=None) -> int:
+    """
+    Run the daemon until it's told to shut down or is interrupted.
+    """
+    import socketserver, threading
+
+    if socket_path is None:
+        socket_path = get_socket_path()
+    if ping(socket_path):
+        sys.stderr.write(f'ztron serve: a daemon is already listening on {socket_path}\n')
+        return 1
+
+    # A socket file left behind by a daemon that died is in the way.
+    try:
+        os.remove(socket_path)
+    except FileNotFoundError:
+        pass
+
+    warm_up(warm_job)
+    slots = threading.Semaphore(max(1, workers))
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            f = _TextWriter(self.wfile)
+            try:
+                request = json.loads(self.rfile.readline() or '{}')
+            except ValueError:
+                request = {}
+            op = request.get('op', 'submit')
+
+            if op == 'ping':
+                send_message(f, {'event': 'pong', 'pid': os.getpid()})
+            elif op == 'shutdown':
+                send_message(f, {'event': 'done', 'rc': 0})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif (op == 'submit') and ('job' in request):
+                with slots:
+                    results = run_submitted(request, f)
+                try:
+                    send_message(f, results)
+                except OSError:
+                    pass
+            else:
+                send_message(f, {'event': 'done', 'rc': 1,
+                                 'error': f'Bad request: {request}'})
+            return
+
+    # Jobs that are running when the daemon is told to stop are finished, so
+    # that they clean up after themselves.
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = False
+        block_on_close = True
+
+    old_umask = os.umask(0o177)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    sys.stderr.write(f'ztron serve: listening on {socket_path}, {workers} workers\n')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+    return 0
+
+
+class _TextWriter():
+    # The request handler's wfile takes bytes.  send_message() writes text.
+    def __init__(self, wfile):
+        self.wfile = wfile
+        return
+
+    def write(self, text: str) -> None:
+        self.wfile.write(text.encode('utf-8'))
+        return
+
+    def flush(self) -> None:
+        self.wfile.flush()
+        return
+
+
+def connect(socket_path: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    return sock
+
+
+def request(socket_path: str, message: dict):
+    """
+    Send a request to the daemon, and yield each message it sends back.
+    """
+    with connect(socket_path) as sock:
+        with sock.makefile('rw', encoding='utf-8') as f:
+            send_message(f, message)
+            for line in f:
+                yield json.loads(line)
+    return
+
+
+def ping(socket_path: str) -> bool:
+    try:
+        return any(reply.get('event') == 'pong' for reply in request(socket_path, {'op': 'ping'}))
+    except (OSError, ValueError):
+        return False
+
+
+def submit(job_file: str, userid: str='', log_type: str='warning',
+           socket_path: str=None) -> int:
+    """
+    Submit a job to the daemon, write its log to STDOUT and STDERR as it runs,
+    and return its rc.
+    """
+    if socket_path is None:
+        socket_path = get_socket_path()
+    message = {'op': 'submit',
+               'job': os.path.abspath(job_file),
+               'userid': userid,
+               'log_type': log_type}
+    try:
+        for reply in request(socket_path, message):
+            if reply.get('event') == 'log':
+                out = sys.stdout if reply['level'] in ('info', 'debug') else sys.stderr
+                out.write(f"{reply['level'].upper()}: {reply['message']}\n")
+            elif reply.get('event') == 'done':
+                if reply.get('error') is not None:
+                    sys.stderr.write(f"ztron submit: {reply['error']}\n")
+                # Exit statuses only go up to 255.
+                return min(reply.get('rc', 1), 255)
+    except OSError as e:
+        sys.stderr.write(f'ztron submit: no daemon at {socket_path}: {e.strerror}\n')
+        return 1
+
+    # The daemon went away before the job finished.
+    sys.stderr.write('ztron submit: lost the connection to the daemon\n')
+    return 1
+
+
+def serve_arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser('ztron serve',
+                                 description='Run jobs submitted over a Unix domain socket')
+    ap.add_argument('--socket', default=None,
+                    help='the socket to listen on (default: $ZTRON_SOCKET or /tmp/<userid>_ZTSOCK)')
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                    help=f'jobs to run at once (default: {DEFAULT_WORKERS})')
+    ap.add_argument('--warm', default=None, metavar='JOB',
+                    help='fill the spool pool of this job descriptor at startup')
+    return ap
+
+
+def submit_arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser('ztron submit',
+                                 description='Run a job on a ztron daemon, and exit with its rc')
+    ap.add_argument('--job', default=None, help='the job descriptor (YAML) to run')
+    ap.add_argument('--userid', default='',
+                    help='run as this userid instead of the one in the descriptor')
+    ap.add_argument('--log_type', default='warning',
+                    help='info, warning, error, critical or debug')
+    ap.add_argument('--socket', default=None,
+                    help='the socket of the daemon (default: $ZTRON_SOCKET or /tmp/<userid>_ZTSOCK)')
+    ap.add_argument('--shutdown', action='store_true',
+                    help='tell the daemon to stop once its running jobs are done')
+    return ap
+
+
+def main(argv: list) -> int:
+    command = argv[0]
+    if command == 'serve':
+        args = serve_arg_parser().parse_args(argv[1:])
+        return serve(args.socket, args.workers, args.warm)
+
+    ap = submit_arg_parser()
+    args = ap.parse_args(argv[1:])
+    socket_path = get_socket_path() if args.socket is None else args.socket
+
+    if args.shutdown:
+        try:
+            for reply in request(socket_path, {'op': 'shutdown'}):
+                return reply.get('rc', 0)
+        except OSError as e:
+            sys.stderr.write(f'ztron submit: no daemon at {socket_path}: {e.strerror}\n')
+        return 1
+    if args.job is None:
+        ap.error('--job is required')
+    return submit(args.job, args.userid, args.log_type.lower(), socket_path)
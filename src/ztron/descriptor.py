@@ -0,0 +1,120 @@
+"""
+  descriptor.py - load job descriptors, through a cache of parsed descriptors.
+
+    Short jobs that run often spend a noticeable part of their startup parsing
+    the same YAML descriptor over and over.  The first time a descriptor is
+    loaded, its normalized form is saved in the cache, and later loads read it
+    back from there, as long as the descriptor file has the same mtime and size.
+    The cache is written with marshal, which is quick to read and, unlike
+    pickle, can't run code when it's loaded.  Descriptors holding values that
+    marshal can't write (like YAML timestamps) just aren't cached.
+
+    yaml itself is only imported on a cache miss.
+
+    The cache is in ZTRON_CACHE_PATH, or /tmp/<userid>_ZTCACHE.  Set
+    ZTRON_CACHE_PATH to an empty string to turn the cache off.  The cache
+    isn't used, for reading or writing, unless its directory belongs to the
+    user and nobody else can get in (see util.private_dir()).
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, hashlib, marshal
+
+from ztron.uss.user import get_userid
+from ztron.util import private_dir
+
+# Change this whenever the normalized form of a descriptor changes, so that
+# older cache entries aren't used.
+CACHE_VERSION = 7
+
+
+class DescriptorError(ValueError):
+    """
+    A job descriptor that can't be parsed.
+    """
+
+
+def get_cache_path() -> str:
+    return os.environ.get('ZTRON_CACHE_PATH', f'/tmp/{get_userid()}_ZTCACHE')
+
+
+def get_cache_file_name(cache_path: str, file_name: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()
+    return f'{cache_path}/desc_{digest}.marshal'
+
+
+def parse_yaml(file_name: str) -> dict:
+    import yaml
+
+    # libyaml parses several times faster than the pure Python loader, when
+    # it's there.
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(file_name, 'r') as file:
+        try:
+            return yaml.load(file, Loader=loader)
+        except yaml.YAMLError as e:
+            raise DescriptorError(f'{file_name}: {e}') from e
+
+
+def load(file_name: str, normalize) -> dict:
+    """
+    Load a job descriptor, from the cache if it's there and up to date.
+
+    Params:
+        file_name: The job descriptor file.
+        normalize: A function that takes the parsed YAML and returns the
+                   normalized descriptor.  It's only called on a cache miss.
+    Returns:
+        The normalized descriptor.
+    Raises:
+        DescriptorError if the descriptor can't be parsed, and anything that
+        normalize raises.
+    """
+    st = os.stat(file_name)
+    key = (os.path.abspath(file_name), st.st_mtime_ns, st.st_size, CACHE_VERSION)
+    cache_path = get_cache_path()
+    if (len(cache_path) == 0) or not private_dir(cache_path):
+        return normalize(parse_yaml(file_name))
+
+    cache_file_name = get_cache_file_name(cache_path, file_name)
+    cached = read_cache(cache_file_name)
+    if (cached is not None) and (tuple(cached.get('key', ())) == key):
+        return cached['desc']
+
+    desc = normalize(parse_yaml(file_name))
+    write_cache(cache_file_name, {'key': key, 'desc': desc})
+    return desc
+
+
+def read_cache(cache_file_name: str) -> dict:
+    # A missing or damaged cache entry is a cache miss.
+    try:
+        with open(cache_file_name, 'rb') as f:
+            cached = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return cached if isinstance(cached, dict) else None
+
+
+def write_cache(cache_file_name: str, entry: dict) -> None:
+    # Write the entry to a temporary file and move it into place, so a reader
+    # never sees half of one.  Not being able to cache isn't an error.
+    try:
+        data = marshal.dumps(entry)
+    except ValueError:
+        return
+    temp_file_name = f'{cache_file_name}.{os.getpid()}.tmp'
+    try:
+        with open(temp_file_name, 'wb') as f:
+            f.write(data)
+        os.replace(temp_file_name, cache_file_name)
+    except OSError:
+        try:
+            os.remove(temp_file_name)
+        except OSError:
+            pass
+    return
@@ -0,0 +1,83 @@
+"""
+  events.py - a structured log of what a job did, one JSON record per line.
+
+    The human log says what happened in words.  The event log says the same
+    thing as data, so dashboards can find slow jobs and failing commands
+    without scraping text.  Every record has the kind of event, when it was
+    written, and the fields of that kind of event:
+
+        job     - name, job_file, userid, start, end, duration, rc, error
+        command - pgm, start, end, duration, rc, dds, spool_dataset
+        mvscmd  - pgm, start, end, duration, rc, dds, spool_dataset
+
+    A command record covers the whole of command.run(), logging the spool
+    included.  An mvscmd record covers just the program run by ZOAU.  Times
+    are UTC ISO 8601, and durations are in seconds.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import json, time, threading
+
+
+def iso_time(t: float) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(t)) + f'.{int(t % 1 * 1000):03d}Z'
+
+
+def timing(start: float, end: float) -> dict:
+    return {'start': iso_time(start), 'end': iso_time(end), 'duration': round(end - start, 6)}
+
+
+class EventLog():
+    """
+    A JSON lines file of events.  Safe to write from more than one thread.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.f = open(file_name, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.max_rc = 0
+        return
+
+
+    def emit(self, event: str, **fields) -> None:
+        """
+        Write an event record.
+
+        Params:
+            event: The kind of event, like 'job' or 'command'.
+            fields: The fields of the record.  Anything that isn't JSON is
+                    written as its string.
+        """
+        record = {'event': event, 'ts': iso_time(time.time())}
+        record.update(fields)
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            if self.f is None:
+                return
+            self.f.write(line)
+            if isinstance(fields.get('rc'), int):
+                self.max_rc = max(self.max_rc, fields['rc'])
+        return
+
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.f is not None:
+                self.f.flush()
+        return
+
+
+    def close(self) -> None:
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+        return
+
+
+    def get_file_name(self) -> str:
+        return self.file_name
@@ -7,12 +7,19 @@
 
   SPDX-License-Identifier: Apache-2.0
 """
-import argparse, yaml
+import os, time
 
+from ztron.mvs import backend
 from ztron.mvs import command
 from ztron.mvs import dataset
+from ztron.mvs import spool
 from ztron.uss import file
 from ztron.uss import user
+from ztron import descriptor
+from ztron import ledger
+from ztron import metrics
+from ztron import trace
+from ztron.events import timing
 from ztron.log import Log
 from ztron.util import timestamp
 
@@ -28,19 +35,36 @@ class Job():
         self.env_home = ''
         self.env_home_log_path = ''
         self.env_home_spool_path = ''
+        self.env_home_manifest_path = ''
         self.appl_name = ''
         self.appl_args = {}
+        self.spool_opts = {}
+        self.spool_pool = None
+        self.backend = None
 
 
         # Resources allocated during the execution of a job.
         self.DD_list = []
         self.temp_datasets = []
+        self.pooled_datasets = []
         self.temp_files = []
         self.log = None
         self.ts_start = None
+        self.error = None
+        self.terminated = False
+        self.metrics = metrics.Registry()
+        self.metrics_file = None
+        self.tracer = trace.Tracer()
+        ts_init = time.perf_counter()
 
         # Get all input from the command line and job descriptor.
-        self.job_desc = self.parse_job_desc(args)
+        with self.metrics.time(metrics.PHASE_DESCRIPTOR_PARSE), \
+             self.tracer.span('descriptor parse'):
+            self.job_desc = self.parse_job_desc(args)
+
+        # Run MVS operations on the backend the descriptor names, unless the
+        # ZTRON_BACKEND environment variable names one.
+        self.backend = backend.select(self.job_desc['environment']['backend'])
 
         # Build the job from the specified input.
         self.job_desc_fn = self.job_desc['filename']
@@ -50,13 +74,48 @@ class Job():
         self.env_home = self.job_desc['environment']['home']['root']
         self.env_home_log_path = self.env_home+'/'+self.job_desc['environment']['home']['logs']
         self.env_home_spool_path = self.env_home+'/'+self.job_desc['environment']['home']['spool']
+        self.env_home_manifest_path = self.env_home+'/'+self.job_desc['environment']['home'].get('manifests', 'manifests')
+        self.spool_opts = self.job_desc['environment']['spool_output']
         self.appl_name = self.job_desc['application']['name']
         self.appl_args = self.job_desc['application']['args']
         self.log = Log('ztron.log', 
                        self.env_home_log_path, 
                        self.job_desc['environment']['log_type'],
-                       __name__)
+                       __name__,
+                       self.job_desc['environment']['log_queue'],
+                       self.job_desc['environment']['events'],
+                       self.job_desc['environment']['log_rotation'])
+
+        # Metrics are kept unless turned off, and written out at the end of
+        # the job.  The log carries them to the commands the job runs.
+        metrics_opts = self.job_desc['environment']['metrics']
+        if metrics_opts is None:
+            self.metrics = None
+        else:
+            self.metrics_file = metrics_opts.get('textfile', f'{self.env_home}/metrics/{self.name}.prom')
+        self.log.metrics = self.metrics
+
+        # So is the trace, written next to the log at the end of the job.
+        if not self.job_desc['environment']['trace']:
+            self.tracer = None
+        self.log.tracer = self.tracer
+
+        # And so is the backend, so jobs on other backends in this process
+        # don't change it.
+        self.log.backend = self.backend
         
+        # Share spool datasets with other jobs for this userid, if asked to.
+        spool_pool_opts = self.job_desc['environment']['spool_pool']
+        if spool_pool_opts is not None:
+            self.spool_pool = spool.SpoolPool(self.env_userid,
+                                              self.env_home_spool_path,
+                                              spool_pool_opts.get('size', spool.DEFAULT_POOL_SIZE),
+                                              spool_pool_opts.get('max_idle', spool.DEFAULT_POOL_MAX_IDLE),
+                                              self.log)
+
+        self.ts_start = time.time()
+        if self.tracer is not None:
+            self.tracer.complete('job.init', 'ztron', ts_init, time.perf_counter())
         self.log.info(f'--- Start of Job {self.name} - {timestamp()} ---------------------')
         return
 
@@ -73,11 +132,8 @@ class Job():
             input = args
 
         else:
-            ap = argparse.ArgumentParser('Run a series of tasks and manage the output')
-            ap.add_argument('--job', default=self.job_desc_fn)
-            ap.add_argument('--userid', default=self.env_userid)
-            ap.add_argument('--log_type', default='warning')
-            input = ap.parse_args().__dict__
+            from ztron.run import job_arg_parser
+            input = job_arg_parser(self.job_desc_fn, self.env_userid).parse_args().__dict__
             input['log_type'] = input['log_type'].lower()
 
         if 'job' not in input.keys():
@@ -85,28 +141,31 @@ class Job():
             raise Exception
 
         # Load the job descriptor file with environment settings and application 
-        # arguments.
-        with open(input['job'], 'r') as file:
-            try:
-                job_yml_dict = yaml.safe_load(file)
-            except yaml.YAMLError as e:
-                self.log.error(e)
-                return None
-        
-        job_desc = {}
+        # arguments.  The normalized descriptor is cached, so it's only parsed 
+        # again when the file changes.  There's no log yet to report a bad
+        # descriptor in, so a DescriptorError goes back to the caller.
+        job_desc = descriptor.load(input['job'], self.normalize_job_desc)
         job_desc['filename'] = input['job']
 
+        # Command line settings aren't cached, since they change from run to run.
+        self.apply_cli_args(job_desc['environment'], input)
+        return job_desc
+
+
+    def normalize_job_desc(self, job_yml_dict):
+        job_desc = {}
+
         # Lower the case of all keys to be case invariant.
         for key in job_yml_dict.keys():
             job_desc[key.lower()] = job_yml_dict[key]
 
         # Handle the environment and application sections of the descriptor.
-        job_desc.update(environment=self.parse_jd_env(job_desc, input))
+        job_desc.update(environment=self.parse_jd_env(job_desc))
         job_desc.update(application=self.parse_jd_appl(job_desc)) 
         return job_desc
 
 
-    def parse_jd_env(self, job_desc, cli_args):
+    def parse_jd_env(self, job_desc):
         # The Environment section is required.
         if 'environment' not in job_desc.keys():
             log_err('No environment section in job descriptor.')
@@ -114,13 +173,26 @@ class Job():
 
         # We can't log this because the Log object hasn't been initialized yet.
         # print(f'job_desc:\n{job_desc}')
-        # print(f'cli_args:\n{cli_args}')
         jd_env = {}
         for key in job_desc['environment'].keys():
             jd_env[key.lower()] = job_desc['environment'][key]
 
         jd_env.update(home=self.parse_jd_env_home(jd_env))
+        jd_env.update(spool_output=self.parse_jd_env_spool_output(jd_env))
+        jd_env.update(spool_pool=self.parse_jd_env_spool_pool(jd_env))
+        jd_env.update(log_queue=self.parse_jd_env_log_queue(jd_env))
+        jd_env.update(log_rotation=self.parse_jd_env_log_rotation(jd_env))
+        jd_env.update(metrics=self.parse_jd_env_metrics(jd_env))
+        jd_env.update(backend=self.parse_jd_env_backend(jd_env))
+
+        # Structured events and the trace are written next to the log unless
+        # turned off.
+        jd_env['events'] = bool(jd_env.get('events', True))
+        jd_env['trace'] = bool(jd_env.get('trace', True))
+        return jd_env
+
 
+    def apply_cli_args(self, jd_env, cli_args):
         # Override job descriptor settings with command line args.
         if ('userid' in cli_args) and (len(cli_args['userid']) > 0):
             jd_env['userid'] = cli_args['userid'].upper()
@@ -131,7 +203,7 @@ class Job():
         if 'userid' in jd_env:
             jd_env['userid'] = jd_env['userid'].upper()
         else:
-            jd_env['userid'] = get_userid()
+            jd_env['userid'] = user.get_userid()
         return jd_env
 
 
@@ -152,6 +224,130 @@ class Job():
         return jd_env_home
 
 
+    def parse_jd_env_spool_output(self, jd_env):
+        # Spool output settings are optional.  Without them, the spool is logged
+        # after every command, up to the default maximum number of lines from 
+        # the start of the spool.
+        jd_env_spool = {}
+        if ('spool_output' not in jd_env.keys()) or (jd_env['spool_output'] is None):
+            return jd_env_spool
+
+        for key in jd_env['spool_output'].keys():
+            jd_env_spool[key.lower()] = jd_env['spool_output'][key]
+
+        for key in ('head', 'tail', 'max_lines'):
+            if key in jd_env_spool:
+                jd_env_spool[key] = int(jd_env_spool[key])
+
+        if 'policy' in jd_env_spool:
+            jd_env_spool['policy'] = str(jd_env_spool['policy']).lower()
+            if jd_env_spool['policy'] not in spool.POLICIES:
+                raise ValueError(f"Spool output policy {jd_env_spool['policy']} must be one of {', '.join(spool.POLICIES)}")
+        return jd_env_spool
+
+
+    def parse_jd_env_spool_pool(self, jd_env):
+        # The spool pool is optional.  Without it, every job allocates its own
+        # spool datasets.
+        if 'spool_pool' not in jd_env.keys():
+            return None
+
+        jd_env_pool = {}
+        if jd_env['spool_pool'] is not None:
+            for key in jd_env['spool_pool'].keys():
+                jd_env_pool[key.lower()] = int(jd_env['spool_pool'][key])
+
+        if jd_env_pool.get('size', spool.DEFAULT_POOL_SIZE) < 1:
+            raise ValueError(f"Spool pool size {jd_env_pool['size']} must be at least 1")
+        return jd_env_pool
+
+
+    def parse_jd_env_log_queue(self, jd_env):
+        # The log queue is optional.  Without it, messages are written to the
+        # console and the log file as they're logged.
+        if 'log_queue' not in jd_env.keys():
+            return None
+
+        jd_env_queue = {}
+        if jd_env['log_queue'] is not None:
+            for key in jd_env['log_queue'].keys():
+                jd_env_queue[key.lower()] = jd_env['log_queue'][key]
+
+        for key in ('size', 'batch'):
+            if key in jd_env_queue:
+                jd_env_queue[key] = int(jd_env_queue[key])
+                if jd_env_queue[key] < 1:
+                    raise ValueError(f'Log queue {key} {jd_env_queue[key]} must be at least 1')
+
+        if 'overflow' in jd_env_queue:
+            from ztron import log_queue
+            jd_env_queue['overflow'] = str(jd_env_queue['overflow']).lower()
+            if jd_env_queue['overflow'] not in log_queue.OVERFLOW_POLICIES:
+                raise ValueError(f"Log queue overflow {jd_env_queue['overflow']} must be one of {', '.join(log_queue.OVERFLOW_POLICIES)}")
+        return jd_env_queue
+
+
+    def parse_jd_env_log_rotation(self, jd_env):
+        # Log rotation and retention are optional.  Without them, a log grows
+        # without limit and the logs of old runs are kept.
+        if 'log_rotation' not in jd_env.keys():
+            return None
+
+        jd_env_rotation = {}
+        if jd_env['log_rotation'] is not None:
+            for key in jd_env['log_rotation'].keys():
+                jd_env_rotation[key.lower()] = jd_env['log_rotation'][key]
+
+        for key in ('max_bytes', 'backup_count', 'keep'):
+            if key in jd_env_rotation:
+                jd_env_rotation[key] = int(jd_env_rotation[key])
+                minimum = 0 if key == 'max_bytes' else 1
+                if jd_env_rotation[key] < minimum:
+                    raise ValueError(f'Log rotation {key} {jd_env_rotation[key]} must be at least {minimum}')
+
+        if 'max_age_days' in jd_env_rotation:
+            jd_env_rotation['max_age_days'] = float(jd_env_rotation['max_age_days'])
+            if jd_env_rotation['max_age_days'] <= 0:
+                raise ValueError(f"Log rotation max_age_days {jd_env_rotation['max_age_days']} must be more than 0")
+
+        jd_env_rotation['compress'] = bool(jd_env_rotation.get('compress', True))
+        return jd_env_rotation
+
+
+    def parse_jd_env_metrics(self, jd_env):
+        # Metrics are on unless set to false.  A textfile says where to write
+        # them, instead of <home>/metrics/<job name>.prom.
+        if jd_env.get('metrics') is False:
+            return None
+
+        jd_env_metrics = {}
+        if isinstance(jd_env.get('metrics'), dict):
+            for key in jd_env['metrics'].keys():
+                jd_env_metrics[key.lower()] = jd_env['metrics'][key]
+        if 'textfile' in jd_env_metrics:
+            jd_env_metrics['textfile'] = str(jd_env_metrics['textfile'])
+        return jd_env_metrics
+
+
+    def parse_jd_env_backend(self, jd_env):
+        # The backend is optional, and ZOAU without it.  It's either a name,
+        # or a name and the settings of that backend.
+        if jd_env.get('backend') is None:
+            return None
+
+        jd_env_backend = {}
+        if isinstance(jd_env['backend'], dict):
+            for key in jd_env['backend'].keys():
+                jd_env_backend[key.lower()] = jd_env['backend'][key]
+        else:
+            jd_env_backend['name'] = jd_env['backend']
+
+        jd_env_backend['name'] = str(jd_env_backend.get('name', backend.BACKEND_ZOAU)).lower()
+        if jd_env_backend['name'] not in backend.BACKENDS:
+            raise ValueError(f"Backend {jd_env_backend['name']} must be one of {', '.join(backend.BACKENDS)}")
+        return jd_env_backend
+
+
     def parse_jd_appl(self, job_desc):
         # The Application section is required.
         if 'application' not in job_desc.keys():
@@ -174,47 +370,166 @@ class Job():
         return jd_appl
 
 
-    def run(self, cmd: str='', DD_list: list=[]) -> dict:
+    def run(self, cmd: str='', DD_list: list=None) -> dict:
+        if DD_list is None:
+            DD_list = self.DD_list
         self.log.debug(f'Running {cmd}, DDs:')
-        for dd in self.DD_list:
+        for dd in DD_list:
             self.log.debug(f'      {dd.get_mvscmd_string()}')
-        return command.run(cmd, self.DD_list, self.log)
+        with trace.span(self.log, 'step', pgm=cmd):
+            return command.run(cmd, DD_list, self.log, self.spool_opts)
 
 
     def term(self):
+        if self.terminated:
+            return
+        self.terminated = True
+        with metrics.phase(self.log, metrics.PHASE_CLEANUP):
+            self.cleanup()
         self.log.info(f'--- End of Job {self.name} - {timestamp()} ---------------------')
+        self.export_metrics()
+        self.write_trace()
+        if self.log.events is not None:
+            rc = self.log.events.max_rc if self.error is None else max(self.log.events.max_rc, 1)
+            self.log.event('job', name=self.name, job_file=self.job_desc_fn,
+                           userid=self.env_userid, rc=rc, error=self.error,
+                           **timing(self.ts_start, time.time()))
+        self.log.close()
+        return
+
+
+    def export_metrics(self) -> None:
+        if self.metrics is None:
+            return
+        ts_end = time.time()
+        self.metrics.gauge('ztron_job_duration_seconds',
+                           'Time from the start of the job to its end').set(ts_end - self.ts_start)
+        self.metrics.gauge('ztron_job_end_timestamp_seconds',
+                           'When the job ended, in seconds since the epoch').set(ts_end)
+        self.metrics.gauge('ztron_job_success',
+                           'Whether the job ended without an exception').set(1 if self.error is None else 0)
+        try:
+            self.metrics.export(self.metrics_file, {'ztron_job': self.name})
+        except OSError as e:
+            self.log.warning(f'Failed to write metrics to {self.metrics_file}: {e.strerror}')
+        return
+
+
+    def write_trace(self) -> None:
+        if self.tracer is None:
+            return
+        self.tracer.complete('job', 'ztron', self.tracer.base, time.perf_counter(),
+                             {'name': self.name, 'error': self.error})
+        trace_file = self.log.get_full_name().removesuffix('.log') + '.trace.json'
+        try:
+            self.tracer.write(trace_file)
+        except OSError as e:
+            self.log.warning(f'Failed to write the trace to {trace_file}: {e.strerror}')
+        return
+
+
+    # A job can be used in a with statement, so that everything it allocated
+    # is released however the job ends.
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.error = f'{exc_type.__name__}: {exc_value}'
+            self.log.error(f'Job {self.name} ended with {self.error}')
+        self.term()
+        return False
+
+
+    def cleanup(self) -> None:
+        """
+        Release the temporary files and datasets the job allocated.  In debug
+        mode they are kept, so they can be looked at after the job.  Pooled
+        spool datasets always go back to the pool, or the pool would lose one
+        to every debug job.
+        """
+        # Pooled spool datasets go back to the pool for the next job.  Spool 
+        # output that hasn't been read yet can't be read after this.
+        if self.spool_pool is not None:
+            for spool_dataset in self.pooled_datasets:
+                self.spool_pool.release(spool_dataset)
+        self.pooled_datasets = []
+
+        if self.log.get_log_type() == 'debug':
+            for temp_ds in self.temp_datasets:
+                self.log.debug(f'Temporary dataset {temp_ds} has not been deleted')
+            for temp_file in self.temp_files:
+                self.log.debug(f'Temporary file {temp_file} has not been deleted')
+            return
+
+        for temp_file in self.temp_files:
+            try:
+                os.remove(temp_file)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.log.warning(f'Failed to delete {temp_file}: {e.strerror}')
+                continue
+            ledger.release(ledger.FILE, temp_file)
+        self.temp_files = []
+
+        # Anything that can't be deleted stays in the ledger for the reaper.
+        for temp_ds in self.temp_datasets:
+            spool.retire(temp_ds)
+        failed = dataset.delete_datasets(self.temp_datasets, log=self.log)
+        for temp_ds in self.temp_datasets:
+            if temp_ds in failed:
+                self.log.warning(f'Failed to delete {temp_ds}')
+            else:
+                ledger.release(ledger.DATASET, temp_ds)
+        self.temp_datasets = []
         return
 
 
-    # Methods for managing MVS resources.
+    # Methods for managing MVS resources.  DDs go on the job's DD list unless
+    # another list is given, like when a job runs the same program more than
+    # once with different DDs.
     def append_temp_dataset_list(self, dataset_name: str) -> None:
         self.temp_datasets.append(dataset_name)
         return
 
 
-    def create_DD_dataset(self, name: str, resource: str) -> None:
+    def create_DD_dataset(self, name: str, resource: str, DD_list: list=None) -> None:
         self.log.debug('Creating %s for %s' % (name, resource))
-        self.DD_list.append(dataset.create_DD(name, resource))
+        if DD_list is None:
+            DD_list = self.DD_list
+        DD_list.append(dataset.create_DD(name, resource, self.log))
         return
 
 
-    def create_DD_file(self, name: str, resource: str) -> None:
+    def create_DD_file(self, name: str, resource: str, DD_list: list=None) -> None:
         self.log.debug('Creating %s for %s' % (name, resource))
-        self.DD_list.append(file.create_DD(name, resource, self.log))
+        if DD_list is None:
+            DD_list = self.DD_list
+        DD_list.append(file.create_DD(name, resource, self.log))
         return
 
 
-    def create_spool_DD(self) -> None:
-        spool_dataset = dataset.create_spool_dataset(self.env_userid)
-        self.temp_datasets.append(spool_dataset['name'])
-        self.create_DD_dataset('SYSPRINT', spool_dataset['name'])
+    def create_spool_DD(self, DD_list: list=None) -> None:
+        with metrics.phase(self.log, metrics.PHASE_DATASET_ALLOCATE), \
+             trace.span(self.log, 'DD allocation', dd='SYSPRINT'):
+            if self.spool_pool is not None:
+                spool_dataset_name = self.spool_pool.acquire()
+                self.pooled_datasets.append(spool_dataset_name)
+            else:
+                spool_dataset_name = dataset.create_spool_dataset(self.env_userid, self.log)['name']
+                self.temp_datasets.append(spool_dataset_name)
+        self.create_DD_dataset('SYSPRINT', spool_dataset_name, DD_list)
         return
 
 
-    def create_task_DD(self, task: list) -> None:
-        task_file = file.build_task_file(task, 'cp1047', self.log)
+    def create_task_DD(self, task: list, DD_list: list=None) -> None:
+        with metrics.phase(self.log, metrics.PHASE_SYSIN_BUILD), \
+             trace.span(self.log, 'DD allocation', dd='SYSIN'):
+            task_file = file.build_task_file(task, 'cp1047', self.log)
         self.temp_files.append(task_file)
-        self.create_DD_file('SYSIN', task_file)
+        self.create_DD_file('SYSIN', task_file, DD_list)
         return
 
 
@@ -254,6 +569,9 @@ class Job():
         self.log.info(f'   home: {self.env_home}')
         self.log.info(f'   log path: {self.env_home_log_path}')
         self.log.info(f'   spool path: {self.env_home_spool_path}')
+        self.log.info(f'   manifest path: {self.env_home_manifest_path}')
+        for opt_key, opt_val in self.spool_opts.items():
+            self.log.info(f'   spool output {opt_key}: {opt_val}')
         self.log.loglog()
         self.log.info(f'Application: {self.appl_name}')
         self.log.info('   args:')
@@ -266,6 +584,9 @@ class Job():
         self.log.info('   Temp dataset names:')
         for temp_ds in self.temp_datasets:
             self.log.info(f'      {temp_ds}')
+        self.log.info('   Pooled spool dataset names:')
+        for pooled_ds in self.pooled_datasets:
+            self.log.info(f'      {pooled_ds}')
         self.log.info('   Temp file names:')
         for temp_file in self.temp_files:
             self.log.info(f'      {temp_file}')
@@ -0,0 +1,192 @@
+"""
+  ledger.py - a record of the temporary resources each ztron process owns.
+
+    Every process appends to a ledger file of its own, named for its process id
+    and host, so no locking is needed.  Each line is a JSON record that either
+    claims a resource when it is created, or releases it once it has been
+    deleted or handed off to something that manages it from then on (like a
+    spool pool).  A resource that is still claimed in the ledger of a process
+    that is no longer running is an orphan, and can be reaped.  Once a process
+    has released everything it claimed, its ledger is removed, so ledgers of
+    processes that end cleanly, or of a daemon between jobs, don't pile up.
+
+    The reaper deletes what the ledgers name, so the ledger directory is only
+    used if it belongs to the user and nobody else can get in (see
+    util.private_dir()).  Otherwise nothing is written to it or read from it.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, sys, json, glob, time, threading
+
+from ztron.uss.user import get_userid
+from ztron.util import private_dir
+
+# Kinds of resources kept in the ledger.
+DATASET = 'dataset'
+FILE = 'file'
+
+_lock = threading.Lock()
+
+# What this process has claimed and not released yet.
+_owned = set()
+
+# Ledger directories this process has already warned about.
+_refused = set()
+
+
+def get_ledger_path(userid: str=None) -> str:
+    """
+    The directory that holds the ledger files for a userid.
+    """
+    if userid is None:
+        userid = get_userid()
+    return os.environ.get('ZTRON_LEDGER_PATH', f'/tmp/{userid}_ZTLEDGER')
+
+
+def get_ledger_file_name(ledger_path: str=None) -> str:
+    """
+    The ledger file of this process.
+    """
+    if ledger_path is None:
+        ledger_path = get_ledger_path()
+    return f'{ledger_path}/{os.uname().nodename}_{os.getpid()}.jsonl'
+
+
+def check_ledger_path(ledger_path: str, create: bool=True) -> bool:
+    """
+    Check that a ledger directory can be trusted, creating it if it isn't
+    there, and warn the first time one can't.
+    """
+    if private_dir(ledger_path, create):
+        return True
+    if ledger_path not in _refused:
+        _refused.add(ledger_path)
+        sys.stderr.write(f'ztron: not using ledger directory {ledger_path}, since it '
+                         f'must belong to {get_userid()} with no access for others\n')
+    return False
+
+
+def append(action: str, kind: str, name: str, file_name: str=None) -> None:
+    if file_name is None:
+        file_name = get_ledger_file_name()
+    with _lock:
+        write_record(action, kind, name, file_name)
+    return
+
+
+def write_record(action: str, kind: str, name: str, file_name: str) -> None:
+    if not check_ledger_path(os.path.dirname(file_name)):
+        return
+    record = {'action': action, 'kind': kind, 'name': name, 'ts': time.time()}
+    with open(file_name, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+    return
+
+
+def claim(kind: str, name: str) -> None:
+    """
+    Record that this process created a temporary resource.
+
+    Params:
+        kind: DATASET or FILE
+        name: The dataset name or absolute file path.
+    """
+    with _lock:
+        write_record('claim', kind, name, get_ledger_file_name())
+        _owned.add((kind, name))
+    return
+
+
+def release(kind: str, name: str) -> None:
+    """
+    Record that this process no longer owns a resource.  When it was the last
+    thing the process owned, the ledger is removed instead.
+
+    Params:
+        kind: DATASET or FILE
+        name: The dataset name or absolute file path.
+    """
+    with _lock:
+        _owned.discard((kind, name))
+        file_name = get_ledger_file_name()
+        if len(_owned) > 0:
+            write_record('release', kind, name, file_name)
+        elif private_dir(os.path.dirname(file_name), create=False):
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+    return
+
+
+def read_ledger(file_name: str) -> dict:
+    """
+    Read a ledger file.
+
+    Params:
+        file_name: The ledger file to read.
+    Returns:
+        A dictionary of (kind, name) to claim time, for the resources that are
+        claimed and not released.
+    """
+    owned = {}
+    with open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of a process that was killed mid-write.
+                continue
+            key = (record['kind'], record['name'])
+            if record['action'] == 'claim':
+                owned[key] = record['ts']
+            else:
+                owned.pop(key, None)
+    return owned
+
+
+def list_ledgers(ledger_path: str=None) -> list:
+    """
+    List all of the ledger files for a userid, with the process that owns each.
+
+    Returns:
+        A list of (file name, host name, process id) tuples.  The list is
+        empty if the ledger directory can't be trusted.
+    """
+    if ledger_path is None:
+        ledger_path = get_ledger_path()
+    if not os.path.exists(ledger_path) or not check_ledger_path(ledger_path, create=False):
+        return []
+    ledgers = []
+    for file_name in glob.glob(f'{ledger_path}/*.jsonl'):
+        host, _, pid = os.path.basename(file_name).removesuffix('.jsonl').rpartition('_')
+        if pid.isdigit():
+            ledgers.append((file_name, host, int(pid)))
+    return ledgers
+
+
+def owner_alive(host: str, pid: int) -> bool:
+    """
+    Is the process that owns a ledger still running?  Processes on other hosts
+    can't be checked, so they are taken to be alive.
+    """
+    if host != os.uname().nodename:
+        return True
+    return pid_alive(pid)
+
+
+def pid_alive(pid: int) -> bool:
+    """
+    Is a process on this host still running?
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
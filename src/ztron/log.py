@@ -15,6 +15,15 @@
                 the application.  Avoids cleaning up any resources allocated during 
                 the run of the application.
 
+    A log is written synchronously, on the thread that logs each message, unless
+    it is given queue options.  Then the messages are queued and written out in
+    batches by a thread of their own (see log_queue.py).  Either way, close()
+    writes out everything that has been logged.
+
+    With rotation options, the log file is rotated when it reaches max_bytes,
+    rotated and closed logs are compressed in the background, and the logs of
+    old runs are pruned when a new one starts (see log_archive.py).
+
     These log levels match those of the Python logging module.  This code 
     implements the processing model of the logging module.  Please see the logging
     facility for Python for more information:
@@ -26,16 +35,27 @@
 
   SPDX-License-Identifier: Apache-2.0
 """
-import subprocess, time, os, sys
+import time, os, sys
 import logging as pylogging
 
 
 class Log:
-    def __init__(self, log_name, log_path, log_type, logger_name):
+    def __init__(self, log_name, log_path, log_type, logger_name, queue_opts=None,
+                 events=False, rotation_opts=None):
         self.logger = None
         self.log_name = log_name
         self.log_path = log_path
         self.logger_name = logger_name
+        self.queue_opts = queue_opts
+        self.queue_handler = None
+        self.listener = None
+        self.events = None
+        self.metrics = None
+        self.tracer = None
+        self.backend = None
+        self.rotation_opts = rotation_opts
+        self.run_lock = None
+        started = time.time()
 
         # Wrap the Python logging levels with mnemonics.
         self.log_types = {}
@@ -59,31 +79,124 @@ class Log:
             sys.stderr.write('Error - log path is not valid')
             raise
 
-        # Timestamp the log file name, preserving the '.log' suffix.
-        self.log_name = log_name.removesuffix('.log') + '_' + time.strftime('%Y%m%d-%H%M%S') + '.log'
-        self.full_log_name = self.log_path + '/' + self.log_name
-
-        # Make sure we don't overwrite a log that already exists.
+        # Create the log directory in process, since starting a shell to do 
+        # it is slow on z/OS.
         if self.log_path != '':
             if not os.path.exists(self.log_path):
                 try:
-                    cp = subprocess.run(args=['mkdir', '-p', self.log_path])
-                    cp.check_returncode()
+                    os.makedirs(self.log_path, exist_ok=True)
 
                 except:
-                    sys.stderr.write('---- subprocess run exception')
+                    sys.stderr.write(f'---- failed to create log path {self.log_path}')
                     raise
 
+        # Timestamp the log file name, preserving the '.log' suffix.  Make sure
+        # we don't overwrite a log that already exists, like one from another
+        # job started in the same second.
+        prefix = log_name.removesuffix('.log')
+        stem = prefix + '_' + time.strftime('%Y%m%d-%H%M%S')
+        if self.rotation_opts == None:
+            self.log_name = self.reserve_log_name(stem)
+        else:
+            # Make room for this run's log by deleting the logs of old runs,
+            # and lock this run's log until it's closed, so other jobs logging
+            # here don't prune it.  Other jobs can prune and start runs at the
+            # same time, so both are done under the lock of the directory.
+            # The name can't be that of a run that was just pruned, or one
+            # that's been compressed, either.
+            from ztron import log_archive
+            with log_archive.directory_lock(self.log_path, prefix):
+                keep = self.rotation_opts.get('keep')
+                pruned = log_archive.prune_runs(self.log_path, prefix,
+                                                None if keep == None else keep - 1,
+                                                self.rotation_opts.get('max_age_days'),
+                                                started)
+                self.log_name = self.reserve_log_name(stem, pruned)
+                self.run_lock = log_archive.lock_run(self.log_path,
+                                                     self.log_name.removesuffix('.log'))
+        self.full_log_name = self.log_path + '/' + self.log_name
+
         self.logger = self.create_logger(self.full_log_name, self.logger_name)
+
+        # The event log goes next to the log file, with the same name.
+        if events:
+            from ztron.events import EventLog
+            self.events = EventLog(self.full_log_name.removesuffix('.log') + '.events.jsonl')
+        return
+
+    def reserve_log_name(self, stem, taken=()):
+        n = 0
+        while True:
+            run = stem + ('' if n == 0 else f'_{n}')
+            log_name = run + '.log'
+            if run in taken:
+                n += 1
+                continue
+            try:
+                os.close(os.open(self.log_path + '/' + log_name, 
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            except FileExistsError:
+                n += 1
+                continue
+            if not os.path.exists(self.log_path + '/' + log_name + '.gz'):
+                return log_name
+            os.remove(self.log_path + '/' + log_name)
+            n += 1
+
+    def flush(self):
+        # Wait for everything logged so far to be written out.
+        if self.listener != None:
+            self.listener.queue.join()
+        for handler in self.logger.handlers:
+            handler.flush()
+        if self.events != None:
+            self.events.flush()
+        return
+
+    def close(self):
+        # Flush and close the log file.  Nothing is logged after this.
+        if self.listener != None:
+            self.listener.stop()
+            if self.queue_handler.dropped > 0:
+                self.listener.write([self.logger.makeRecord(
+                    self.logger_name, pylogging.WARNING, '', 0,
+                    f'{self.queue_handler.dropped} log messages were dropped '
+                    f'because the log queue was full', None, None)])
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        for handler in list(self.logger.handlers):
+            handler.close()
+            self.logger.removeHandler(handler)
+        if self.events != None:
+            self.events.close()
+        if self.run_lock != None:
+            from ztron import log_archive
+            log_archive.unlock_run(self.run_lock)
+            self.run_lock = None
+
+        # The log is finished, so compress it, off the job's thread.
+        if (self.rotation_opts != None) and self.rotation_opts.get('compress', True):
+            from ztron import log_archive
+            log_archive.compress_in_background(self.full_log_name)
+        return
+
+    def event(self, event, **fields):
+        # Write a record to the event log, if there is one.
+        if self.events != None:
+            self.events.emit(event, **fields)
         return
 
     def create_logger(self, log_name, logger_name):
-        pylogger = pylogging.getLogger(logger_name)
+        # Every Log gets a logger of its own, rather than the shared one that
+        # getLogger() would return for the name, so that jobs running in the
+        # same process don't write to each other's log files.
+        pylogger = pylogging.Logger(logger_name)
         pylogger.setLevel(self.log_level)
 
         pylogging_cons = pylogging.StreamHandler()
         pylogging_cons.setLevel(self.log_level)
-        pylogging_file = pylogging.FileHandler(self.full_log_name, mode='a', encoding='utf-8')
+        pylogging_file = self.create_file_handler()
         pylogging_file.setLevel(self.log_level)
 
         pylogging_fmt = pylogging.Formatter(fmt='%(name)s %(levelname)s: %(message)s',
@@ -91,10 +204,35 @@ class Log:
         pylogging_cons.setFormatter(pylogging_fmt)
         pylogging_file.setFormatter(pylogging_fmt)
 
-        pylogger.addHandler(pylogging_cons)
-        pylogger.addHandler(pylogging_file)
+        if self.queue_opts == None:
+            pylogger.addHandler(pylogging_cons)
+            pylogger.addHandler(pylogging_file)
+            return pylogger
+
+        # Asynchronous mode - the logger only queues each message, and the
+        # listener writes them to the console and the file.
+        import queue
+        from ztron import log_queue
+        message_queue = queue.Queue(self.queue_opts.get('size', log_queue.DEFAULT_QUEUE_SIZE))
+        self.queue_handler = log_queue.OverflowQueueHandler(message_queue,
+                                                            self.queue_opts.get('overflow', log_queue.OVERFLOW_BLOCK))
+        self.listener = log_queue.BatchListener(message_queue,
+                                                [pylogging_cons, pylogging_file],
+                                                self.queue_opts.get('batch', log_queue.DEFAULT_BATCH_SIZE))
+        self.listener.start()
+        pylogger.addHandler(self.queue_handler)
         return pylogger
 
+    def create_file_handler(self):
+        if (self.rotation_opts == None) or (self.rotation_opts.get('max_bytes') == 0):
+            return pylogging.FileHandler(self.full_log_name, mode='a', encoding='utf-8')
+
+        from ztron import log_archive
+        return log_archive.create_rotating_handler(self.full_log_name,
+                                                   self.rotation_opts.get('max_bytes', log_archive.DEFAULT_MAX_BYTES),
+                                                   self.rotation_opts.get('backup_count', log_archive.DEFAULT_BACKUP_COUNT),
+                                                   self.rotation_opts.get('compress', True))
+
     # logger method wrappers
     def info(self, fmt, args=None):
         if args == None:
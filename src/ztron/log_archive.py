@@ -0,0 +1,289 @@
+"""
+  log_archive.py - keep the log directory of a job from growing without end.
+
+    Three things bound the disk a log directory uses:
+
+        rotation - a log file that reaches max_bytes is renamed to <log>.1, the
+                   one before that to <log>.2, and so on, keeping backup_count
+                   of them.  Compressed, they are <log>.1.gz and so on.
+        compression - rotated files, and a log once it's closed, are gzipped
+                      on a thread of their own, so the job doesn't wait.
+        retention - when a job starts, the logs of old runs are deleted,
+                    keeping the newest keep runs and none older than
+                    max_age_days.
+
+    The files of one run all start with the same name (ztron_20261018-085327)
+    and differ only in their suffixes (.log, .log.1.gz, .events.jsonl, ...),
+    so a run is found and deleted as a group with a single scan of the
+    directory.  open_log() and read_run() read a log whether it's been
+    compressed or not.
+
+    Every job in a directory can log under the same name, so runs are
+    pruned while other jobs are writing theirs.  A run holds a lock on its
+    <run>.lock file until its log is closed, and runs that are locked, or
+    that were written after the pruning job started, are never deleted.
+    Pruning and picking the name of a new run both hold the lock of the
+    directory, so a run can't be created while the directory is pruned.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, time, fcntl, itertools, threading
+from contextlib import contextmanager
+
+DEFAULT_MAX_BYTES = 10*1024*1024
+DEFAULT_BACKUP_COUNT = 5
+
+# Compression runs on one thread for the whole process.  concurrent.futures
+# waits for it at exit, so nothing is left half compressed.
+_compressor = None
+_compressor_lock = threading.Lock()
+_pending_seq = itertools.count()
+
+
+def compress_file(file_name: str, dest_name: str=None) -> None:
+    """
+    Gzip a file and remove the original.  The compressed file is written
+    under a temporary name and moved into place when it's complete.
+    """
+    import gzip, shutil
+
+    if dest_name is None:
+        dest_name = file_name + '.gz'
+    temp_name = f'{dest_name}.{os.getpid()}.tmp'
+    try:
+        with open(file_name, 'rb') as f_in, gzip.open(temp_name, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(temp_name, dest_name)
+        os.remove(file_name)
+    except OSError:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+    return
+
+
+def _submit(fn, *args):
+    global _compressor
+    from concurrent.futures import ThreadPoolExecutor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ztron-compress')
+    return _compressor.submit(fn, *args)
+
+
+def compress_in_background(file_name: str, dest_name: str=None):
+    return _submit(compress_file, file_name, dest_name)
+
+
+def wait_for_compression() -> None:
+    # Wait for all of the compression submitted so far.
+    if _compressor is not None:
+        _submit(lambda: None).result()
+    return
+
+
+def rotate_compressed(file_name: str, pending: str, backup_count: int) -> None:
+    """
+    Shift <log>.1.gz to <log>.2.gz and so on, and compress a rotated log to
+    <log>.1.gz.  Runs on the compression thread, so that a shift never
+    overtakes the compression of the file before it.
+    """
+    for i in range(backup_count - 1, 0, -1):
+        source = f'{file_name}.{i}.gz'
+        if os.path.exists(source):
+            os.replace(source, f'{file_name}.{i + 1}.gz')
+    compress_file(pending, f'{file_name}.1.gz')
+    return
+
+
+def create_rotating_handler(file_name: str, max_bytes: int, backup_count: int,
+                            compress: bool=True):
+    """
+    Create a logging handler that rotates its file when it reaches max_bytes.
+    With compress, the file is only renamed when it's rotated, so the job
+    carries on right away, and the rotated files are gzipped in the
+    background.
+    """
+    from logging.handlers import RotatingFileHandler
+
+    class CompressingRotatingFileHandler(RotatingFileHandler):
+        def doRollover(self):
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            pending = f'{self.baseFilename}.{next(_pending_seq)}.pending'
+            os.rename(self.baseFilename, pending)
+            _submit(rotate_compressed, self.baseFilename, pending, self.backupCount)
+            self.stream = self._open()
+            return
+
+    handler_class = CompressingRotatingFileHandler if compress else RotatingFileHandler
+    return handler_class(file_name, mode='a', encoding='utf-8',
+                         maxBytes=max_bytes, backupCount=max(1, backup_count))
+
+
+def open_log(file_name: str, mode: str='rt'):
+    """
+    Open a log file for reading, whether it's gzipped or not.
+    """
+    if file_name.endswith('.gz'):
+        import gzip
+        return gzip.open(file_name, mode, encoding='utf-8', errors='replace')
+    return open(file_name, mode, encoding='utf-8', errors='replace')
+
+
+def run_files(log_path: str, run: str) -> list:
+    """
+    The log files of a run, oldest first: <run>.log.N[.gz] down to
+    <run>.log.1[.gz], then <run>.log[.gz].
+    """
+    segments = []
+    for entry in os.scandir(log_path):
+        name = entry.name
+        if not name.startswith(run + '.log'):
+            continue
+        rest = name[len(run + '.log'):].removesuffix('.gz')
+        if rest == '':
+            segments.append((0, entry.path))
+        elif rest[1:].isdigit():
+            segments.append((int(rest[1:]), entry.path))
+    return [path for _, path in sorted(segments, reverse=True)]
+
+
+def read_run(log_path: str, run: str):
+    """
+    Read all of the lines logged by a run, in order, across rotated and
+    compressed files.
+
+    Params:
+        log_path: The log directory.
+        run: The name the run's files start with, like ztron_20261018-085327.
+    Returns:
+        An iterator over the lines, without line endings.
+    """
+    for file_name in run_files(log_path, run):
+        with open_log(file_name) as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+
+def list_runs(log_path: str, prefix: str) -> dict:
+    """
+    Find the runs in a log directory, with a single scan.
+
+    Returns:
+        A dictionary of run name to (newest mtime, list of file paths).
+    """
+    runs = {}
+    try:
+        entries = list(os.scandir(log_path))
+    except FileNotFoundError:
+        return runs
+    for entry in entries:
+        if not entry.name.startswith(prefix + '_') or not entry.is_file():
+            continue
+        run = entry.name.split('.', 1)[0]
+        mtime = entry.stat().st_mtime
+        newest, files = runs.get(run, (0.0, []))
+        files.append(entry.path)
+        runs[run] = (max(newest, mtime), files)
+    return runs
+
+
+@contextmanager
+def directory_lock(log_path: str, prefix: str):
+    """
+    Hold the lock of a log directory for a with block.  The lock file doesn't
+    start with <prefix>_, so it's never taken for a run.
+    """
+    with open(os.path.join(log_path, f'.{prefix}.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return
+
+
+def lock_run(log_path: str, run: str, create: bool=True):
+    """
+    Lock a run, so it isn't pruned.
+
+    Params:
+        log_path: The log directory.
+        run: The name the run's files start with.
+        create: Create the lock file if the run doesn't have one.
+    Returns:
+        The open lock file, to pass to unlock_run(), or None if another job
+        holds the lock, or the run has no lock file and create is False.
+    """
+    try:
+        f = open(os.path.join(log_path, run + '.lock'), 'a' if create else 'r')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def unlock_run(f) -> None:
+    # Remove the lock file before giving up the lock, so nothing can lock a
+    # file that's about to go away.
+    try:
+        os.remove(f.name)
+    except OSError:
+        pass
+    fcntl.flock(f, fcntl.LOCK_UN)
+    f.close()
+    return
+
+
+def prune_runs(log_path: str, prefix: str, keep: int=None, max_age_days: float=None,
+               started: float=None) -> list:
+    """
+    Delete the files of old runs.  Runs that are still being written, because
+    their lock is held, are kept.  Hold the directory_lock() around it.
+
+    Params:
+        log_path: The log directory.
+        prefix: The log name the runs start with, like ztron.
+        keep: The most runs to keep.  The newest are kept.
+        max_age_days: Delete runs not written to in this many days.
+        started: When the pruning job started.  Runs written to since then
+                 are kept.
+    Returns:
+        The names of the runs that were deleted.
+    """
+    runs = sorted(list_runs(log_path, prefix).items(), key=lambda item: -item[1][0])
+    now = time.time()
+    deleted = []
+    for i, (run, (newest, files)) in enumerate(runs):
+        too_many = (keep is not None) and (i >= keep)
+        too_old = (max_age_days is not None) and (now - newest > max_age_days*24*60*60)
+        if (not too_many and not too_old) or ((started is not None) and (newest >= started)):
+            continue
+
+        # A run without a lock file was closed, or logged before there were
+        # locks.
+        has_lock = any(file_name.endswith('.lock') for file_name in files)
+        lock = lock_run(log_path, run, create=False) if has_lock else None
+        if has_lock and (lock is None):
+            continue
+        for file_name in files:
+            if not file_name.endswith('.lock'):
+                try:
+                    os.remove(file_name)
+                except OSError:
+                    pass
+        if lock is not None:
+            unlock_run(lock)
+        deleted.append(run)
+    return deleted
@@ -12,8 +12,23 @@ import subprocess, time, os, sys
 
 LEVELS = {'trace': 1, 'info': 2, 'warn': 3, 'err': 4}
 
+# When a log file and the console are flushed:
+#   line - after every record, so output keeps pace with the commands
+#   records - after every flush_records records
+#   interval - at the first record after flush_interval seconds
+#   stage - only at the end of each stage, and when the log is closed
+# Errors are always flushed right away, whatever the policy.
+FLUSH_LINE = 'line'
+FLUSH_RECORDS = 'records'
+FLUSH_INTERVAL = 'interval'
+FLUSH_STAGE = 'stage'
+FLUSH_POLICIES = [FLUSH_LINE, FLUSH_RECORDS, FLUSH_INTERVAL, FLUSH_STAGE]
+DEFAULT_FLUSH_RECORDS = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
 class LogFile:
-    def __init__(self, file_prefix, abs_log_path, log_level):
+    def __init__(self, file_prefix, abs_log_path, log_level, flush_policy=FLUSH_LINE,
+                 flush_records=DEFAULT_FLUSH_RECORDS, flush_interval=DEFAULT_FLUSH_INTERVAL):
         # print('---- Creating log file %s' % (file_prefix))
         self.log_file_prefix = 'cmd_' if file_prefix == None else file_prefix
         self.log_file_name = file_prefix + '_' + time.strftime('%Y%m%d-%H%M%S') + '.log'
@@ -21,6 +36,7 @@ class LogFile:
         self.abs_log_file_path = ''
         self.log_f = None
         self.log_level = log_level
+        self.set_flush_policy(flush_policy, flush_records, flush_interval)
 
         # Caller ensures all pathnames are absolute.
         if self.abs_log_path == None:
@@ -36,47 +52,59 @@ class LogFile:
             raise Exception
         return
 
+    # Format the record once, and write it to the console and the file with
+    # one write each.  Flushing is up to the flush policy.
     def log(self, level, fmt, args):
         if LEVELS[level] >= LEVELS[self.log_level]:
-            self.print(level, fmt, args)
-            self.write(level, fmt, args)
+            line = (fmt if args == None else fmt % args) + '\n'
+            self.print_line(level, line)
+            self.write_line(line)
+            self.pending += 1
+            self.maybe_flush(level)
         return
 
     def print(self, level, fmt, args):
         if LEVELS[level] >= LEVELS[self.log_level]:
-            # This is more complicated than printing, but the flush is needed
-            # to keep output in sync with the command text when running a pipeline.
-            if args == None:
-                if LEVELS[level] >= LEVELS['err']:
-                    sys.stderr.write(fmt)
-                    sys.stderr.write('\n')
-                    sys.stderr.flush()
-                else:
-                    sys.stdout.write(fmt)
-                    sys.stdout.write('\n')
-                    sys.stdout.flush()
-            else:
-                if LEVELS[level] >= LEVELS['err']:
-                    sys.stderr.write(fmt % args)
-                    sys.stderr.write('\n')
-                    sys.stderr.flush()
-                else:
-                    sys.stdout.write(fmt % args)
-                    sys.stdout.write('\n')
-                    sys.stdout.flush()
+            self.print_line(level, (fmt if args == None else fmt % args) + '\n')
         return
 
     def write(self, level, fmt, args):
         if LEVELS[level] >= LEVELS[self.log_level]:
-            if args == None:
-                self.log_f.write(fmt+'\n')
-            else:
-                # Can't seem to accomplish this is 1 write request ...
-                self.log_f.write(fmt % args)
-                self.log_f.write('\n')
+            self.write_line((fmt if args == None else fmt % args) + '\n')
+        return
+
+    def print_line(self, level, line):
+        if LEVELS[level] >= LEVELS['err']:
+            sys.stderr.write(line)
+        else:
+            sys.stdout.write(line)
+        return
+
+    def write_line(self, line):
+        self.log_f.write(line)
+        return
+
+    def maybe_flush(self, level):
+        if (self.flush_policy == FLUSH_LINE) or (LEVELS[level] >= LEVELS['err']):
+            self.flush()
+        elif (self.flush_policy == FLUSH_RECORDS) and (self.pending >= self.flush_records):
+            self.flush()
+        elif (self.flush_policy == FLUSH_INTERVAL) and \
+             (time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+        return
+
+    def flush(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if self.log_f != None:
+            self.log_f.flush()
+        self.pending = 0
+        self.last_flush = time.monotonic()
         return
 
     def cleanup(self):
+        self.flush()
         self.log_f.close()
         self.log_f = None
         return
@@ -84,6 +112,18 @@ class LogFile:
     # Getters
 
     # Setters
+    def set_flush_policy(self, flush_policy, flush_records=DEFAULT_FLUSH_RECORDS,
+                         flush_interval=DEFAULT_FLUSH_INTERVAL):
+        if flush_policy not in FLUSH_POLICIES:
+            print('Error - log flush policy must be one of %s, not %s' %
+                  (', '.join(FLUSH_POLICIES), flush_policy))
+            raise Exception
+        self.flush_policy = flush_policy
+        self.flush_records = max(1, int(flush_records))
+        self.flush_interval = float(flush_interval)
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        return
 
     # Show ourselves
     def show(self):
@@ -94,3 +134,4 @@ class LogFile:
         else:
             print('     log file is closed')
         print('     log level: %s' % (self.log_level))
+        print('     flush policy: %s' % (self.flush_policy))
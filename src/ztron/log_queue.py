@@ -0,0 +1,176 @@
+"""
+  log_queue.py - asynchronous logging for the zTron Log class.
+
+    In asynchronous mode a job thread only puts each record on a queue, and a
+    listener thread writes them out to the console and the log file.  The
+    listener takes all of the records that are waiting, up to a batch at a
+    time, and writes each batch to each handler with a single write and flush,
+    so echoing a large spool dataset costs a few writes instead of one per
+    line.
+
+    The queue is bounded.  When it's full, the overflow policy decides what
+    happens to the next record:
+        block - wait for the listener to make room, so nothing is lost
+        drop - drop the new record
+        drop_oldest - drop the oldest record on the queue to make room
+    Records that are dropped are counted, and the count is logged when the
+    queue is closed.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import queue, atexit, threading
+import logging as pylogging
+from logging.handlers import QueueHandler
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 256
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP = 'drop'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_POLICIES = [OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_DROP_OLDEST]
+
+# Put on the queue to tell the listener to stop.
+_STOP = None
+
+# How long the listener waits for a record before it checks whether it has
+# been told to stop, in case drop_oldest dropped the stop record itself.
+_POLL_SECONDS = 0.25
+
+
+class OverflowQueueHandler(QueueHandler):
+    """
+    A queue handler that applies an overflow policy when the queue is full,
+    instead of reporting an error for every record that doesn't fit.
+    """
+    def __init__(self, log_queue: queue.Queue, overflow: str=OVERFLOW_BLOCK):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        return
+
+
+    def prepare(self, record: pylogging.LogRecord) -> pylogging.LogRecord:
+        # The listener is in the same process, so the record doesn't need to 
+        # be formatted and copied to be put on the queue, the way QueueHandler
+        # does it.  Formatting is left to the listener thread, off the job's.
+        return record
+
+
+    def enqueue(self, record: pylogging.LogRecord) -> None:
+        if self.overflow == OVERFLOW_BLOCK:
+            self.queue.put(record)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == OVERFLOW_DROP:
+                    self.count_dropped()
+                    return
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.count_dropped()
+            except queue.Empty:
+                pass
+
+
+    def count_dropped(self) -> None:
+        with self.dropped_lock:
+            self.dropped += 1
+        return
+
+
+class BatchListener():
+    """
+    Write the records on a queue to a list of handlers, a batch at a time, on
+    a thread of its own.
+    """
+    def __init__(self, log_queue: queue.Queue, handlers: list,
+                 batch_size: int=DEFAULT_BATCH_SIZE):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = max(1, batch_size)
+        self.thread = None
+        self.stopping = threading.Event()
+        return
+
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.monitor,
+                                       name='ztron-log',
+                                       daemon=True)
+        self.thread.start()
+
+        # If the job never closes its log, still write out what's queued
+        # before the process exits.
+        atexit.register(self.stop)
+        return
+
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+        atexit.unregister(self.stop)
+        return
+
+
+    def monitor(self) -> None:
+        while True:
+            try:
+                batch = [self.queue.get(timeout=_POLL_SECONDS)]
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            while (len(batch) < self.batch_size) and (batch[-1] is not _STOP):
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is _STOP
+            records = batch[:-1] if stop else batch
+            if len(records) > 0:
+                self.write(records)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+
+    def write(self, records: list) -> None:
+        for handler in self.handlers:
+            lines = [handler.format(record) + handler.terminator
+                     for record in records if record.levelno >= handler.level]
+            if len(lines) == 0:
+                continue
+            data = ''.join(lines)
+            handler.acquire()
+            try:
+                # A rotating file handler only checks its size when it emits
+                # a record itself, so check it for the batch.
+                max_bytes = getattr(handler, 'maxBytes', 0)
+                if (max_bytes > 0) and (handler.stream is not None):
+                    size = handler.stream.tell()
+                    if (size > 0) and (size + len(data) >= max_bytes):
+                        handler.doRollover()
+                handler.stream.write(data)
+                handler.flush()
+            except Exception:
+                handler.handleError(records[0])
+            finally:
+                handler.release()
+        return
@@ -0,0 +1,268 @@
+"""
+  metrics.py - counters, gauges and latency histograms for a job, exported in
+               the Prometheus text format.
+
+    A job keeps a registry of its metrics, and times each phase of its work
+    in it:
+
+        descriptor_parse - loading and normalizing the job descriptor
+        dataset_allocate - allocating a spool dataset, or taking one from the pool
+        sysin_build - writing a SYSIN task file
+        mvscmd_execute - running a program with ZOAU
+        spool_read - reading a spool dataset
+        cleanup - deleting the job's temporary files and datasets
+
+    as ztron_phase_duration_seconds{phase="..."}, so that when throughput drops
+    the phase that regressed stands out.  At the end of the job the registry is
+    written to a .prom file for the node exporter's textfile collector.  The
+    file is replaced in one rename, so the collector never reads half of it.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, time, threading
+
+# Latency buckets, in seconds, from a fast file write up to a long IEBCOPY.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+PHASE_DESCRIPTOR_PARSE = 'descriptor_parse'
+PHASE_DATASET_ALLOCATE = 'dataset_allocate'
+PHASE_SYSIN_BUILD = 'sysin_build'
+PHASE_MVSCMD_EXECUTE = 'mvscmd_execute'
+PHASE_SPOOL_READ = 'spool_read'
+PHASE_CLEANUP = 'cleanup'
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric():
+    """
+    A metric with a value for each set of label values.  Safe to update from
+    more than one thread.
+    """
+    kind = ''
+
+    def __init__(self, name: str, help: str, label_names: tuple=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+        return
+
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+
+    def samples(self) -> list:
+        # (suffix, labels, value) for every sample of the metric.
+        with self.lock:
+            return [('', dict(zip(self.label_names, key)), value)
+                    for key, value in sorted(self.values.items())]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float=1, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        return
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+        return
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, label_names: tuple=(),
+                 buckets: tuple=DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+        return
+
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            # Bucket counts, sum and count of the observations.
+            counts, total, n = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, n + 1)
+        return
+
+
+    def samples(self) -> list:
+        samples = []
+        with self.lock:
+            items = [(key, (list(counts), total, n))
+                     for key, (counts, total, n) in sorted(self.values.items())]
+        for key, (counts, total, n) in items:
+            labels = dict(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, counts):
+                samples.append(('_bucket', dict(labels, le=format_value(float(bound))), count))
+            samples.append(('_bucket', dict(labels, le='+Inf'), n))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, n))
+        return samples
+
+
+class _PhaseTimer():
+    # Time a with block as a phase, counting it as an error if it raises.
+    def __init__(self, registry: 'Registry', phase: str):
+        self.registry = registry
+        self.phase = phase
+        self.start = None
+        return
+
+    def __enter__(self) -> '_PhaseTimer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.registry.phase_seconds.observe(time.perf_counter() - self.start, phase=self.phase)
+        if exc_type is not None:
+            self.registry.phase_errors.inc(phase=self.phase)
+        return False
+
+
+class _NoTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Registry():
+    """
+    The metrics of a job.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.phase_seconds = self.histogram('ztron_phase_duration_seconds',
+                                            'Time spent in each phase of a job', ('phase',))
+        self.phase_errors = self.counter('ztron_phase_errors_total',
+                                         'Phases that ended with an exception', ('phase',))
+        return
+
+
+    def register(self, metric_class, name: str, help: str, label_names: tuple=(), **kwargs) -> Metric:
+        # Registering a metric that's already there returns the one there.
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, help, label_names, **kwargs)
+            return self.metrics[name]
+
+
+    def counter(self, name: str, help: str, label_names: tuple=()) -> Counter:
+        return self.register(Counter, name, help, label_names)
+
+
+    def gauge(self, name: str, help: str, label_names: tuple=()) -> Gauge:
+        return self.register(Gauge, name, help, label_names)
+
+
+    def histogram(self, name: str, help: str, label_names: tuple=(),
+                  buckets: tuple=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram, name, help, label_names, buckets=buckets)
+
+
+    def time(self, phase: str) -> _PhaseTimer:
+        """
+        Time a with block as a phase of the job.
+        """
+        return _PhaseTimer(self, phase)
+
+
+    def to_text(self, labels: dict=None) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+
+        Params:
+            labels: Labels to add to every sample, like the job name.
+        """
+        labels = labels or {}
+        lines = []
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            samples = metric.samples()
+            if len(samples) == 0:
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, sample_labels, value in samples:
+                lines.append(f'{metric.name}{suffix}{format_labels(dict(labels, **sample_labels))} '
+                             f'{format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+    def export(self, file_name: str, labels: dict=None) -> None:
+        """
+        Write the metrics to a file for the node exporter's textfile collector.
+        The file is written under a temporary name and renamed, since the
+        collector can read it at any time.
+        """
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        temp_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_name, 'w', encoding='utf-8') as f:
+                f.write(self.to_text(labels))
+            os.replace(temp_name, file_name)
+        except OSError:
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+            raise
+        return
+
+
+def phase(log, name: str):
+    """
+    Time a with block as a phase in the metrics of the job a log belongs to.
+    Does nothing for a log without metrics, or no log at all.
+
+    Params:
+        log: The job's Log.
+        name: The phase, like metrics.PHASE_MVSCMD_EXECUTE.
+    """
+    registry = getattr(log, 'metrics', None)
+    if registry is None:
+        return _NO_TIMER
+    return registry.time(name)
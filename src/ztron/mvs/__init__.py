@@ -1,5 +1,8 @@
 __all__ = [
+    'backend',                # MVS operations backends
     'command',                # command execution
     'dataset',                # MVS dataset utilities
+    'pds',                    # PDS member copy routines
+    'simulator',              # local filesystem MVS simulator backend
     'spool'                   # spool file management routines
 ]
\ No newline at end of file
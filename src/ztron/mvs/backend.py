@@ -0,0 +1,343 @@
+"""
+  backend.py - the MVS operations ztron runs, behind one interface.
+
+    ztron doesn't call ZOAU directly.  It runs programs, and creates, reads
+    and deletes datasets, through a backend:
+
+        zoau - ZOAU on z/OS.  The default.
+        simulator - datasets are files in a local directory, and programs
+                    only take time and write spool (see simulator.py).  For
+                    benchmarks and load tests without an LPAR.
+
+    The backend is picked by the ZTRON_BACKEND environment variable, or else
+    by the backend setting in the environment section of the job descriptor:
+
+        backend: simulator
+
+        backend:
+          name: simulator
+          path: /tmp/ztsim
+          execute_ms: 20
+
+    The environment variable wins, so a production descriptor can be load
+    tested as it is.  Each job runs on the backend of its own descriptor, 
+    which it carries on its log the way it carries its metrics, so jobs
+    running side by side in one process don't change each other's backend.
+    Jobs with the same settings share one backend.  Work done outside of a
+    job, like the reaper's, runs on ZTRON_BACKEND or ZOAU.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, threading
+from collections.abc import Iterator
+
+from ztron.util import LazyModule
+
+BACKEND_ZOAU = 'zoau'
+BACKEND_SIMULATOR = 'simulator'
+BACKENDS = [BACKEND_ZOAU, BACKEND_SIMULATOR]
+
+# The DSNTYPEs of partitioned datasets.  A PDSE is a LIBRARY.
+DSNTYPE_PDS = 'PDS'
+DSNTYPE_PDSE = 'LIBRARY'
+
+# The backends made so far, by their settings.
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class Backend():
+    """
+    The MVS operations a backend provides.
+    """
+    name = ''
+
+    def execute(self, pgm: str, dds: list) -> dict:
+        """
+        Run a program.
+
+        Params:
+            pgm: The program to run, like 'IEBCOPY'.
+            dds: The DDs of the program, made by dataset_dd() and file_dd().
+        Returns:
+            A dictionary of the results, with the program's rc in 'rc'.
+        """
+        raise NotImplementedError
+
+
+    def create(self, name: str, type: str='SEQ', **parms) -> dict:
+        # Create a dataset, and return its attributes, including its name.
+        raise NotImplementedError
+
+
+    def read(self, name: str, tail: int=0) -> str:
+        # Read a dataset or member, or just its last tail lines.  None if
+        # there's no such dataset.
+        raise NotImplementedError
+
+
+    def delete(self, name: str) -> int:
+        # Delete a dataset.  Returns 0, or raises, if it can't be deleted.
+        raise NotImplementedError
+
+
+    def empty(self, name: str) -> None:
+        # Throw away the contents of a sequential dataset, but keep it.
+        raise NotImplementedError
+
+
+    def tmp_name(self, hlq: str) -> str:
+        # A dataset name, under hlq, that isn't in use.
+        raise NotImplementedError
+
+
+    def list_datasets(self, pattern: str) -> list:
+        raise NotImplementedError
+
+
+    def created(self, name: str) -> float:
+        # When a dataset was created, as a time.time() value, or None if the
+        # backend can't tell.
+        return None
+
+
+    def dsntype(self, name: str) -> str:
+        # The DSNTYPE of a partitioned dataset, DSNTYPE_PDS or DSNTYPE_PDSE, or
+        # None if it isn't one, isn't there, or the backend can't tell.
+        return None
+
+
+    def list_members(self, pds_name: str) -> list:
+        raise NotImplementedError
+
+
+    def member_stats(self, pds_name: str) -> dict:
+        """
+        The directory statistics of the members of a PDS, like the ISPF
+        change date and size, without reading the members.
+
+        Returns:
+            A dictionary of member name to a string that changes whenever the
+            member does, or an empty dictionary if the backend can't tell.
+        """
+        return {}
+
+
+    def delete_members(self, pattern: str) -> None:
+        raise NotImplementedError
+
+
+    def stream(self, name: str) -> Iterator[str]:
+        # Read a dataset a line at a time, without holding it all in memory.
+        raise NotImplementedError
+
+
+    def dataset_dd(self, name: str, dataset_name: str):
+        raise NotImplementedError
+
+
+    def file_dd(self, name: str, file_name: str):
+        raise NotImplementedError
+
+
+    def warm_up(self) -> None:
+        # Do the work of the first call ahead of time, for a daemon.
+        return
+
+
+class ZoauBackend(Backend):
+    """
+    MVS operations run by ZOAU.
+    """
+    name = BACKEND_ZOAU
+
+    def __init__(self):
+        self.datasets = LazyModule('zoautil_py.datasets')
+        self.mvscmd = LazyModule('zoautil_py.mvscmd')
+        self.ztypes = LazyModule('zoautil_py.ztypes')
+        return
+
+
+    def execute(self, pgm: str, dds: list) -> dict:
+        return self.mvscmd.execute(pgm=pgm, dds=dds).to_dict()
+
+
+    def create(self, name: str, type: str='SEQ', **parms) -> dict:
+        return self.datasets.create(name, type, **parms).to_dict()
+
+
+    def read(self, name: str, tail: int=0) -> str:
+        if tail > 0:
+            return self.datasets.read(name, tail=tail)
+        return self.datasets.read(name)
+
+
+    def delete(self, name: str) -> int:
+        return self.datasets.delete(name)
+
+
+    def empty(self, name: str) -> None:
+        # Writing without append replaces what's there.
+        self.datasets.write(name, '', append=False)
+        return
+
+
+    def tmp_name(self, hlq: str) -> str:
+        return self.datasets.tmp_name(hlq)
+
+
+    def listing(self, pattern: str) -> list:
+        # ZOAU 1.3 renamed listing() to list_datasets().
+        if hasattr(self.datasets, 'list_datasets'):
+            found = self.datasets.list_datasets(pattern)
+        else:
+            found = self.datasets.listing(pattern)
+        return found or []
+
+
+    def list_datasets(self, pattern: str) -> list:
+        return [ds.name if hasattr(ds, 'name') else str(ds) for ds in self.listing(pattern)]
+
+
+    def created(self, name: str) -> float:
+        # The catalog only has the day a dataset was created (CREATION----
+        # yyyy.ddd in LISTCAT ALL).  Take the end of that day, so a dataset is
+        # never taken for older than it is.
+        import re, subprocess, datetime
+        try:
+            proc = subprocess.run(['tsocmd', f"LISTCAT ENTRIES('{name}') ALL"],
+                                  capture_output=True, text=True, errors='replace')
+        except OSError:
+            return None
+        m = re.search(r'CREATION-+(\d{4})\.(\d{3})', proc.stdout)
+        if (proc.returncode != 0) or (m is None):
+            return None
+        day = datetime.datetime(int(m.group(1)), 1, 1) + datetime.timedelta(days=int(m.group(2)))
+        return day.timestamp()
+
+
+    def dsntype(self, name: str) -> str:
+        # The listing has the DSORG of a dataset, which is PO-E for a PDSE.
+        for ds in self.listing(name):
+            if getattr(ds, 'name', '').upper() == name.upper():
+                dsorg = str(getattr(ds, 'dsorg', '') or '').upper()
+                return {'PO': DSNTYPE_PDS, 'PO-E': DSNTYPE_PDSE}.get(dsorg)
+        return None
+
+
+    def list_members(self, pds_name: str) -> list:
+        return self.datasets.list_members(pds_name) or []
+
+
+    def member_stats(self, pds_name: str) -> dict:
+        # mls -l lists each member with its ISPF statistics, when the member
+        # has them.  Members without them are left out, so they get read.
+        import subprocess
+        try:
+            proc = subprocess.run(['mls', '-l', pds_name], capture_output=True,
+                                  text=True, errors='replace')
+        except OSError:
+            return {}
+        if proc.returncode != 0:
+            return {}
+        stats = {}
+        for line in proc.stdout.splitlines():
+            fields = line.split()
+            if len(fields) > 1:
+                stats[fields[0].upper()] = ' '.join(fields[1:])
+        return stats
+
+
+    def delete_members(self, pattern: str) -> None:
+        self.datasets.delete_members(pattern)
+        return
+
+
+    def stream(self, name: str) -> Iterator[str]:
+        # The ZOAU dcat utility writes the dataset to a pipe as it goes.
+        import subprocess
+        proc = subprocess.Popen(['dcat', name],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                text=True,
+                                errors='replace')
+        try:
+            for line in proc.stdout:
+                yield line.rstrip('\n')
+        finally:
+            # The caller may stop early, so don't wait for dcat to finish the dataset.
+            if proc.poll() is None:
+                proc.terminate()
+            proc.stdout.close()
+            proc.wait()
+
+
+    def dataset_dd(self, name: str, dataset_name: str):
+        return self.ztypes.DDStatement(name, self.ztypes.DatasetDefinition(dataset_name))
+
+
+    def file_dd(self, name: str, file_name: str):
+        return self.ztypes.DDStatement(name, self.ztypes.FileDefinition(file_name))
+
+
+    def warm_up(self) -> None:
+        import sys, importlib
+        for module in ('zoautil_py.mvscmd', 'zoautil_py.datasets', 'zoautil_py.ztypes'):
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                sys.stderr.write(f'ztron: {module} not available: {e}\n')
+        return
+
+
+def create_backend(opts: dict) -> Backend:
+    """
+    Create a backend.
+
+    Params:
+        opts: The name of the backend in 'name', and its settings.
+    """
+    name = opts.get('name', BACKEND_ZOAU)
+    if name == BACKEND_ZOAU:
+        return ZoauBackend()
+    if name == BACKEND_SIMULATOR:
+        from ztron.mvs.simulator import SimulatorBackend
+        return SimulatorBackend(**{key: value for key, value in opts.items() if key != 'name'})
+    raise ValueError(f"Backend {name} must be one of {', '.join(BACKENDS)}")
+
+
+def select(opts: dict=None) -> Backend:
+    """
+    Get the backend for a job's settings, unless ZTRON_BACKEND picks one.
+    Only the first job with a given set of settings creates its backend.
+
+    Params:
+        opts: The backend settings of a job descriptor, or None for the
+              default.
+    Returns:
+        The backend.
+    """
+    if 'ZTRON_BACKEND' in os.environ:
+        opts = {'name': os.environ['ZTRON_BACKEND'].lower()}
+    elif opts is None:
+        opts = {'name': BACKEND_ZOAU}
+    key = repr(sorted(opts.items()))
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = create_backend(opts)
+        return _backends[key]
+
+
+def get_backend(log=None) -> Backend:
+    """
+    The backend of the job that a log belongs to, or the default backend if
+    there's no log, or it doesn't have one.
+    """
+    backend = getattr(log, 'backend', None)
+    if backend is None:
+        backend = select()
+    return backend
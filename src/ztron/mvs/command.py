@@ -1,51 +1,124 @@
-from zoautil_py import mvscmd
-from zoautil_py import datasets
+import time
 
+from ztron import metrics
+from ztron import trace
+from ztron.events import timing
 from ztron.log import Log
+from ztron.mvs import spool
+from ztron.mvs.backend import get_backend
 
 
-def run(cmd:str='', DD_list:list=[], log:Log=None) -> dict:
+def run(cmd:str='', DD_list:list=[], log:Log=None, spool_opts:dict=None) -> dict:
     '''
     Run an mvs command.
 
     Params:
         command: The MVS command to execute
         DD_list: List of Data Definitions (DDs) to reference
+        spool_opts: When to log the spool dataset (policy), and how much of
+                    it (head, tail, max_lines)
     Returns:
-        results: A dictionary of results from the job
+        results: A dictionary of results from the job.  Unless the spool 
+                 policy is 'never', results['spool'] is a SpoolOutput that
+                 reads the spool dataset the first time it is used.
     ''' 
+    start = time.time()
+    with trace.span(log, 'command', pgm=cmd):
+        results = execute(cmd, DD_list, log, spool_opts)
+        cmd_show_results(results, DD_list, log, spool_opts)
+    log_event(log, 'command', cmd, DD_list, results, start)
+    return results
+
+
+def execute(cmd:str='', DD_list:list=[], log:Log=None, spool_opts:dict=None) -> dict:
+    '''
+    Run an mvs command without logging its results, for callers that run 
+    commands side by side and log the results afterwards.  See run().
+    '''
     results = {}
 
+    start = time.time()
     try:
-        results = mvscmd.execute(pgm=cmd, dds=DD_list).to_dict()
+        with metrics.phase(log, metrics.PHASE_MVSCMD_EXECUTE), \
+             trace.span(log, 'mvscmd.execute', pgm=cmd):
+            results = get_backend(log).execute(cmd, DD_list)
     except Exception as e:
+        # Exceptions have no message attribute; their repr has the type and args.
         log.error(f'Failed to run {cmd} command')
-        log.error(f'{e.message}')
-        log.error(f'{e.args}')
+        log.error(f'{e!r}')
+    log_event(log, 'mvscmd', cmd, DD_list, results, start)
+    count_command(log, cmd, results)
 
-    cmd_show_results(results, DD_list, log)
+    if spool_opts is None:
+        spool_opts = {}
+    spool_ds = get_spool_dataset(DD_list)
+    if (spool_ds is not None) and (spool_opts.get('policy', spool.POLICY_ALWAYS) != spool.POLICY_NEVER):
+        results['spool'] = spool.SpoolOutput(spool_ds, 
+                                             spool_opts.get('head', 0),
+                                             spool_opts.get('tail', 0),
+                                             spool_opts.get('max_lines', spool.DEFAULT_MAX_LINES),
+                                             log)
     return results
 
 
-def cmd_show_results(results:str={}, DD_list:list=[], log:Log=None)-> None:
-    # Log all of the output generated by the ZOAU mvscmd utility.
-    log.info('-------------------------')
-    log.info('Results:')
-    for k, v in results.items():
-        log.info(f'    {k}: {v}')
-    
-    # Log all of the output generated by the command that we executed.
+def log_event(log:Log, event:str, cmd:str, DD_list:list, results:dict, start:float) -> None:
+    # A command that couldn't be run has no rc of its own, so call it a 1.
+    if (log is not None) and (log.events is not None):
+        log.event(event, pgm=cmd, rc=results.get('rc', 1),
+                  dds=[dd.get_mvscmd_string() for dd in DD_list],
+                  spool_dataset=get_spool_dataset(DD_list),
+                  **timing(start, time.time()))
+    return
+
+
+def count_command(log:Log, cmd:str, results:dict) -> None:
+    registry = getattr(log, 'metrics', None)
+    if registry is not None:
+        registry.counter('ztron_commands_total', 'Programs run, by program and rc',
+                         ('pgm', 'rc')).inc(pgm=cmd, rc=results.get('rc', 1))
+    return
+
+
+def get_spool_dataset(DD_list:list=[]) -> str:
+    '''
+    Find the dataset behind the SYSPRINT DD, if there is one.
+
+    Params:
+        DD_list: List of Data Definitions (DDs) used by a command
+    Returns:
+        The name of the spool dataset, or None
+    '''
     for dd in DD_list:
         d = dd.get_mvscmd_string().split('"')
         if d[0] == '--SYSPRINT=':
             # There is a ',SHR' suffix on the spool dataset name to remove.
-            spool_ds = d[1].split(',')[0]
-            log.info(f'Spool dataset: {spool_ds}')
-            job_output = datasets.read(spool_ds)
+            return d[1].split(',')[0]
+    return None
+
+
+def cmd_show_results(results:str={}, DD_list:list=[], log:Log=None, 
+                     spool_opts:dict=None)-> None:
+    with trace.span(log, 'show results'):
+        # Log all of the output generated by the ZOAU mvscmd utility.
+        log.info('-------------------------')
+        log.info('Results:')
+        for k, v in results.items():
+            if k != 'spool':
+                log.info(f'    {k}: {v}')
+
+        # Log the output generated by the command that we executed, if the spool
+        # policy says to.  Reading the spool is a good part of the cost of a short
+        # job, so skip it when nobody is going to look at it.
+        if 'spool' in results:
+            spool_output = results['spool']
+            log.info(f'Spool dataset: {spool_output.get_dataset_name()}')
 
-            for line in job_output.splitlines():
-                log.info(f'>>> {line}')
-            break
-    log.info('-------------------------')
+            if spool_opts is None:
+                spool_opts = {}
+            policy = spool_opts.get('policy', spool.POLICY_ALWAYS)
+            if (policy == spool.POLICY_ALWAYS) or \
+               ((policy == spool.POLICY_ON_ERROR) and (results.get('rc', 1) != 0)):
+                spool_output.show(log)
+        log.info('-------------------------')
 
-    return
\ No newline at end of file
+    return
@@ -1,16 +1,17 @@
+from ztron import ledger
 from ztron.uss.user import get_userid
+from ztron.log import Log
+from ztron.mvs.backend import get_backend
 
-from zoautil_py import datasets
-from zoautil_py.ztypes import DDStatement, DatasetDefinition
 
-
-def create_dataset(prefix: str='', parms: dict=None) -> dict:
+def create_dataset(prefix: str='', parms: dict=None, log: Log=None) -> dict:
     """
     Create a dataset and return the info about it as a dictionary.  
 
     Params:
         prefix: The prefix of the dataset name.
-        parms : All the parameters to pass to ZOAU to create a dataset.
+        parms : All the parameters to pass to the backend to create a dataset.
+        log: The log of the job, which carries its backend.
     Returns:
         attributes - A dictionary of all the attributes for the created dataset.
     """
@@ -28,30 +29,109 @@ def create_dataset(prefix: str='', parms: dict=None) -> dict:
     # High level qualifier for zoau-generated temp names are max 17 characters.
     if len(hlq) > 17:
         raise ValueError(f'Dataset high level qualifier {hlq} must be 17 characters or less')
-    dataset_name = datasets.tmp_name(hlq)
+    backend = get_backend(log)
+    dataset_name = backend.tmp_name(hlq)
 
     if parms is None:
-        dataset_object = datasets.create(dataset_name,"SEQ",)
-    else:
-        dataset_object = datasets.create(dataset_name, **parms)
-    return dataset_object.to_dict()
+        return backend.create(dataset_name, "SEQ")
+    return backend.create(dataset_name, **parms)
+
+
+# Datasets deleted per worker thread at a time, and the most worker threads
+# deleting datasets at once.
+DELETE_BATCH_SIZE = 16
+DELETE_WORKERS = 4
 
 
-def create_spool_dataset(userid):
+def create_spool_dataset(userid, log: Log=None):
     if len(userid) > 0:
         prefix = userid + '.ZTSPOOL'
     else:
         prefix = get_userid() + '.ZTSPOOL'
-    return create_dataset(prefix)
+    spool_dataset = create_dataset(prefix, log=log)
+
+    # Spool datasets are temporary, so record that this process owns it, in
+    # case the process dies before it can delete it.
+    ledger.claim(ledger.DATASET, spool_dataset['name'])
+    return spool_dataset
+
+
+def create_pool_dataset(userid, log: Log=None):
+    # Spool datasets that belong to a spool pool outlive the process that
+    # creates them, and aren't recorded in its ledger.
+    if len(userid) > 0:
+        prefix = userid + '.ZTPOOL'
+    else:
+        prefix = get_userid() + '.ZTPOOL'
+    return create_dataset(prefix, log=log)
+
+
+def list_dataset_names(pattern: str, log: Log=None) -> list:
+    """
+    List the names of the cataloged datasets that match a pattern.
+
+    Params:
+        pattern: A dataset name pattern, like 'USER.ZTSPOOL.**'.
+        log: The log of the job, which carries its backend.
+    Returns:
+        A list of dataset names.
+    """
+    return get_backend(log).list_datasets(pattern)
 
 
-def create_DD(name: str, dataset: str) -> DDStatement:
+def create_DD(name: str, dataset: str, log: Log=None):
     '''Create a Data Definition (DD) for a dataset
 
     Args:
         name - DD name to associate with a dataset
         dataset - the dataset to associate with a DD name
 
-    Return - a ZOAU DDStatement
+    Return - a DD statement of the backend, like a ZOAU DDStatement
     '''
-    return DDStatement(name.upper(), DatasetDefinition(dataset))
\ No newline at end of file
+    return get_backend(log).dataset_dd(name.upper(), dataset)
+
+
+def delete_dataset(name: str, log: Log=None) -> bool:
+    """
+    Delete a dataset.
+
+    Params:
+        name: The name of the dataset to delete.
+        log: The log of the job, which carries its backend.
+    Returns:
+        True if the dataset was deleted.
+    """
+    try:
+        rc = get_backend(log).delete(name)
+    except Exception:
+        return False
+    # Older levels of ZOAU return a return code instead of raising.
+    return (rc is None) or (not isinstance(rc, int)) or (rc == 0)
+
+
+def delete_datasets(names: list, batch_size: int=DELETE_BATCH_SIZE, 
+                    workers: int=DELETE_WORKERS, log: Log=None) -> list:
+    """
+    Delete a list of datasets, a batch at a time on each of several worker 
+    threads, so that deleting many datasets doesn't take many times as long
+    as deleting one.
+
+    Params:
+        names: The names of the datasets to delete.
+        batch_size: The number of datasets each worker deletes at a time.
+        workers: The most worker threads deleting at once.
+        log: The log of the job, which carries its backend.
+    Returns:
+        The names of the datasets that could not be deleted.
+    """
+    if len(names) == 0:
+        return []
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Spread short lists across all of the workers instead of filling 1 batch.
+    batch_size = max(1, min(batch_size, -(-len(names) // workers)))
+    batches = [names[i:i+batch_size] for i in range(0, len(names), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches))),
+                            thread_name_prefix='ztron-delete') as pool:
+        results = pool.map(lambda batch: [name for name in batch if not delete_dataset(name, log)], batches)
+        return [name for failed in results for name in failed]
@@ -0,0 +1,325 @@
+# Methods to copy members between partitioned datasets.
+import os, json, hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from ztron.log import Log
+from ztron.mvs import command
+from ztron.mvs import spool
+from ztron.mvs.backend import get_backend, DSNTYPE_PDSE
+from ztron.util import timestamp
+
+# IEBCOPY reads control statements from columns 1-71.  Column 72 is the
+# continuation column, so stay clear of it.
+CARD_WIDTH = 71
+
+
+def build_select_cards(members: list) -> list:
+    """
+    Build the SELECT statements for a list of members.  IEBCOPY takes any
+    number of SELECT statements after a COPY, so rather than continue one long
+    statement, start a new one whenever the next member won't fit on the card.
+
+    Params:
+        members: The names of the members to select.
+    Returns:
+        A list of SELECT cards, none of them longer than CARD_WIDTH.
+    """
+    cards = []
+    card_members = []
+    for member in members:
+        candidate = card_members + [member]
+        if (len(card_members) > 0) and (len(select_card(candidate)) > CARD_WIDTH):
+            cards.append(select_card(card_members))
+            candidate = [member]
+        card_members = candidate
+    if len(card_members) > 0:
+        cards.append(select_card(card_members))
+    return cards
+
+
+def select_card(members: list) -> str:
+    return f" SELECT MEMBER=({','.join(members)})"
+
+
+def build_copy_task(members: list) -> list:
+    """
+    Build the IEBCOPY control statements to copy members from SYSUT1 to SYSUT2,
+    replacing members that are already there.
+
+    Params:
+        members: The names of the members to copy.
+    Returns:
+        The list of cards for a SYSIN DD.
+    """
+    return [' COPY OUTDD=SYSUT2,INDD=((SYSUT1,R))'] + build_select_cards(members)
+
+
+def shard_members(members: list, shards: int=1) -> list:
+    """
+    Split a list of members into at most the given number of shards, as evenly
+    as possible, keeping the members of each shard in their original order.
+
+    Params:
+        members: The names of the members to split.
+        shards: The number of shards to split the members into.
+    Returns:
+        A list of member lists.  Empty shards are left out.
+    """
+    shards = max(1, min(shards, len(members)))
+    size, extra = divmod(len(members), shards)
+    member_shards = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        member_shards.append(members[start:end])
+        start = end
+    return [shard for shard in member_shards if len(shard) > 0]
+
+
+def copy_members(job, from_pds: str, to_pds: str, members: list,
+                 shards: int=1, workers: int=None) -> dict:
+    """
+    Copy members from one PDS to another with IEBCOPY.  The members are split
+    into shards, and each shard is copied by its own IEBCOPY, with its own
+    SYSIN and SYSPRINT, with up to workers of them running at once.  When they
+    are all done, the results are logged shard by shard, followed by a summary.
+
+    A PDS can't take updates from more than one job at a time, so unless the
+    target is a PDSE, the members are copied in 1 shard, whatever the shards.
+
+    Params:
+        job: The ztron Job the copies run under.
+        from_pds: The PDS to copy members from.
+        to_pds: The PDS to copy members to.
+        members: The names of the members to copy.
+        shards: The number of IEBCOPY invocations to split the members across.
+        workers: The most IEBCOPY invocations to run at once.  Defaults to
+                 the number of shards.
+    Returns:
+        results: A dictionary with the highest rc of any shard, the number of
+                 members copied, and the results of each shard.
+    """
+    if (shards > 1) and (get_backend(job.log).dsntype(to_pds) != DSNTYPE_PDSE):
+        job.log.warning(f'{to_pds} is not a PDSE, so its members are copied in 1 shard, not {shards}')
+        shards = 1
+    member_shards = shard_members(members, shards)
+    if workers is None:
+        workers = len(member_shards)
+    job.log.info(f'Copying {len(members)} members from {from_pds} to {to_pds} in '
+                 f'{len(member_shards)} shards, {workers} at a time')
+
+    # Allocate everything up front, so the shards only have to run.
+    shard_DD_lists = []
+    for member_shard in member_shards:
+        DD_list = []
+        job.create_DD_dataset('SYSUT1', from_pds, DD_list)
+        job.create_DD_dataset('SYSUT2', to_pds, DD_list)
+        job.create_spool_DD(DD_list)
+        job.create_task_DD(build_copy_task(member_shard), DD_list)
+        shard_DD_lists.append(DD_list)
+
+    # Each shard's results are logged once all of the shards are done, so the
+    # output of one shard isn't mixed in with another.
+    spool_opts = dict(job.spool_opts)
+    policy = spool_opts.get('policy', spool.POLICY_ALWAYS)
+    spool_opts['policy'] = spool.POLICY_ON_DEMAND if policy != spool.POLICY_NEVER else policy
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ztron-iebcopy') as pool:
+        futures = [pool.submit(command.execute, 'IEBCOPY', DD_list, job.log, spool_opts)
+                   for DD_list in shard_DD_lists]
+        shard_results = [future.result() for future in futures]
+
+    spool_opts['policy'] = policy
+    for i, (member_shard, DD_list, results) in enumerate(zip(member_shards, shard_DD_lists, shard_results)):
+        job.log.info(f'Shard {i+1}: {member_shard[0]} - {member_shard[-1]} ({len(member_shard)} members)')
+        command.cmd_show_results(results, DD_list, job.log, spool_opts)
+
+    rcs = [results.get('rc', 1) for results in shard_results]
+    job.log.info('Copy summary:')
+    for i, (member_shard, rc) in enumerate(zip(member_shards, rcs)):
+        job.log.info(f'    shard {i+1}: {len(member_shard)} members, rc: {rc}')
+    job.log.info(f'    {len(members)} members, highest rc: {max(rcs, default=0)}')
+
+    return {'rc': max(rcs, default=0), 'members': len(members), 'shards': shard_results}
+
+
+def fingerprint_member(pds_name: str, member: str, log: Log=None) -> str:
+    """
+    Fingerprint the content of a PDS member.
+
+    Params:
+        pds_name: The PDS the member is in.
+        member: The name of the member.
+        log: The job log, which carries the backend to read it with.
+    Returns:
+        A SHA-256 hex digest of the member content.
+    """
+    content = get_backend(log).read(f'{pds_name}({member})')
+    return hashlib.sha256(bytes('' if content is None else content, 'utf-8')).hexdigest()
+
+
+def fingerprint_members(pds_name: str, members: list, workers: int=1, log: Log=None) -> dict:
+    """
+    Fingerprint a list of PDS members, reading up to workers of them at once.
+
+    Params:
+        pds_name: The PDS the members are in.
+        members: The names of the members.
+        workers: The most members to read at once.
+        log: The job log, which carries the backend to read them with.
+    Returns:
+        A dictionary of member name to fingerprint.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ztron-fingerprint') as pool:
+        fingerprints = pool.map(lambda member: fingerprint_member(pds_name, member, log), members)
+        return dict(zip(members, fingerprints))
+
+
+def manifest_file_name(manifest_path: str, from_pds: str, to_pds: str) -> str:
+    return f'{manifest_path}/{from_pds}_TO_{to_pds}.json'
+
+
+def load_manifest(file_name: str) -> dict:
+    """
+    Load the manifest of members copied by earlier runs.  A missing or damaged
+    manifest is treated as empty, which just means everything gets copied.
+
+    Params:
+        file_name: The manifest file.
+    Returns:
+        A dictionary of member name to the fingerprints of its last copy.
+    """
+    try:
+        with open(file_name, 'r', encoding='utf-8') as f:
+            return json.load(f).get('members', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(file_name: str, from_pds: str, to_pds: str, members: dict) -> None:
+    """
+    Save the manifest, replacing the old one only once the new one is written
+    out in full.
+
+    Params:
+        file_name: The manifest file.
+        from_pds: The PDS members are copied from.
+        to_pds: The PDS members are copied to.
+        members: A dictionary of member name to the fingerprints of its last copy.
+    """
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    temp_file_name = f'{file_name}.{os.getpid()}.tmp'
+    with open(temp_file_name, 'w', encoding='utf-8') as f:
+        json.dump({'from_pds': from_pds,
+                   'to_pds': to_pds,
+                   'updated': timestamp(),
+                   'members': members}, f, indent=2, sort_keys=True)
+    os.replace(temp_file_name, file_name)
+    return
+
+
+def incremental_copy(job, from_pds: str, to_pds: str, members: list=None,
+                     shards: int=1, workers: int=None, delete_stale: bool=False) -> dict:
+    """
+    Copy only the members that are new or have changed since the last copy.
+    A manifest under the job's home directory keeps the directory statistics
+    and fingerprints of the source and target of every member as of its last
+    successful copy.  A member is copied when it isn't in the manifest, when
+    it's missing from the target, or when its source or target has changed.
+    Members whose statistics match the manifest are taken as unchanged without
+    being read.  Only the others are read and fingerprinted.
+
+    Params:
+        job: The ztron Job the copies run under.
+        from_pds: The PDS to copy members from.
+        to_pds: The PDS to copy members to.
+        members: The names of the members to consider.  Defaults to all of the
+                 members of from_pds.
+        shards, workers: How to split up the copy.  See copy_members().
+        delete_stale: Delete members from to_pds that an earlier run copied,
+                      but that are no longer in from_pds.
+    Returns:
+        results: The copy_members() results, plus the lists of members that
+                 were copied, skipped, deleted, and asked for but missing from
+                 from_pds.  A missing member makes the rc at least 4.
+    """
+    backend = get_backend(job.log)
+    source_members = backend.list_members(from_pds)
+    if (members is None) or (len(members) == 0):
+        members = source_members
+    else:
+        members = [member.upper() for member in members]
+    target_members = set(backend.list_members(to_pds))
+
+    manifest_name = manifest_file_name(job.env_home_manifest_path, from_pds, to_pds)
+    manifest = load_manifest(manifest_name)
+
+    n_workers = workers if workers is not None else max(1, shards)
+    source_set = set(source_members)
+    present = [member for member in members if member in source_set]
+    missing = [member for member in members if member not in source_set]
+    for member in missing:
+        job.log.warning(f'Member {member} is not in {from_pds}, so it is not copied')
+
+    # Members that were copied before, and whose source and target statistics
+    # are the same as they were then, haven't changed.  The rest are compared
+    # by content, unless they have to be copied anyway.
+    source_stats = backend.member_stats(from_pds)
+    target_stats = backend.member_stats(to_pds)
+    recorded = [member for member in present if (member in manifest) and (member in target_members)]
+    unread = [member for member in recorded
+              if (member in source_stats) and (member in target_stats) and
+                 (manifest[member].get('source_stats') == source_stats[member]) and
+                 (manifest[member].get('target_stats') == target_stats[member])]
+    unread_set = set(unread)
+    source_fps = fingerprint_members(from_pds, [m for m in present if m not in unread_set], n_workers, job.log)
+    target_fps = fingerprint_members(to_pds, [m for m in recorded if m not in unread_set], n_workers, job.log)
+
+    changed = []
+    for member in present:
+        if member in unread_set:
+            continue
+        last = manifest.get(member)
+        if (last is None) or (member not in target_fps) or \
+           (last.get('source') != source_fps[member]) or \
+           (last.get('target') != target_fps[member]):
+            changed.append(member)
+        else:
+            # Same content, new statistics.  Remember them for next time.
+            manifest[member].update(source_stats=source_stats.get(member),
+                                    target_stats=target_stats.get(member))
+    skipped = [member for member in present if member not in changed]
+    job.log.info(f'Incremental copy: {len(changed)} new or changed, {len(skipped)} unchanged '
+                 f'({len(unread)} by statistics), {len(missing)} missing')
+
+    results = {'rc': 0, 'members': 0, 'shards': []}
+    if len(changed) > 0:
+        results = copy_members(job, from_pds, to_pds, changed, shards, workers)
+
+        # Only remember the members whose shard copied cleanly, so anything
+        # that failed is tried again next time.  copy_members() may have used
+        # fewer shards than asked for, so split them the way it did.
+        copied_stats = backend.member_stats(to_pds)
+        member_shards = shard_members(changed, len(results['shards']))
+        for member_shard, shard_results in zip(member_shards, results['shards']):
+            if shard_results.get('rc', 1) == 0:
+                for member in member_shard:
+                    manifest[member] = {'source': source_fps[member], 
+                                        'target': source_fps[member],
+                                        'source_stats': source_stats.get(member),
+                                        'target_stats': copied_stats.get(member)}
+    if len(missing) > 0:
+        results['rc'] = max(results['rc'], 4)
+
+    # Only delete members this copy put there in the first place.
+    deleted = []
+    if delete_stale:
+        for member in sorted(set(manifest) - source_set):
+            if member in target_members:
+                job.log.info(f'Deleting stale member {to_pds}({member})')
+                backend.delete_members(f'{to_pds}({member})')
+                deleted.append(member)
+            del manifest[member]
+
+    save_manifest(manifest_name, from_pds, to_pds, manifest)
+    results.update(copied=changed, skipped=skipped, deleted=deleted, missing=missing)
+    return results
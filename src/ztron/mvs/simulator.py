@@ -0,0 +1,318 @@
+"""
+  simulator.py - a backend that simulates MVS in a local directory.
+
+    Datasets are files, named after the dataset, and a PDS is a directory of
+    member files:
+
+        USER.DATA            -> <path>/USER.DATA
+        USER.SOURCE(MEMBER1) -> <path>/USER.SOURCE/MEMBER1
+
+    A PDS that was created as one, instead of a PDSE, has a .DSNTYPE file in
+    its directory that says so.  Any other directory is a PDSE.
+
+    Every operation can be given a latency, so jobs take about as long as
+    they would on z/OS.  A program run sleeps for its latency and writes its
+    spool to SYSPRINT.  IEBCOPY copies the members its SYSIN selects from
+    SYSUT1 to SYSUT2, with rc 4 when a member isn't there and rc 8 when
+    SYSUT1 isn't a PDS.  Anything else only returns the rc it's given.
+
+    The directory is ZTRON_SIMULATOR_PATH, or ztron_simulator_<userid> in the
+    temp directory.  More than one process can share it.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, time, shutil, fnmatch, itertools, threading
+from collections.abc import Iterator
+
+from ztron.mvs.backend import Backend, BACKEND_SIMULATOR, DSNTYPE_PDS, DSNTYPE_PDSE
+from ztron.uss.user import get_userid
+
+# A PDS is made for any of these dataset types.  Anything else is sequential.
+PDS_TYPES = ('PDS', 'PDSE', 'PO', 'LIBRARY')
+PDSE_TYPES = ('PDSE', 'LIBRARY')
+
+# The file in a PDS's directory that holds its DSNTYPE.
+DSNTYPE_FILE = '.DSNTYPE'
+
+# Spool lines written for every program run, besides what the program says.
+DEFAULT_SPOOL_LINES = 0
+
+
+class SimulatorDD():
+    # A DD of a simulated program, to a dataset or a file.
+    def __init__(self, name: str, dataset_name: str=None, file_name: str=None):
+        self.name = name
+        self.dataset_name = dataset_name
+        self.file_name = file_name
+        return
+
+    def get_mvscmd_string(self) -> str:
+        if self.dataset_name is not None:
+            return f'--{self.name}="{self.dataset_name},SHR"'
+        return f'--{self.name}={self.file_name}'
+
+
+class SimulatorBackend(Backend):
+    """
+    MVS operations simulated with files in a local directory.
+
+    Params:
+        path: The directory the datasets are kept in.
+        execute_ms, create_ms, read_ms, delete_ms, tmp_name_ms: The latency,
+            in milliseconds, of each kind of operation.
+        spool_lines: Lines of spool, besides the program's own messages,
+            written by every program run.
+        rc: The rc of every program run, at least.
+    """
+    name = BACKEND_SIMULATOR
+
+    def __init__(self, path: str=None, execute_ms: float=0, create_ms: float=0,
+                 read_ms: float=0, delete_ms: float=0, tmp_name_ms: float=0,
+                 spool_lines: int=DEFAULT_SPOOL_LINES, rc: int=0):
+        if path is None:
+            path = os.environ.get('ZTRON_SIMULATOR_PATH')
+        if path is None:
+            import tempfile
+            path = os.path.join(tempfile.gettempdir(), f'ztron_simulator_{get_userid().lower()}')
+        self.path = str(path)
+
+        latencies = {'execute_ms': execute_ms, 'create_ms': create_ms, 'read_ms': read_ms,
+                     'delete_ms': delete_ms, 'tmp_name_ms': tmp_name_ms}
+        for key, value in latencies.items():
+            if float(value) < 0:
+                raise ValueError(f'Simulator {key} {value} must be at least 0')
+        self.execute_seconds = float(execute_ms) / 1000
+        self.create_seconds = float(create_ms) / 1000
+        self.read_seconds = float(read_ms) / 1000
+        self.delete_seconds = float(delete_ms) / 1000
+        self.tmp_name_seconds = float(tmp_name_ms) / 1000
+        self.spool_lines = int(spool_lines)
+        self.rc = int(rc)
+
+        self.seq = itertools.count(1)
+        self.seq_lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        install_codepage_fallback()
+        return
+
+
+    def file_name(self, name: str) -> str:
+        # The file of a dataset, or of a member for NAME(MEMBER).
+        name = name.upper()
+        if name.endswith(')') and ('(' in name):
+            dataset_name, member = name[:-1].split('(', 1)
+            return os.path.join(self.path, dataset_name, member)
+        return os.path.join(self.path, name)
+
+
+    def execute(self, pgm: str, dds: list) -> dict:
+        time.sleep(self.execute_seconds)
+        pgm = pgm.upper()
+        rc = self.rc
+        messages = []
+        if pgm == 'IEBCOPY':
+            copy_rc, messages = self.iebcopy(dds)
+            rc = max(rc, copy_rc)
+
+        lines = messages + [f'{pgm} SPOOL LINE {i:08d} - {"X" * 40}' for i in range(self.spool_lines)]
+        for dd in dds:
+            if dd.name == 'SYSPRINT':
+                target = self.file_name(dd.dataset_name) if dd.dataset_name is not None else dd.file_name
+                with open(target, 'w') as f:
+                    f.writelines(f'{line}\n' for line in lines)
+        dd_strings = ' '.join(dd.get_mvscmd_string() for dd in dds)
+        return {'rc': rc, 'stdout_response': '', 'stderr_response': '',
+                'command': f'mvscmd --pgm={pgm} {dd_strings}'.rstrip()}
+
+
+    def iebcopy(self, dds: list) -> tuple:
+        # Copy the members SYSIN selects from SYSUT1 to SYSUT2.  Returns the
+        # rc and the messages of the copy.
+        dd_map = {dd.name: dd for dd in dds}
+        if ('SYSUT1' not in dd_map) or ('SYSUT2' not in dd_map) or ('SYSIN' not in dd_map):
+            return 12, ['SYSUT1, SYSUT2 AND SYSIN DDS ARE REQUIRED']
+        from_pds = self.file_name(dd_map['SYSUT1'].dataset_name)
+        to_pds = self.file_name(dd_map['SYSUT2'].dataset_name)
+        if not os.path.isdir(from_pds):
+            return 8, [f'{dd_map["SYSUT1"].dataset_name} IS NOT A PARTITIONED DATA SET']
+        os.makedirs(to_pds, exist_ok=True)
+
+        sysin = dd_map['SYSIN']
+        sysin_name = sysin.file_name if sysin.file_name is not None else self.file_name(sysin.dataset_name)
+        with open(sysin_name, encoding='cp1047') as f:
+            cards = f.read().splitlines()
+        members = []
+        for card in cards:
+            card = card[:71].strip().upper()
+            if card.startswith('SELECT MEMBER=('):
+                members += [member.strip() for member in card[len('SELECT MEMBER=('):].rstrip(')').split(',')]
+
+        rc = 0
+        messages = ['IEB167I FOLLOWING MEMBER(S) COPIED FROM INPUT DATA SET REFERENCED BY SYSUT1']
+        for member in members:
+            try:
+                shutil.copyfile(os.path.join(from_pds, member), os.path.join(to_pds, member))
+                messages.append(f'IEB154I {member:8} HAS BEEN SUCCESSFULLY COPIED')
+            except FileNotFoundError:
+                messages.append(f'{member:8} WAS SELECTED BUT NOT FOUND')
+                rc = 4
+        return rc, messages
+
+
+    def create(self, name: str, type: str='SEQ', **parms) -> dict:
+        time.sleep(self.create_seconds)
+        file_name = self.file_name(name)
+        if str(type).upper() in PDS_TYPES:
+            os.makedirs(file_name, exist_ok=True)
+            if str(type).upper() not in PDSE_TYPES:
+                with open(os.path.join(file_name, DSNTYPE_FILE), 'w') as f:
+                    f.write(DSNTYPE_PDS)
+        else:
+            open(file_name, 'a').close()
+        return {'name': name.upper(), 'type': str(type).upper()}
+
+
+    def write(self, name: str, content: str) -> None:
+        """
+        Write a dataset or member, creating it and its PDS if need be.  There's
+        no ZOAU call ztron needs like it, but it seeds the simulator with data.
+        """
+        file_name = self.file_name(name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as f:
+            f.write(content)
+        return
+
+
+    def read(self, name: str, tail: int=0) -> str:
+        time.sleep(self.read_seconds)
+        try:
+            with open(self.file_name(name)) as f:
+                lines = f.read().splitlines()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        return '\n'.join(lines[-tail:] if tail > 0 else lines)
+
+
+    def delete(self, name: str) -> int:
+        time.sleep(self.delete_seconds)
+        file_name = self.file_name(name)
+        try:
+            if os.path.isdir(file_name):
+                shutil.rmtree(file_name)
+            else:
+                os.remove(file_name)
+        except FileNotFoundError:
+            # Like older levels of ZOAU, a dataset that isn't there is an rc.
+            return 1
+        return 0
+
+
+    def empty(self, name: str) -> None:
+        time.sleep(self.create_seconds)
+        open(self.file_name(name), 'w').close()
+        return
+
+
+    def tmp_name(self, hlq: str) -> str:
+        # Unique across the processes sharing the directory, as well as the
+        # threads of this one.
+        time.sleep(self.tmp_name_seconds)
+        while True:
+            with self.seq_lock:
+                n = next(self.seq)
+            name = f'{hlq.upper()}.P{os.getpid() % 10000000:07d}.T{n:07d}'
+            if not os.path.exists(self.file_name(name)):
+                return name
+
+
+    def list_datasets(self, pattern: str) -> list:
+        pattern = pattern.upper().replace('**', '*')
+        return sorted(name for name in os.listdir(self.path) if fnmatch.fnmatchcase(name, pattern))
+
+
+    def created(self, name: str) -> float:
+        # A file's last change stands in for the creation date, which can
+        # only make a dataset look younger than it is.
+        try:
+            return os.stat(self.file_name(name)).st_mtime
+        except FileNotFoundError:
+            return None
+
+
+    def dsntype(self, name: str) -> str:
+        file_name = self.file_name(name)
+        if not os.path.isdir(file_name):
+            return None
+        try:
+            with open(os.path.join(file_name, DSNTYPE_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return DSNTYPE_PDSE
+
+
+    def list_members(self, pds_name: str) -> list:
+        try:
+            return sorted(member for member in os.listdir(self.file_name(pds_name))
+                          if member != DSNTYPE_FILE)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+
+    def member_stats(self, pds_name: str) -> dict:
+        # The modification time and size of the member files stand in for
+        # ISPF statistics.
+        stats = {}
+        for member in self.list_members(pds_name):
+            try:
+                st = os.stat(self.file_name(f'{pds_name}({member})'))
+            except FileNotFoundError:
+                continue
+            stats[member] = f'{st.st_mtime_ns} {st.st_size}'
+        return stats
+
+
+    def delete_members(self, pattern: str) -> None:
+        # The pattern is PDS(MEMBER), and the member can have wildcards.
+        pds_name, member_pattern = pattern.upper().rstrip(')').split('(', 1)
+        for member in self.list_members(pds_name):
+            if fnmatch.fnmatchcase(member, member_pattern):
+                self.delete(f'{pds_name}({member})')
+        return
+
+
+    def stream(self, name: str) -> Iterator[str]:
+        try:
+            f = open(self.file_name(name), errors='replace')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                yield line.rstrip('\n')
+
+
+    def dataset_dd(self, name: str, dataset_name: str) -> SimulatorDD:
+        return SimulatorDD(name, dataset_name=dataset_name)
+
+
+    def file_dd(self, name: str, file_name: str) -> SimulatorDD:
+        return SimulatorDD(name, file_name=file_name)
+
+
+def install_codepage_fallback() -> None:
+    """
+    SYSIN files are written in cp1047, which z/OS Python has and other builds
+    don't.  Off-host, stand in cp037 for it, which differs in a few
+    punctuation characters that IEBCOPY cards don't use.
+    """
+    import codecs
+    try:
+        codecs.lookup('cp1047')
+    except LookupError:
+        cp037 = codecs.lookup('cp037')
+        codecs.register(lambda name: cp037 if name.replace('-', '').lower() == 'cp1047' else None)
+    return
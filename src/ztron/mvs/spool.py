@@ -1 +1,393 @@
-# Methods to manage job output from MVS operations.
\ No newline at end of file
+# Methods to manage job output from MVS operations.
+import os, time, json, fcntl, threading
+from collections import deque
+from collections.abc import Iterator
+
+from ztron.log import Log
+from ztron import ledger
+from ztron import metrics
+from ztron import trace
+from ztron.ledger import pid_alive
+from ztron.mvs import dataset
+from ztron.mvs.backend import get_backend
+
+# Most lines of a spool dataset to log when no other limits are given.
+DEFAULT_MAX_LINES = 10000
+
+# When the spool dataset of a command gets read:
+#   always - read and log it after every command
+#   on_error - read and log it only when the command fails
+#   never - don't read it, and don't return it with the results
+#   on_demand - don't log it, but return it with the results, to be read the
+#               first time the caller looks at it
+POLICY_ALWAYS = 'always'
+POLICY_ON_ERROR = 'on_error'
+POLICY_NEVER = 'never'
+POLICY_ON_DEMAND = 'on_demand'
+POLICIES = [POLICY_ALWAYS, POLICY_ON_ERROR, POLICY_NEVER, POLICY_ON_DEMAND]
+
+# Spool datasets kept per userid by a spool pool, and how long one can sit
+# idle in the pool before it is deleted.
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_MAX_IDLE = 24*60*60
+
+# How many times each spool dataset has been given up by a job in this
+# process.  A SpoolOutput that hasn't been read by then can't be, since the
+# dataset may already hold another job's output, or be gone.
+_releases = {}
+_releases_lock = threading.Lock()
+
+
+def retire(dataset_name: str) -> None:
+    """
+    Mark a spool dataset as given up by the job that had it, so that output
+    of that job that hasn't been read yet isn't read from it.
+    """
+    with _releases_lock:
+        _releases[dataset_name] = _releases.get(dataset_name, 0) + 1
+    return
+
+
+def releases(dataset_name: str) -> int:
+    return _releases.get(dataset_name, 0)
+
+
+def stream(dataset_name: str, log: Log=None) -> Iterator[str]:
+    """
+    Read a dataset one line at a time, without holding more than a line of it
+    in memory.  With ZOAU, the dataset is read through the dcat utility, which
+    writes it to a pipe as it goes.
+
+    Params:
+        dataset_name: The name of the dataset to read.
+        log: The log of the job that reads it, for its backend.
+    Returns:
+        An iterator over the lines of the dataset, without line endings.
+    """
+    return get_backend(log).stream(dataset_name)
+
+
+def read_tail(dataset_name: str, lines: int, log: Log=None) -> list:
+    """
+    Read just the last lines of a dataset.  The backend finds the end of the dataset,
+    so nothing ahead of those lines is read into memory.
+
+    Params:
+        dataset_name: The name of the dataset to read.
+        lines: The number of lines to read from the end of the dataset.
+        log: The log of the job that reads it, for its backend.
+    Returns:
+        A list of the last lines of the dataset.
+    """
+    output = get_backend(log).read(dataset_name, tail=lines)
+    return [] if output is None else output.splitlines()
+
+
+def read_lines(dataset_name: str, head: int=0, tail: int=0,
+               max_lines: int=DEFAULT_MAX_LINES, log: Log=None) -> Iterator[str]:
+    """
+    Read the lines of a spool dataset within the given limits.  Memory use
+    depends on the limits and not on the size of the dataset.
+
+        head only - the first head lines
+        tail only - the last tail lines
+        head and tail - the first head lines and the last tail lines, with a
+                        line in between saying how many were skipped
+        neither - up to max_lines lines from the start of the dataset
+
+    Params:
+        dataset_name: The name of the spool dataset.
+        head: Number of lines to read from the start of the dataset.
+        tail: Number of lines to read from the end of the dataset.
+        max_lines: Upper limit on the number of lines read, no matter what
+                   head and tail are.  0 means no limit.
+        log: The log of the job that reads it, for its backend.
+    Returns:
+        An iterator over the selected lines.
+    """
+    if (head <= 0) and (tail <= 0):
+        head = max_lines
+    if max_lines > 0:
+        head = min(head, max_lines) if head > 0 else 0
+        tail = min(tail, max_lines - head) if tail > 0 else 0
+
+    if (head <= 0) and (tail <= 0):
+        yield from stream(dataset_name, log)
+        return
+
+    if head <= 0:
+        yield from read_tail(dataset_name, tail, log)
+        return
+
+    # Keep a window of the last tail lines seen while streaming past the head,
+    # so the dataset is only read once.
+    last = deque(maxlen=tail) if tail > 0 else None
+    n_lines = 0
+    for line in stream(dataset_name, log):
+        n_lines += 1
+        if n_lines <= head:
+            yield line
+        elif last is not None:
+            last.append(line)
+        else:
+            break
+
+    if last is None:
+        if n_lines > head:
+            yield f'... output truncated after {head} lines ...'
+        return
+
+    skipped = n_lines - head - len(last)
+    if skipped > 0:
+        yield f'... {skipped} lines skipped ...'
+    yield from last
+
+
+def show(dataset_name: str, log: Log=None, head: int=0, tail: int=0,
+         max_lines: int=DEFAULT_MAX_LINES) -> int:
+    """
+    Log the contents of a spool dataset, within the given limits.
+
+    Params:
+        dataset_name: The name of the spool dataset.
+        log: The job log to write the lines to.
+        head, tail, max_lines: Limits on the lines logged.  See read_lines().
+    Returns:
+        The number of lines logged.
+    """
+    n_lines = 0
+    with metrics.phase(log, metrics.PHASE_SPOOL_READ), \
+         trace.span(log, 'spool read', dataset=dataset_name):
+        for line in read_lines(dataset_name, head, tail, max_lines, log):
+            log.info('>>> %s', line)
+            n_lines += 1
+    count_lines(log, n_lines)
+    return n_lines
+
+
+def count_lines(log: Log, n_lines: int) -> None:
+    registry = getattr(log, 'metrics', None)
+    if registry is not None:
+        registry.counter('ztron_spool_lines_total', 'Spool dataset lines logged').inc(n_lines)
+    return
+
+
+class SpoolOutput():
+    """
+    The spool dataset of a command, read the first time its contents are
+    needed and kept after that.  It's read on the backend of the job that ran
+    the command.
+    """
+    def __init__(self, dataset_name: str, head: int=0, tail: int=0, 
+                 max_lines: int=DEFAULT_MAX_LINES, log: Log=None):
+        self.dataset_name = dataset_name
+        self.log = log
+        self.head = head
+        self.tail = tail
+        self.max_lines = max_lines
+        self.lines = None
+        self.releases = releases(dataset_name)
+        return
+
+
+    def get_dataset_name(self) -> str:
+        return self.dataset_name
+
+
+    def is_released(self) -> bool:
+        return releases(self.dataset_name) != self.releases
+
+
+    def get_lines(self) -> list:
+        if self.lines is None:
+            if self.is_released():
+                return [f'... spool dataset {self.dataset_name} was released before it was read ...']
+            self.lines = list(read_lines(self.dataset_name, self.head, self.tail, 
+                                         self.max_lines, self.log))
+        return self.lines
+
+
+    def is_loaded(self) -> bool:
+        return self.lines is not None
+
+
+    def show(self, log: Log=None) -> int:
+        # If the lines are already here, don't read the dataset again.
+        if (self.lines is None) and not self.is_released():
+            return show(self.dataset_name, log, self.head, self.tail, self.max_lines)
+        lines = self.get_lines()
+        for line in lines:
+            log.info('>>> %s', line)
+        count_lines(log, len(lines))
+        return len(lines)
+
+
+    def __str__(self) -> str:
+        return '\n'.join(self.get_lines())
+
+
+    def __repr__(self) -> str:
+        return f'SpoolOutput({self.dataset_name!r})'
+
+
+class SpoolPool():
+    """
+    A pool of spool datasets for one userid, shared by every ztron process 
+    that uses the same pool directory.  Allocating and cataloging a dataset
+    costs more than a small job does, so instead of a new spool dataset for
+    every job, datasets are handed back to the pool when a job is done and
+    handed out again to the next one.  A dataset is emptied when it's handed
+    out again, so a program that doesn't write SYSPRINT, or doesn't run at all,
+    doesn't show the last job's output.
+
+    Pooled datasets are named <userid>.ZTPOOL.*, so they are never mistaken
+    for the temporary <userid>.ZTSPOOL.* datasets that the reaper cleans up.
+    The pool is a JSON file, locked while it's read and updated.  It holds up
+    to size datasets.  When more are needed, plain temporary spool datasets 
+    are used and deleted when they're released.  Idle datasets past max_idle 
+    seconds are deleted, and datasets held by processes that have died are
+    taken back.
+    """
+    def __init__(self, userid: str, pool_path: str, size: int=DEFAULT_POOL_SIZE,
+                 max_idle: int=DEFAULT_POOL_MAX_IDLE, log: Log=None):
+        self.userid = userid
+        self.pool_path = pool_path
+        self.pool_file_name = f'{pool_path}/spool_pool_{userid}.json'
+        self.size = size
+        self.max_idle = max_idle
+        self.log = log
+        return
+
+
+    def acquire(self) -> str:
+        """
+        Get a spool dataset for a job.  Returns the dataset name.
+        """
+        reused = False
+        with self.locked() as pool:
+            if len(pool['idle']) > 0:
+                entry = pool['idle'].pop()
+                reused = True
+            elif len(pool['idle']) + len(pool['in_use']) < self.size:
+                entry = {'name': dataset.create_pool_dataset(self.userid, self.log)['name']}
+            else:
+                entry = None
+            if entry is not None:
+                pool['in_use'].append({'name': entry['name'], 
+                                       'pid': os.getpid(), 
+                                       'since': time.time()})
+
+        # The pool is all in use, so this job gets a dataset of its own.
+        if entry is None:
+            return dataset.create_spool_dataset(self.userid, self.log)['name']
+
+        # It's this job's dataset now, so it can be emptied outside the lock.
+        if reused:
+            get_backend(self.log).empty(entry['name'])
+        return entry['name']
+
+
+    def release(self, dataset_name: str) -> None:
+        """
+        Give a spool dataset back when the job is done with it.  Datasets that
+        didn't come from the pool are deleted.
+        """
+        retire(dataset_name)
+        with self.locked() as pool:
+            for entry in pool['in_use']:
+                if entry['name'] == dataset_name:
+                    pool['in_use'].remove(entry)
+                    pool['idle'].append({'name': dataset_name, 'released': time.time()})
+                    return
+        if dataset.delete_dataset(dataset_name, self.log):
+            ledger.release(ledger.DATASET, dataset_name)
+        return
+
+
+    def prefill(self, count: int=None) -> None:
+        """
+        Allocate idle datasets ahead of time, up to count or the pool size.
+        """
+        count = self.size if count is None else min(count, self.size)
+        with self.locked() as pool:
+            while len(pool['idle']) + len(pool['in_use']) < count:
+                pool['idle'].append({'name': dataset.create_pool_dataset(self.userid, self.log)['name'],
+                                     'released': time.time()})
+        return
+
+
+    def drain(self) -> None:
+        """
+        Delete all of the idle datasets in the pool.
+        """
+        with self.locked() as pool:
+            for entry in pool['idle']:
+                self.delete(entry['name'])
+            pool['idle'] = []
+        return
+
+
+    def locked(self):
+        return _LockedPool(self)
+
+
+    def evict(self, pool: dict) -> None:
+        # Take back datasets from processes that are gone.
+        for entry in list(pool['in_use']):
+            if not pid_alive(entry['pid']):
+                pool['in_use'].remove(entry)
+                pool['idle'].append({'name': entry['name'], 'released': time.time()})
+
+        # Oldest datasets first, so the ones at the end are the ones handed out.
+        pool['idle'].sort(key=lambda entry: entry['released'])
+        now = time.time()
+        while len(pool['idle']) > 0 and \
+              ((len(pool['idle']) + len(pool['in_use']) > self.size) or
+               (now - pool['idle'][0]['released'] > self.max_idle)):
+            self.delete(pool['idle'].pop(0)['name'])
+        return
+
+
+    def delete(self, dataset_name: str) -> None:
+        if self.log is not None:
+            self.log.debug(f'Deleting spool dataset {dataset_name}')
+        get_backend(self.log).delete(dataset_name)
+        return
+
+
+class _LockedPool():
+    # Hold the pool file lock and the pool contents for a with block, and save
+    # the pool on the way out.
+    def __init__(self, spool_pool: SpoolPool):
+        self.spool_pool = spool_pool
+        self.f = None
+        self.pool = None
+        return
+
+
+    def __enter__(self) -> dict:
+        os.makedirs(self.spool_pool.pool_path, exist_ok=True)
+        self.f = open(self.spool_pool.pool_file_name, 'a+', encoding='utf-8')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        self.f.seek(0)
+        try:
+            self.pool = json.loads(self.f.read() or '{}')
+        except ValueError:
+            self.pool = {}
+        self.pool.setdefault('idle', [])
+        self.pool.setdefault('in_use', [])
+        self.spool_pool.evict(self.pool)
+        return self.pool
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            self.f.seek(0)
+            self.f.truncate()
+            json.dump(self.pool, self.f, indent=2)
+            self.f.flush()
+        finally:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
+        return
+
@@ -0,0 +1,207 @@
+"""
+  reap.py - clean up the temporary resources that ztron processes left behind.
+
+    A job deletes its temporary spool datasets and files when it ends, but a
+    process that is killed, or a system that goes down, leaves them behind.
+    Every process records what it creates in its ledger (see ledger.py), so
+    anything still claimed by a process that is no longer running, and older
+    than the age threshold, is an orphan.  Temporary resources that aren't in
+    any ledger (from before there were ledgers, or whose ledger was lost) can
+    be reaped too, by name pattern and age, with --unowned.  Datasets go by
+    the creation date in the catalog, and are left alone if it can't be read.
+
+    Pooled spool datasets (<userid>.ZTPOOL.*) are never reaped here.  The spool
+    pool takes those back itself.
+
+    Only resources named the way ztron names them are ever deleted, whatever
+    a ledger says: /tmp/<userid>_ZT*.txt files, and <userid>.ZTSPOOL.* and
+    <userid>.ZTPOOL.* datasets.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, glob, time, fnmatch, argparse
+
+from ztron import ledger
+from ztron.mvs import dataset
+from ztron.mvs.backend import get_backend
+from ztron.uss.user import get_userid
+
+# Resources younger than this many hours are left alone by default.
+DEFAULT_AGE_HOURS = 24
+
+
+def is_temporary(kind: str, name: str, userid: str) -> bool:
+    """
+    Is a resource named like the temporary files and datasets ztron creates
+    for a userid?  Files are made by create_temp_txt_file(), and datasets by
+    create_spool_dataset() and create_pool_dataset().
+    """
+    if kind == ledger.FILE:
+        return (os.path.dirname(name) == '/tmp') and \
+               fnmatch.fnmatchcase(os.path.basename(name), f'{userid}_ZT*.txt')
+    if kind == ledger.DATASET:
+        return any(fnmatch.fnmatchcase(name, f'{userid}.{qualifier}.*')
+                   for qualifier in ('ZTSPOOL', 'ZTPOOL'))
+    return False
+
+
+def find_orphans(userid: str, min_age: float, unowned: bool=False) -> list:
+    """
+    Find the temporary resources of a userid that can be reaped.
+
+    Params:
+        userid: The userid whose resources to look for.
+        min_age: Only resources created at least this many seconds ago.
+        unowned: Also look for temporary resources that no ledger claims.
+    Returns:
+        A list of (kind, name, ledger file) tuples.  The ledger file is None
+        for unowned resources.
+    """
+    now = time.time()
+    ledger_path = ledger.get_ledger_path(userid)
+    orphans = []
+    claimed = set()
+    for file_name, host, pid in ledger.list_ledgers(ledger_path):
+        try:
+            owned = ledger.read_ledger(file_name)
+        except OSError:
+            continue
+        claimed.update(owned)
+        if ledger.owner_alive(host, pid):
+            continue
+        for (kind, name), ts in owned.items():
+            # Anything else in a ledger didn't come from ztron.
+            if not is_temporary(kind, name, userid):
+                continue
+            if now - ts >= min_age:
+                orphans.append((kind, name, file_name))
+
+    if not unowned:
+        return orphans
+
+    # Temporary files are named by create_temp_txt_file() in the system temp
+    # directory, and spool datasets by create_spool_dataset().
+    for file_name in sorted(glob.glob(f'/tmp/{userid}_ZT*.txt')):
+        if (ledger.FILE, file_name) in claimed:
+            continue
+        try:
+            if now - os.path.getmtime(file_name) >= min_age:
+                orphans.append((ledger.FILE, file_name, None))
+        except OSError:
+            pass
+
+    # Ledgers are kept per host, so a dataset no ledger here claims may belong
+    # to a job running on another system that shares the catalog.  Only reap
+    # the ones the catalog says are old enough, and leave any whose age can't
+    # be told.
+    backend = get_backend()
+    for dataset_name in dataset.list_dataset_names(f'{userid}.ZTSPOOL.**'):
+        if (ledger.DATASET, dataset_name) in claimed:
+            continue
+        created = backend.created(dataset_name)
+        if (created is not None) and (now - created >= min_age):
+            orphans.append((ledger.DATASET, dataset_name, None))
+    return orphans
+
+
+def reap(orphans: list, dry_run: bool=False) -> dict:
+    """
+    Delete orphaned resources, and release them in the ledgers of the
+    processes that owned them.
+
+    Params:
+        orphans: The list of orphans from find_orphans().
+        dry_run: Only report what would be deleted.
+    Returns:
+        A dictionary with the lists of resources that were deleted and that
+        could not be deleted.
+    """
+    if dry_run:
+        return {'deleted': [], 'failed': []}
+
+    deleted = []
+    failed = []
+    for kind, name, _ in orphans:
+        if kind != ledger.FILE:
+            continue
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            failed.append(name)
+            continue
+        deleted.append(name)
+
+    # Datasets are deleted in bulk, which is much faster than one at a time.
+    dataset_names = [name for kind, name, _ in orphans if kind == ledger.DATASET]
+    failed_datasets = dataset.delete_datasets(dataset_names)
+    deleted += [name for name in dataset_names if name not in failed_datasets]
+    failed += failed_datasets
+
+    # Release what was deleted in the ledgers of the processes that owned it,
+    # so prune_ledgers() can remove those ledgers once they're empty.
+    deleted_set = set(deleted)
+    for kind, name, owner in orphans:
+        if (owner is not None) and (name in deleted_set):
+            ledger.append('release', kind, name, owner)
+    return {'deleted': deleted, 'failed': failed}
+
+
+def prune_ledgers(userid: str) -> int:
+    """
+    Remove the ledgers of dead processes that don't claim anything.  Returns
+    the number removed.
+    """
+    n_pruned = 0
+    for file_name, host, pid in ledger.list_ledgers(ledger.get_ledger_path(userid)):
+        if ledger.owner_alive(host, pid):
+            continue
+        try:
+            if len(ledger.read_ledger(file_name)) == 0:
+                os.remove(file_name)
+                n_pruned += 1
+        except OSError:
+            pass
+    return n_pruned
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser('ztron reap',
+                                 description='Delete temporary datasets and files '
+                                             'left behind by ztron jobs that ended abnormally')
+    ap.add_argument('--userid', default=None,
+                    help='userid whose resources to reap (default: the caller)')
+    ap.add_argument('--age', type=float, default=DEFAULT_AGE_HOURS,
+                    help=f'only reap resources at least this many hours old (default: {DEFAULT_AGE_HOURS})')
+    ap.add_argument('--dry-run', action='store_true',
+                    help='list what would be reaped without deleting anything')
+    ap.add_argument('--unowned', action='store_true',
+                    help='also reap temporary resources that no ledger claims')
+    return ap
+
+
+def main(argv: list=None) -> int:
+    args = arg_parser().parse_args(argv)
+    userid = get_userid() if args.userid is None else args.userid.upper()
+
+    orphans = find_orphans(userid, args.age*60*60, args.unowned)
+    verb = 'Would reap' if args.dry_run else 'Reaping'
+    for kind, name, owner in orphans:
+        source = 'unowned' if owner is None else os.path.basename(owner)
+        print(f'{verb} {kind} {name} ({source})')
+
+    results = reap(orphans, args.dry_run)
+    for name in results['failed']:
+        print(f'Failed to delete {name}')
+    if not args.dry_run:
+        n_pruned = prune_ledgers(userid)
+        print(f"Reaped {len(results['deleted'])} of {len(orphans)} orphaned resources, "
+              f"pruned {n_pruned} empty ledgers")
+    else:
+        print(f'{len(orphans)} orphaned resources found')
+    return 0 if len(results['failed']) == 0 else 1
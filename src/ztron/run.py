@@ -1,26 +1,117 @@
+import sys
 
-from ztron.job import Job
+# ztron is started many times a day, and Python startup on z/OS is slow, so 
+# this module imports nothing heavy.  Each command imports what it needs when
+# it runs.  Help is put together from the argument parsers of the commands, 
+# so it only imports them when it's asked for.
+
+# Each command, the module with its argument parser, and the parser function.
+COMMANDS = [
+    (None, 'ztron.run', 'job_arg_parser'),
+    ('--jobs', 'ztron.batch', 'arg_parser'),
+    ('reap', 'ztron.reap', 'arg_parser'),
+    ('serve', 'ztron.daemon', 'serve_arg_parser'),
+    ('submit', 'ztron.daemon', 'submit_arg_parser'),
+    ('bench', 'ztron.bench', 'arg_parser'),
+]
+
+def job_arg_parser(job: str='', userid: str=''):
+    """
+    The argument parser of ztron running a job.  The defaults are the job
+    descriptor and userid the job already has.
+    """
+    import argparse
+    ap = argparse.ArgumentParser('ztron', description='Run a series of tasks and manage the output.')
+    ap.add_argument('--job', default=job, help='the job descriptor (YAML) to run')
+    ap.add_argument('--userid', default=userid,
+                    help='run as this userid instead of the one in the descriptor')
+    ap.add_argument('--log_type', default='warning',
+                    help='info, warning, error, critical or debug')
+    return ap
+
+def usage() -> str:
+    """
+    The help of ztron: the usage of every command, what each one does, and the
+    options of running a job.  Each command has its own --help with the rest.
+    """
+    import importlib, textwrap
+    parsers = [(command, getattr(importlib.import_module(module), function)())
+               for command, module, function in COMMANDS]
+
+    prefix = 'usage: '
+    lines = []
+    for command, ap in parsers:
+        lines.append(ap.format_usage().strip()[len(prefix):])
+    text = prefix + ('\n' + ' ' * len(prefix)).join(lines)
+
+    job_ap = parsers[0][1]
+    text += f'\n\n{job_ap.description}\n\ncommands:\n'
+    for command, ap in parsers[1:]:
+        text += textwrap.fill(ap.description, 79, initial_indent=f'  {command:10}  ',
+                              subsequent_indent=' ' * 14) + '\n'
+
+    # The options of running a job, without its usage and description.
+    job_help = job_ap.format_help()
+    return text + '\n' + job_help[job_help.rindex('\n\n') + 2:].rstrip()
+
+def main(argv: list=None) -> int:
+    # ztron reap [options] cleans up after jobs that didn't, ztron serve and 
+    # ztron submit run jobs on a daemon, ztron bench measures performance, and
+    # ztron --jobs runs a batch of jobs.  Anything else runs a job.
+    if argv is None:
+        argv = sys.argv[1:]
+    if (len(argv) > 0) and (argv[0] == 'reap'):
+        from ztron import reap
+        return reap.main(argv[1:])
+    if (len(argv) > 0) and (argv[0] in ('serve', 'submit')):
+        from ztron import daemon
+        return daemon.main(argv)
+    if (len(argv) > 0) and (argv[0] == 'bench'):
+        from ztron import bench
+        return bench.main(argv[1:])
+    if ('-h' in argv) or ('--help' in argv):
+        print(usage())
+        return 0
+    if any((arg == '--jobs') or arg.startswith('--jobs=') for arg in argv):
+        from ztron import batch
+        return batch.main(argv)
+    return run_job()
+
+def run_job(args: dict=None) -> int:
+    from ztron.job import Job
+
+    # Everything the job allocates is released when the with block ends.
+    with Job(args) as job:
+        return run_application(job)
+
+def run_application(job) -> int:
+    """
+    Run the application of a job.  Returns the highest rc of its commands.
+    """
+    from ztron.mvs import pds
 
-def run_job():
-    job = Job()
     job.log_job_desc()
     appl_args = job.get_appl_args()
-    job.create_DD_dataset('SYSUT1', appl_args['from_pds'])
-    job.create_DD_dataset('SYSUT2', appl_args['to_pds'])
-    job.create_spool_DD()
-
-    # Build the copy job, including the PDS members to copy.
-    if ('members' in appl_args) and (len(appl_args['members'])> 0):
-        # TODO: chunk this into 80 char strings so we don't exceed
-        # the limit when adding PDS members to the list.
-        members = ','.join(appl_args['members'])
-        task = [' COPY OUTDD=SYSUT2,INDD=((SYSUT1,R))',
-               f' SELECT MEMBER=({members})'
-               ]
-        job.create_task_DD(task)
-
-        # Now perform the member copy.
-        job.run('IEBCOPY', job.get_DD_list())
+
+    # Copy the PDS members, split across as many IEBCOPY runs as asked for.
+    # An incremental copy only copies the members that changed since the 
+    # last one, and can copy all members when none are listed.
+    results = {'rc': 0}
+    if appl_args.get('incremental', False):
+        results = pds.incremental_copy(job,
+                                       appl_args['from_pds'],
+                                       appl_args['to_pds'],
+                                       appl_args.get('members'),
+                                       appl_args.get('shards', 1),
+                                       appl_args.get('workers'),
+                                       appl_args.get('delete_stale', False))
+        job.show()
+    elif ('members' in appl_args) and (len(appl_args['members'])> 0):
+        results = pds.copy_members(job,
+                                   appl_args['from_pds'],
+                                   appl_args['to_pds'],
+                                   appl_args['members'],
+                                   appl_args.get('shards', 1),
+                                   appl_args.get('workers'))
         job.show()
-    
-    job.term()
\ No newline at end of file
+    return results.get('rc', 0)
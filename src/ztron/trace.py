@@ -0,0 +1,134 @@
+"""
+  trace.py - timing spans of a job, written as a Chrome trace event file.
+
+    The spans nest the way the work does:
+
+        job
+          job.init - descriptor parse, log and spool pool setup
+          step - a program run by Job.run()
+            command - command.run()
+              mvscmd.execute - the program itself
+              show results - cmd_show_results()
+                spool read
+          DD allocation - a spool dataset or a SYSIN file
+
+    Each span is a complete ('X') event on the track of the thread that ran
+    it, so commands run side by side show up side by side.  The file goes next
+    to the job's log (<log>.trace.json), and opens in chrome://tracing or
+    https://ui.perfetto.dev as a timeline of where the time went.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, time, threading
+
+
+class _Span():
+    # Time a with block, and record it as a span when it ends.
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+        return
+
+    def __enter__(self) -> '_Span':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        if exc_type is not None:
+            self.args['error'] = f'{exc_type.__name__}: {exc_value}'
+        self.tracer.complete(self.name, self.cat, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class _NoSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer():
+    """
+    The spans of a job.  Safe to add to from more than one thread.
+    """
+    def __init__(self):
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        # Span times are kept with the performance counter, and written out
+        # in microseconds since the tracer started.
+        self.base = time.perf_counter()
+        self.wall_start = time.time()
+        return
+
+
+    def span(self, name: str, cat: str='ztron', **args) -> _Span:
+        """
+        Time a with block as a span.
+
+        Params:
+            name: What the span is, like 'command'.
+            cat: The category of the span.
+            args: Details to show with the span, like the program name.
+        """
+        return _Span(self, name, cat, args)
+
+
+    def complete(self, name: str, cat: str, start: float, end: float, args: dict=None) -> None:
+        """
+        Add a span that has already ended.  start and end are
+        time.perf_counter() values.
+        """
+        thread = threading.current_thread()
+        tid = threading.get_native_id()
+        event = {'name': name, 'cat': cat, 'ph': 'X',
+                 'ts': round((start - self.base) * 1e6, 3),
+                 'dur': round((end - start) * 1e6, 3),
+                 'pid': self.pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.threads.setdefault(tid, thread.name)
+            self.events.append(event)
+        return
+
+
+    def write(self, file_name: str) -> None:
+        """
+        Write the trace event file.
+        """
+        import json
+
+        with self.lock:
+            events = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                       'args': {'name': thread_name}}
+                      for tid, thread_name in self.threads.items()]
+            events += sorted(self.events, key=lambda event: event['ts'])
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms',
+                       'otherData': {'start': self.wall_start}}, f, default=str)
+        return
+
+
+def span(log, name: str, cat: str='ztron', **args):
+    """
+    Time a with block as a span in the trace of the job a log belongs to.
+    Does nothing for a log without a tracer, or no log at all.
+    """
+    tracer = getattr(log, 'tracer', None)
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, cat, **args)
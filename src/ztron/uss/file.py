@@ -1,11 +1,14 @@
 import os
+import itertools
 from datetime import datetime
 
+from ztron import ledger
 from ztron.log import Log
 from ztron.uss.user import get_userid
+from ztron.mvs.backend import get_backend
 
-from zoautil_py.ztypes import DDStatement, FileDefinition
-
+# Keeps temp file names unique when more than one is created in a second.
+_temp_file_seq = itertools.count()
 
 def create_file(name: str='', codepage='utf-8', log:Log=None) -> None:
     """
@@ -16,6 +19,9 @@ def create_file(name: str='', codepage='utf-8', log:Log=None) -> None:
         codepage: Encoding of file contents.  Defaults to UTF-8.
     Returns:
         None
+    Raises:
+        FileExistsError if there is already a file by that name, or the
+        error that kept the file from being created.
     """
     if len(name) == 0:
         log.error('Please supply a name for the file to create.')
@@ -29,10 +35,12 @@ def create_file(name: str='', codepage='utf-8', log:Log=None) -> None:
             f = open(name, 'x')
         f.close()
 
+    except FileExistsError:
+        raise
     except Exception as e:
         log.error(f'Error - failed to create {name}')
-        log.error(f'{e.message}')
-        log.error(f'{e.args}')
+        log.error(f'{e!r}')
+        raise
     return
 
 
@@ -44,7 +52,7 @@ def create_temp_txt_file(prefix:str='',
     """
     Create a temporary file in the specified working directory.  The 
     file will be created at this location:
-       <working_dir>/<prefix>_<qualifier>'_yyyymmdd_hhmmss.txt
+       <working_dir>/<prefix>_<qualifier>'_yyyymmdd_hhmmss_<pid>_<seq>.txt
 
     Params:
         prefix: The prefix of the file (defaults to userid).
@@ -67,26 +75,35 @@ def create_temp_txt_file(prefix:str='',
             file_name = prefix + '_' + qualifier + '_'
 
     # Create a human-readable date and time to build the rest of the file name.
-    now = datetime.now()
-    suffix = str(now.year).zfill(4)+str(now.month).zfill(2)+str(now.day).zfill(2)+'_'
-    suffix += str(now.hour).zfill(2)+str(now.minute).zfill(2)+str(now.second).zfill(2)
-    file_path = f"{working_dir}/{file_name}{suffix}.txt"
-
-    create_file(file_path, codepage, log)
+    # The pid and sequence number keep names unique when several are made in
+    # the same second, like the SYSIN files of parallel IEBCOPY shards, and
+    # the file is only ever created new, so try the next one if it's taken.
+    while True:
+        now = datetime.now()
+        suffix = str(now.year).zfill(4)+str(now.month).zfill(2)+str(now.day).zfill(2)+'_'
+        suffix += str(now.hour).zfill(2)+str(now.minute).zfill(2)+str(now.second).zfill(2)
+        suffix += f'_{os.getpid()}_{next(_temp_file_seq)}'
+        file_path = f"{working_dir}/{file_name}{suffix}.txt"
+        try:
+            create_file(file_path, codepage, log)
+            break
+        except FileExistsError:
+            continue
+    ledger.claim(ledger.FILE, file_path)
     log.debug(f'File {file_path} created')
     return file_path
 
 
-def create_DD(name: str, file: str, log:Log=None) -> DDStatement:
+def create_DD(name: str, file: str, log:Log=None):
     '''Create a Data Definition (DD) for a USS file
 
     Args:
         name - DD name to associate with a file
         file - the file to associate with a DD name
 
-    Return - a ZOAU DDStatement
+    Return - a DD statement of the backend, like a ZOAU DDStatement
     '''
-    return DDStatement(name.upper(), FileDefinition(file))
+    return get_backend(log).file_dd(name.upper(), file)
 
 
 def build_task_file(deck: list, codepage: str='cp1047', log:Log=None) -> str:
@@ -115,7 +132,9 @@ def build_task_file(deck: list, codepage: str='cp1047', log:Log=None) -> str:
                     log.error('Input lines must be less than 72 chars')
                     log.error(f'   {card:40}... is length: {len(card)} and is ignored')
                     
-    except:
+    except Exception as e:
+        log.error(f'Error - failed to write SYSIN file {task_file_name}')
+        log.error(f'{e!r}')
         os.remove(task_file_name)
-        task.file = ''
+        raise
     return task_file_name
\ No newline at end of file
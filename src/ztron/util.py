@@ -1,4 +1,54 @@
-import time
+import os, stat, time, importlib
 
 def timestamp():
-    return time.strftime('%Y%m%d-%H:%M:%S')
\ No newline at end of file
+    return time.strftime('%Y%m%d-%H:%M:%S')
+
+
+def private_dir(path: str, create: bool=True) -> bool:
+    """
+    Check that a directory belongs to this user alone.  ztron keeps some of
+    its directories in /tmp, where another user could have made one with the
+    same name first, so they're only used when nobody else can get in.
+
+    Params:
+        path: The directory.
+        create: Create it, with mode 0700, if it isn't there.
+    Returns:
+        True if the directory is owned by this user, and its group and others
+        have no access to it.  False if not, or if it isn't there.
+    """
+    if create:
+        try:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+        except OSError:
+            pass
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and (st.st_uid == os.geteuid()) and (st.st_mode & 0o077 == 0)
+
+
+class LazyModule():
+    """
+    A module that isn't imported until one of its attributes is used.  ztron
+    starts up many times a day, and Python startup on z/OS is slow, so modules
+    that not every run needs (like ZOAU) are imported through one of these:
+
+        datasets = LazyModule('zoautil_py.datasets')
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        return
+
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<LazyModule {self._name!r} ({state})>'
@@ -0,0 +1,150 @@
+"""
+  conftest.py - fixtures shared by the ztron tests.
+
+    The tests run jobs on the simulator backend (see mvs/simulator.py), so
+    they need neither z/OS nor ZOAU.  Each test gets a scratch directory of
+    its own for the simulated datasets, the job's home, the ledgers and the
+    descriptor cache.  The pipeline in orig/ is tested the same way, with
+    test/ispzint_double.py standing in for the ISPF gateway.
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, sys, importlib
+
+import pytest
+
+TEST_PATH = os.path.dirname(os.path.abspath(__file__))
+ORIG_PATH = os.path.join(TEST_PATH, '..', 'orig')
+ISPZINT_DOUBLE = f'{sys.executable} {os.path.join(TEST_PATH, "ispzint_double.py")}'
+
+sys.path.insert(0, os.path.join(TEST_PATH, '..', 'src'))
+
+from ztron import ledger
+from ztron.mvs import backend
+
+USERID = 'ZTTEST'
+
+# The pipeline's modules import each other by their bare names, and its cmd.py
+# has the same name as the standard library module that pytest has already
+# imported.  Once imported, it's kept here instead of in sys.modules.
+_orig_cmd = None
+
+
+def import_orig(name: str):
+    """
+    Import a module of the pipeline in orig/, the way orig/ztron.py would.
+
+    Params:
+      name - the module's name, like 'scheduler'
+    Returns:
+      the module
+    """
+    global _orig_cmd
+    stdlib_cmd = sys.modules.pop('cmd', None)
+    if _orig_cmd is not None:
+        sys.modules['cmd'] = _orig_cmd
+    sys.path.insert(0, ORIG_PATH)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(ORIG_PATH)
+        _orig_cmd = sys.modules.pop('cmd', _orig_cmd)
+        if stdlib_cmd is not None:
+            sys.modules['cmd'] = stdlib_cmd
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    """
+    A scratch directory for a test, with the ledgers, the descriptor cache and
+    the default simulator directory in it, and no backends left over from
+    other tests.
+    """
+    monkeypatch.setenv('ZTRON_LEDGER_PATH', str(tmp_path / 'ledger'))
+    monkeypatch.setenv('ZTRON_CACHE_PATH', str(tmp_path / 'cache'))
+    monkeypatch.setenv('ZTRON_SIMULATOR_PATH', str(tmp_path / 'datasets'))
+    monkeypatch.delenv('ZTRON_BACKEND', raising=False)
+    monkeypatch.setattr(backend, '_backends', {})
+    monkeypatch.setattr(ledger, '_owned', set())
+    monkeypatch.setattr(ledger, '_refused', set())
+    return tmp_path
+
+
+@pytest.fixture
+def write_job(scratch):
+    """
+    Write a job descriptor that copies members between two PDSs.  Returns a
+    function that takes the descriptor's name, and its backend, members,
+    shards and spool pool size, and returns the descriptor's file name.
+    """
+    def write(name: str='job', backend_opts: dict=None, members: list=None,
+              shards: int=1, spool_pool: int=None) -> str:
+        lines = [f'Name: {name}',
+                 'Description: ztron test job',
+                 'Environment:',
+                 f'  userid: {USERID}',
+                 '  home:',
+                 f'    Root: {scratch / name}',
+                 '    Logs: logs',
+                 '    Spool: spool',
+                 '  log_type: info',
+                 '  spool_output:',
+                 '    policy: always']
+        if spool_pool is not None:
+            lines += ['  spool_pool:', f'    size: {spool_pool}']
+        if backend_opts is not None:
+            lines += ['  backend:'] + [f'    {key}: {value}' for key, value in backend_opts.items()]
+        lines += ['Application:',
+                  '  name: copy_pds.py',
+                  '  args:',
+                  f'    from_pds: {USERID}.SOURCE',
+                  f'    to_pds: {USERID}.TARGET',
+                  f'    shards: {shards}',
+                  '    members:']
+        lines += [f'      - {member}' for member in (members or ['M1'])]
+        file_name = str(scratch / f'{name}.yml')
+        with open(file_name, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return file_name
+
+    return write
+
+
+@pytest.fixture
+def pipeline_log(tmp_path):
+    """
+    A log for a pipeline from orig/, in the test's temporary directory.
+    """
+    log = import_orig('log').Log('pipeline', str(tmp_path / 'logs'), 'info')
+    yield log
+    log.cleanup()
+
+
+def read_log(log) -> list:
+    """
+    Returns:
+      the lines written to the main log file of a pipeline log so far
+    """
+    log.stage_end()
+    with open(log.main_log_file.abs_log_file_path) as f:
+        return [line for line in f.read().splitlines() if len(line) > 0]
+
+
+@pytest.fixture
+def cmd_env(tmp_path):
+    """
+    The environment pipeline commands run in, with ISPZINT on the PATH, played
+    by test/ispzint_double.py without its startup delay.
+    """
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    ispzint = bin_path / 'ISPZINT'
+    ispzint.write_text(f'#!/bin/sh\nexec {ISPZINT_DOUBLE}\n')
+    ispzint.chmod(0o755)
+    return dict(os.environ,
+                PATH=f'{bin_path}{os.pathsep}{os.environ.get("PATH", "")}',
+                ISPZINT_DOUBLE_STARTUP='0')
@@ -1,29 +1,33 @@
 import sys
 from ztron.job import Job
+from ztron.mvs import pds
 
 
 def main(argc=0, argv=None):
-    job = Job()
-    job.log_job_desc()
-    appl_args = job.get_appl_args()
-    job.create_DD_dataset('SYSUT1', appl_args['from_pds'])
-    job.create_DD_dataset('SYSUT2', appl_args['to_pds'])
-    job.create_spool_DD()
+    # Everything the job allocates is released when the with block ends.
+    with Job() as job:
+        job.log_job_desc()
+        appl_args = job.get_appl_args()
 
-    # Build the copy job, including the PDS members to copy.
-    if ('members' in appl_args) and (len(appl_args['members'])> 0):
-        # TODO: chunk this into 80 char strings so we don't exceed
-        # the limit when adding PDS members to the list.
-        members = ','.join(appl_args['members'])
-        task = [' COPY OUTDD=SYSUT2,INDD=((SYSUT1,R))',
-               f' SELECT MEMBER=({members})'
-               ]
-        job.create_task_DD(task)
+        # Copy the PDS members, split across as many IEBCOPY runs as asked for.
+        # An incremental copy only copies the members that changed since the 
+        # last one, and can copy all members when none are listed.
+        if appl_args.get('incremental', False):
+            pds.incremental_copy(job,
+                                 appl_args['from_pds'],
+                                 appl_args['to_pds'],
+                                 appl_args.get('members'),
+                                 appl_args.get('shards', 1),
+                                 appl_args.get('workers'),
+                                 appl_args.get('delete_stale', False))
+        elif ('members' in appl_args) and (len(appl_args['members'])> 0):
+            pds.copy_members(job,
+                             appl_args['from_pds'],
+                             appl_args['to_pds'],
+                             appl_args['members'],
+                             appl_args.get('shards', 1),
+                             appl_args.get('workers'))
 
-        # Now perform the member copy.
-        job.run('IEBCOPY', job.get_DD_list())
-    
-    job.term()
     return
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+  import_time.py - guard the startup cost of the ztron entry points.
+
+    Imports each entry point in a fresh interpreter under python -X importtime,
+    and fails if it pulls in a module it shouldn't (ZOAU, yaml, argparse, ...),
+    or if it takes longer than its budget.  Each import is timed a few times
+    and the fastest run is kept, to take out the noise of a busy system.
+
+        python test/import_time.py
+        python test/import_time.py --runs 10 --budget-scale 3
+
+  Author: Joe Bostian
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os, sys, argparse, subprocess
+
+# Entry point: (budget in ms, modules it must not import).  The budgets are for
+# the ztron modules alone, not the interpreter startup under them.
+ENTRY_POINTS = {
+    'ztron.run': (5, ['ztron.job', 'logging', 'yaml', 'argparse', 'subprocess',
+                      'zoautil_py']),
+    'ztron.job': (60, ['yaml', 'argparse', 'subprocess', 'socket',
+                       'concurrent.futures', 'zoautil_py']),
+}
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def import_times(module: str) -> dict:
+    """
+    Import a module in a new interpreter.  Returns a dictionary of each module
+    imported to its cumulative import time in microseconds.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([SRC_PATH] + [p for p in [env.get('PYTHONPATH')] if p])
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{proc.stderr}')
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if (len(fields) != 3) or (not fields[1].strip().isdigit()):
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def check(module: str, budget_ms: float, forbidden: list, runs: int) -> list:
+    best = None
+    for _ in range(runs):
+        times = import_times(module)
+        if (best is None) or (times.get(module, 0) < best.get(module, 0)):
+            best = times
+
+    problems = []
+    elapsed_ms = best.get(module, 0) / 1000
+    print(f'{module}: {elapsed_ms:.1f} ms (budget {budget_ms:.1f} ms), {len(best)} modules')
+    for name, usec in sorted(best.items(), key=lambda item: -item[1])[:5]:
+        print(f'    {usec/1000:8.1f} ms  {name}')
+
+    imported = set(best)
+    for name in forbidden:
+        if (name in imported) or any(m.startswith(name + '.') for m in imported):
+            problems.append(f'{module} imports {name}')
+    if elapsed_ms > budget_ms:
+        problems.append(f'{module} took {elapsed_ms:.1f} ms, over its {budget_ms:.1f} ms budget')
+    return problems
+
+
+def main(argv: list=None) -> int:
+    ap = argparse.ArgumentParser('Check the import time of the ztron entry points')
+    ap.add_argument('--runs', type=int, default=5,
+                    help='times to import each entry point, keeping the fastest')
+    ap.add_argument('--budget-scale', type=float, default=1.0,
+                    help='multiply every budget by this, for slower systems')
+    args = ap.parse_args(argv)
+
+    problems = []
+    for module, (budget_ms, forbidden) in ENTRY_POINTS.items():
+        problems += check(module, budget_ms*args.budget_scale, forbidden, max(1, args.runs))
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    return 1 if len(problems) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+  ispzint_double.py - a stand-in for the ISPF gateway (ISPZINT) that speaks the
+                      same STDIN/STDOUT protocol, so pipelines with gateway
+                      sessions can be exercised off of z/OS.  Point a pipeline
+                      at it with:
+                         Gateway_sessions: 2
+                         Gateway_cmd: python3 test/ispzint_double.py
+
+  Each line read from STDIN is treated as one TSO command, so a batch of
+  commands sent in one request gets one <ISPINFO/> block per line.  The reply is some
+  gateway chatter followed by an <ISPINFO/> block with the command, its output,
+  and its return code.  A command of 'TSO EXIT <n>' answers with return code n,
+  'TSO ABEND' ends the session without a reply, and 'TSO HANG' never replies.
+
+  Copyright Contributors to the Ambitus Project.
+
+  SPDX-License-Identifier: Apache-2.0
+"""
+import os
+import sys
+import time
+
+STARTUP_DELAY = float(os.environ.get('ISPZINT_DOUBLE_STARTUP', '0.5'))
+
+
+def reply(cmd: str) -> str:
+    words = cmd.split()
+    rc = 0
+    if len(words) >= 3 and words[1].upper() == 'EXIT':
+        rc = int(words[2])
+    return ('ISPZINT: processing request\n'
+            '<ISPINFO>\n'
+            f'<CMD>{cmd}</CMD>\n'
+            f'<OUTPUT>{os.getpid()}: {cmd.removeprefix("TSO ")}</OUTPUT>\n'
+            f'<RC>{rc}</RC>\n'
+            '</ISPINFO>\n'
+            'ISPZINT: request complete\n')
+
+
+def main():
+    # Starting the real gateway and TSO address space is the expensive part.
+    time.sleep(STARTUP_DELAY)
+    sys.stdout.write('ISPZINT: gateway initialized\n')
+    sys.stdout.flush()
+
+    for line in sys.stdin:
+        cmd = line.rstrip('\n')
+        if len(cmd) == 0:
+            continue
+        if cmd.split()[-1].upper() == 'ABEND':
+            sys.stderr.write(f'ISPZINT: abend processing {cmd}\n')
+            return 12
+        if cmd.split()[-1].upper() == 'HANG':
+            time.sleep(24*60*60)
+        sys.stdout.write(reply(cmd))
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import threading
+
+from conftest import USERID
+from ztron.job import Job
+from ztron.mvs import backend, pds
+
+
+def start_job(job_file: str) -> Job:
+    return Job({'job': job_file, 'userid': '', 'log_type': 'info'})
+
+
+def test_each_job_keeps_its_own_backend(write_job, scratch):
+    simulated = start_job(write_job('simulated', {'name': 'simulator', 'path': scratch / 'ds'}))
+    try:
+        # A job without a backend setting runs on ZOAU, and doesn't move the
+        # job already running to it.
+        zoau = start_job(write_job('zoau'))
+        zoau.term()
+        assert zoau.backend.name == backend.BACKEND_ZOAU
+        assert backend.get_backend(simulated.log) is simulated.backend
+        assert simulated.backend.name == backend.BACKEND_SIMULATOR
+        assert simulated.backend.path == str(scratch / 'ds')
+    finally:
+        simulated.term()
+
+
+def test_jobs_with_the_same_settings_share_a_backend(write_job, scratch):
+    opts = {'name': 'simulator', 'path': scratch / 'ds'}
+    jobs = [start_job(write_job(f'job{i}', opts)) for i in range(2)]
+    for job in jobs:
+        job.term()
+    assert jobs[0].backend is jobs[1].backend
+
+
+def test_environment_variable_picks_the_backend(write_job, scratch, monkeypatch):
+    monkeypatch.setenv('ZTRON_BACKEND', 'SIMULATOR')
+    job = start_job(write_job('zoau'))
+    job.term()
+    assert job.backend.name == backend.BACKEND_SIMULATOR
+    assert job.backend.path == str(scratch / 'datasets')
+
+
+def test_jobs_on_different_backends_run_side_by_side(write_job, scratch):
+    # Each job copies from the source PDS of its own simulator directory.
+    job_files = []
+    for name in ('a', 'b'):
+        opts = {'name': 'simulator', 'path': scratch / f'ds_{name}', 'execute_ms': 20}
+        simulator = backend.select({key: str(value) if key == 'path' else value
+                                    for key, value in opts.items()})
+        simulator.write(f'{USERID}.SOURCE(M1)', f'FROM {name}\n')
+        job_files.append(write_job(name, opts, shards=1))
+
+    results = {}
+
+    def run(job_file):
+        with start_job(job_file) as job:
+            results[job.name] = pds.copy_members(job, f'{USERID}.SOURCE', f'{USERID}.TARGET', ['M1'])
+
+    threads = [threading.Thread(target=run, args=(job_file,)) for job_file in job_files]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {name: result['rc'] for name, result in results.items()} == {'a': 0, 'b': 0}
+    for name in ('a', 'b'):
+        with open(scratch / f'ds_{name}' / f'{USERID}.TARGET' / 'M1') as f:
+            assert f.read() == f'FROM {name}\n'
@@ -0,0 +1,55 @@
+import os
+
+from ztron import descriptor
+
+
+def write_descriptor(scratch) -> str:
+    file_name = str(scratch / 'job.yml')
+    with open(file_name, 'w') as f:
+        f.write('Name: job\nApplication:\n  name: copy_pds.py\n')
+    return file_name
+
+
+def counting_normalize(calls: list):
+    def normalize(desc: dict) -> dict:
+        calls.append(desc['Name'])
+        return {'name': desc['Name']}
+    return normalize
+
+
+def test_descriptor_is_read_from_the_cache(scratch):
+    file_name = write_descriptor(scratch)
+    calls = []
+    for _ in range(3):
+        assert descriptor.load(file_name, counting_normalize(calls)) == {'name': 'job'}
+    assert calls == ['job']
+    assert os.stat(descriptor.get_cache_path()).st_mode & 0o777 == 0o700
+
+
+def test_changed_descriptor_is_parsed_again(scratch):
+    file_name = write_descriptor(scratch)
+    calls = []
+    descriptor.load(file_name, counting_normalize(calls))
+    with open(file_name, 'a') as f:
+        f.write('Description: changed\n')
+    descriptor.load(file_name, counting_normalize(calls))
+    assert calls == ['job', 'job']
+
+
+def test_cache_others_can_get_into_is_not_used(scratch):
+    file_name = write_descriptor(scratch)
+    cache_path = descriptor.get_cache_path()
+    os.makedirs(cache_path, mode=0o700)
+    os.chmod(cache_path, 0o777)
+
+    # An entry planted by someone else isn't read, and nothing is written.
+    planted = descriptor.get_cache_file_name(cache_path, file_name)
+    st = os.stat(file_name)
+    descriptor.write_cache(planted, {'key': (os.path.abspath(file_name), st.st_mtime_ns, st.st_size,
+                                             descriptor.CACHE_VERSION),
+                                     'desc': {'name': 'planted'}})
+    calls = []
+    for _ in range(2):
+        assert descriptor.load(file_name, counting_normalize(calls)) == {'name': 'job'}
+    assert calls == ['job', 'job']
+    assert os.listdir(cache_path) == [os.path.basename(planted)]
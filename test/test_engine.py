@@ -0,0 +1,61 @@
+import asyncio, time
+
+from conftest import import_orig, read_log
+
+engine = import_orig('engine')
+scheduler = import_orig('scheduler')
+stage = import_orig('stage')
+
+
+def build_stage(log, num: int, name: str, *cmds: str, **opts) -> 'stage.Stage':
+    items = [{'Name': name}, {'Depends_on': []}] + [{key.capitalize(): value} for key, value in opts.items()]
+    return stage.Stage(log, items + [{'Cmd': c} for c in cmds], num)
+
+
+def output_lines(log) -> list:
+    return [line.split(' (')[0] for line in read_log(log) if not line.startswith('[')]
+
+
+def test_engine_runs_stages_and_commands_together(pipeline_log, cmd_env):
+    stages = [build_stage(pipeline_log, 0, 'slow', 'sleep 0.6; echo slow-1', 'echo slow-2', parallel=2),
+              build_stage(pipeline_log, 1, 'fast', 'sleep 0.3; echo fast-1', 'TSO A', 'exit 4', parallel=2)]
+    start_time = time.time()
+    rc = engine.AsyncEngine(pipeline_log, cmd_env).run(scheduler.Scheduler(pipeline_log, stages, 2))
+
+    assert time.time() - start_time < 1.2
+    assert rc == 4
+    assert [s.rc for s in stages] == [0, 4]
+    lines = output_lines(pipeline_log)
+    assert any(line.endswith(': A</OUTPUT>') for line in lines)
+    assert lines.index('--- fast complete') < lines.index('--- slow ---------------------------')
+    assert lines[lines.index('--- slow ---------------------------'):] == \
+        ['--- slow ---------------------------', 'slow-1', 'slow-2', '--- slow complete']
+
+
+def test_engine_runs_inside_a_running_event_loop(pipeline_log, cmd_env):
+    # The way a Jupyter kernel calls it.
+    async def notebook_cell():
+        stages = [build_stage(pipeline_log, 0, 'only', 'echo hello')]
+        return engine.AsyncEngine(pipeline_log, cmd_env).run(scheduler.Scheduler(pipeline_log, stages, 1))
+
+    assert asyncio.run(notebook_cell()) == 0
+    assert 'hello' in output_lines(pipeline_log)
+
+
+def test_cancel_stops_running_commands(pipeline_log, cmd_env):
+    stages = [build_stage(pipeline_log, 0, 'hang', 'sleep 30')]
+    eng = engine.AsyncEngine(pipeline_log, cmd_env)
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(eng.run_async(scheduler.Scheduler(pipeline_log, stages, 1)))
+        await asyncio.sleep(0.3)
+        eng.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return 'cancelled'
+        return 'finished'
+
+    start_time = time.time()
+    assert asyncio.run(cancel_soon()) == 'cancelled'
+    assert time.time() - start_time < 5
@@ -0,0 +1,64 @@
+import os, time
+
+from conftest import import_orig, ISPZINT_DOUBLE
+
+gateway = import_orig('gateway')
+
+
+def is_running(pid: int) -> bool:
+    # A process that was killed but not yet reaped by its parent is a zombie.
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                if f.read().rsplit(') ', 1)[1][0] == 'Z':
+                    return False
+        except FileNotFoundError:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def gateway_pid(out: bytes) -> int:
+    return int(gateway.find_ispinfo(out.decode())[0].split('<OUTPUT>')[1].split(':')[0])
+
+
+def test_pool_reuses_sessions(pipeline_log, cmd_env):
+    pool = gateway.GatewayPool(pipeline_log, cmd_env, 1, ISPZINT_DOUBLE)
+    try:
+        rc, first, err = pool.run('TSO A')
+        assert rc == 0
+        rc, second, err = pool.run('TSO EXIT 8')
+        assert rc == 0
+        assert gateway_pid(first) == gateway_pid(second)
+        assert gateway.ispinfo_rc(gateway.find_ispinfo(second.decode())[0]) == 8
+    finally:
+        pool.cleanup()
+
+
+def test_hung_gateway_is_killed(pipeline_log, cmd_env):
+    # The gateway runs under a shell that doesn't exec it, so stopping just
+    # the shell would leave the gateway running.
+    session = gateway.GatewaySession(pipeline_log, cmd_env, f'{ISPZINT_DOUBLE}; exit $?', timeout=1)
+    rc, out, err = session.send('TSO A')
+    pid = gateway_pid(out)
+
+    rc, out, err = session.send('TSO HANG')
+    assert rc != 0
+    assert b'gateway timed out after 1 seconds' in err
+    assert session.proc is None
+    assert not is_running(pid)
+
+
+def test_pool_replaces_a_session_that_ended(pipeline_log, cmd_env):
+    pool = gateway.GatewayPool(pipeline_log, cmd_env, 1, ISPZINT_DOUBLE)
+    try:
+        rc, first, err = pool.run('TSO A')
+        rc, out, err = pool.run('TSO ABEND')
+        assert rc == 12
+        assert b'abend processing TSO ABEND' in err
+        rc, second, err = pool.run('TSO B')
+        assert rc == 0
+        assert gateway_pid(first) != gateway_pid(second)
+    finally:
+        pool.cleanup()
@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import USERID
+from ztron.job import Job
+from ztron.mvs import backend, pds
+from ztron.mvs.backend import BACKEND_SIMULATOR
+
+SOURCE = f'{USERID}.SOURCE'
+TARGET = f'{USERID}.TARGET'
+MEMBERS = [f'M{i}' for i in range(1, 7)]
+
+
+@pytest.fixture
+def simulator(scratch):
+    simulator = backend.select({'name': BACKEND_SIMULATOR, 'path': str(scratch / 'ds')})
+    simulator.create(TARGET, 'LIBRARY')
+    for member in MEMBERS:
+        simulator.write(f'{SOURCE}({member})', f'{member} DATA\n')
+    return simulator
+
+
+@pytest.fixture
+def run_copy(write_job, scratch):
+    job_file = write_job(backend_opts={'name': BACKEND_SIMULATOR, 'path': scratch / 'ds'}, members=MEMBERS)
+
+    def run(members: list=None, shards: int=1, delete_stale: bool=False) -> dict:
+        with Job({'job': job_file, 'userid': '', 'log_type': 'info'}) as job:
+            return pds.incremental_copy(job, SOURCE, TARGET, members, shards, delete_stale=delete_stale)
+
+    return run
+
+
+def test_unchanged_members_are_skipped_without_being_read(simulator, run_copy, monkeypatch):
+    assert run_copy()['copied'] == MEMBERS
+
+    reads = []
+    read = simulator.read
+    monkeypatch.setattr(simulator, 'read', lambda name, tail=0: reads.append(name) or read(name, tail))
+    results = run_copy()
+    assert results['copied'] == []
+    assert results['skipped'] == MEMBERS
+    assert [name for name in reads if '(' in name] == []
+
+
+def test_changed_member_is_copied_again(simulator, run_copy):
+    run_copy()
+    simulator.write(f'{SOURCE}(M2)', 'M2 CHANGED\n')
+
+    results = run_copy()
+    assert results['copied'] == ['M2']
+    assert simulator.read(f'{TARGET}(M2)') == 'M2 CHANGED'
+
+
+def test_missing_member_makes_the_rc_4(simulator, run_copy):
+    results = run_copy(['M1', 'NOPE'])
+    assert results['rc'] == 4
+    assert results['missing'] == ['NOPE']
+    assert results['copied'] == ['M1']
+
+
+def test_only_members_from_the_manifest_are_deleted(simulator, run_copy):
+    simulator.write(f'{TARGET}(OTHER)', 'NOT COPIED BY ZTRON\n')
+    run_copy()
+    simulator.delete(f'{SOURCE}(M3)')
+
+    results = run_copy(delete_stale=True)
+    assert results['deleted'] == ['M3']
+    assert simulator.list_members(TARGET) == ['M1', 'M2', 'M4', 'M5', 'M6', 'OTHER']
+
+
+def test_members_of_a_failed_shard_are_copied_again(simulator, run_copy, monkeypatch):
+    # The shard that copies M3 fails.
+    iebcopy = simulator.iebcopy
+
+    def failing_iebcopy(dds: list) -> tuple:
+        rc, messages = iebcopy(dds)
+        if any(message.split()[:2] == ['IEB154I', 'M3'] for message in messages):
+            rc = 8
+        return rc, messages
+
+    monkeypatch.setattr(simulator, 'iebcopy', failing_iebcopy)
+    results = run_copy(shards=3)
+    assert results['rc'] == 8
+    assert [shard['rc'] for shard in results['shards']] == [0, 8, 0]
+
+    monkeypatch.setattr(simulator, 'iebcopy', iebcopy)
+    results = run_copy(shards=3)
+    assert results['rc'] == 0
+    assert results['copied'] == ['M3', 'M4']
@@ -0,0 +1,109 @@
+import os, time, threading
+
+from ztron import log_archive
+from ztron.log import Log
+
+KEEP_ONE = {'keep': 1, 'compress': False}
+
+
+def open_log(log_path: str, name: str, rotation_opts: dict=KEEP_ONE) -> Log:
+    return Log('ztron.log', log_path, 'info', name, rotation_opts=rotation_opts)
+
+
+def old_run(log_path: str, run: str, age_days: float) -> None:
+    # The files a closed run leaves behind, last written age_days ago.
+    then = time.time() - age_days*24*60*60
+    for suffix in ('.log', '.events.jsonl'):
+        file_name = os.path.join(log_path, run + suffix)
+        with open(file_name, 'w') as f:
+            f.write('old\n')
+        os.utime(file_name, (then, then))
+    return
+
+
+def test_old_runs_are_pruned(tmp_path):
+    log_path = str(tmp_path)
+    old_run(log_path, 'ztron_20260101-000000', 30)
+    old_run(log_path, 'ztron_20260102-000000', 29)
+
+    log = open_log(log_path, 'new')
+    log.close()
+    assert sorted(log_archive.list_runs(log_path, 'ztron')) == [log.log_name.removesuffix('.log')]
+
+
+def test_open_runs_are_not_pruned(tmp_path):
+    log_path = str(tmp_path)
+    first = open_log(log_path, 'first')
+    first.logger.info('first run')
+    second = open_log(log_path, 'second')
+    second.logger.info('second run')
+
+    # Both runs are still being written, so neither was pruned, even with
+    # keep: 1, and they didn't get the same name.
+    assert first.log_name != second.log_name
+    assert os.path.exists(first.full_log_name)
+    assert os.path.exists(second.full_log_name)
+    first.close()
+    second.close()
+    with open(first.full_log_name) as f:
+        assert 'first run' in f.read()
+
+
+def test_closed_runs_are_pruned_and_their_names_not_reused(tmp_path):
+    log_path = str(tmp_path)
+    first = open_log(log_path, 'first')
+    first.close()
+    time.sleep(0.01)
+    second = open_log(log_path, 'second')
+
+    assert not os.path.exists(first.full_log_name)
+    assert second.log_name != first.log_name
+    second.close()
+
+
+def test_runs_started_together_are_all_kept(tmp_path):
+    log_path = str(tmp_path)
+    logs = [None] * 8
+    barrier = threading.Barrier(len(logs))
+
+    def start(i):
+        barrier.wait()
+        logs[i] = open_log(log_path, f'job{i}')
+        logs[i].logger.info(f'job {i}')
+
+    threads = [threading.Thread(target=start, args=(i,)) for i in range(len(logs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({log.log_name for log in logs}) == len(logs)
+    for log in logs:
+        assert os.path.exists(log.full_log_name)
+        log.close()
+
+
+def test_locked_run_is_skipped_by_prune_runs(tmp_path):
+    log_path = str(tmp_path)
+    old_run(log_path, 'ztron_20260101-000000', 30)
+    lock = log_archive.lock_run(log_path, 'ztron_20260101-000000')
+    try:
+        with log_archive.directory_lock(log_path, 'ztron'):
+            assert log_archive.prune_runs(log_path, 'ztron', keep=0) == []
+    finally:
+        log_archive.unlock_run(lock)
+
+    with log_archive.directory_lock(log_path, 'ztron'):
+        assert log_archive.prune_runs(log_path, 'ztron', keep=0) == ['ztron_20260101-000000']
+    assert os.listdir(log_path) == ['.ztron.lock']
+
+
+def test_logs_without_rotation_take_no_locks(tmp_path):
+    log_path = str(tmp_path)
+    first = open_log(log_path, 'first', rotation_opts=None)
+    second = open_log(log_path, 'second', rotation_opts=None)
+    assert first.run_lock is None
+    assert first.log_name != second.log_name
+    first.close()
+    second.close()
+    assert sorted(os.listdir(log_path)) == sorted([first.log_name, second.log_name])
@@ -0,0 +1,86 @@
+import os, json
+
+from conftest import USERID
+from ztron.job import Job
+from ztron.mvs import backend, pds
+from ztron.mvs.backend import BACKEND_SIMULATOR
+
+MEMBERS = [f'M{i}' for i in range(1, 8)]
+
+
+def run_copy(job_file: str, members: list, shards: int) -> dict:
+    with Job({'job': job_file, 'userid': '', 'log_type': 'info'}) as job:
+        return pds.copy_members(job, f'{USERID}.SOURCE', f'{USERID}.TARGET', members, shards)
+
+
+def seed(write_job, scratch, shards: int, dsntype: str='LIBRARY') -> tuple:
+    job_file = write_job(backend_opts={'name': BACKEND_SIMULATOR, 'path': scratch / 'ds'},
+                         members=MEMBERS, shards=shards)
+    simulator = backend.select({'name': BACKEND_SIMULATOR, 'path': str(scratch / 'ds')})
+    simulator.create(f'{USERID}.TARGET', dsntype)
+    for member in MEMBERS:
+        simulator.write(f'{USERID}.SOURCE({member})', f'{member} DATA\n')
+    return job_file, simulator
+
+
+def test_shard_members_keeps_order_and_balance():
+    shards = pds.shard_members(MEMBERS, 3)
+    assert [member for shard in shards for member in shard] == MEMBERS
+    assert [len(shard) for shard in shards] == [3, 2, 2]
+    assert pds.shard_members(MEMBERS[:2], 5) == [['M1'], ['M2']]
+
+
+def test_sharded_copy_copies_every_member(write_job, scratch):
+    job_file, simulator = seed(write_job, scratch, 3)
+    results = run_copy(job_file, MEMBERS, 3)
+
+    assert results['rc'] == 0
+    assert results['members'] == len(MEMBERS)
+    assert len(results['shards']) == 3
+    assert simulator.list_members(f'{USERID}.TARGET') == MEMBERS
+    assert simulator.read(f'{USERID}.TARGET(M5)') == 'M5 DATA'
+
+
+def test_sharded_copy_rc_is_the_highest_shard_rc(write_job, scratch):
+    job_file, simulator = seed(write_job, scratch, 3)
+    results = run_copy(job_file, MEMBERS + ['NOTTHERE'], 3)
+
+    assert results['rc'] == 4
+    assert sorted(shard['rc'] for shard in results['shards']) == [0, 0, 4]
+    assert simulator.list_members(f'{USERID}.TARGET') == MEMBERS
+
+
+def test_copy_to_a_pds_is_not_sharded(write_job, scratch):
+    job_file, simulator = seed(write_job, scratch, 3, 'PDS')
+    results = run_copy(job_file, MEMBERS, 3)
+
+    assert results['rc'] == 0
+    assert len(results['shards']) == 1
+    assert simulator.dsntype(f'{USERID}.TARGET') == backend.DSNTYPE_PDS
+    assert simulator.list_members(f'{USERID}.TARGET') == MEMBERS
+
+
+def test_sharded_copy_cleans_up(write_job, scratch):
+    job_file, simulator = seed(write_job, scratch, 3)
+    run_copy(job_file, MEMBERS, 3)
+
+    # The SYSIN files and spool datasets of every shard are gone, and so is
+    # the process's ledger.
+    assert simulator.list_datasets(f'{USERID}.ZTSPOOL.**') == []
+    assert not os.path.exists(scratch / 'ledger') or os.listdir(scratch / 'ledger') == []
+
+
+def test_a_copy_that_cannot_run_is_rc_1(write_job, scratch, monkeypatch):
+    job_file, simulator = seed(write_job, scratch, 1)
+    def fail(*args, **kwargs):
+        raise OSError('IEBCOPY is not there')
+    monkeypatch.setattr(simulator, 'execute', fail)
+
+    with Job({'job': job_file, 'userid': '', 'log_type': 'info'}) as job:
+        results = pds.copy_members(job, f'{USERID}.SOURCE', f'{USERID}.TARGET', MEMBERS, 1)
+        events_file = job.log.events.file_name
+
+    assert results['rc'] == 1
+    with open(events_file) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['rc'] for record in records if record['event'] == 'mvscmd'] == [1]
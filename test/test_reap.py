@@ -0,0 +1,142 @@
+import os, json, time, subprocess
+
+import pytest
+
+from conftest import USERID
+from ztron import ledger, reap
+from ztron.mvs import backend
+
+HOUR = 60*60
+
+
+@pytest.fixture
+def simulator(scratch, monkeypatch):
+    # The reaper runs outside of any job, on the default backend.
+    monkeypatch.setenv('ZTRON_BACKEND', backend.BACKEND_SIMULATOR)
+    return backend.get_backend()
+
+
+def create_spool_dataset(simulator, age_hours: float) -> str:
+    name = simulator.tmp_name(f'{USERID}.ZTSPOOL')
+    simulator.create(name)
+    then = time.time() - age_hours*HOUR
+    os.utime(simulator.file_name(name), (then, then))
+    return name
+
+
+def unowned_datasets(min_age_hours: float) -> list:
+    return [name for kind, name, owner in reap.find_orphans(USERID, min_age_hours*HOUR, True)
+            if (kind == ledger.DATASET) and (owner is None)]
+
+
+def test_unowned_datasets_are_reaped_by_age(simulator):
+    old = create_spool_dataset(simulator, 48)
+    young = create_spool_dataset(simulator, 1)
+
+    assert unowned_datasets(24) == [old]
+    assert sorted(unowned_datasets(0)) == sorted([old, young])
+
+
+def test_unowned_datasets_are_only_found_when_asked(simulator):
+    create_spool_dataset(simulator, 48)
+    assert reap.find_orphans(USERID, 24*HOUR) == []
+
+
+def test_claimed_datasets_are_not_unowned(simulator):
+    old = create_spool_dataset(simulator, 48)
+    ledger.claim(ledger.DATASET, old)
+    try:
+        assert unowned_datasets(24) == []
+    finally:
+        ledger.release(ledger.DATASET, old)
+
+
+def test_datasets_of_unknown_age_are_left_alone(simulator, monkeypatch):
+    create_spool_dataset(simulator, 48)
+    monkeypatch.setattr(simulator, 'created', lambda name: None)
+    assert unowned_datasets(0) == []
+
+
+def test_reap_deletes_old_unowned_datasets(simulator):
+    old = create_spool_dataset(simulator, 48)
+    young = create_spool_dataset(simulator, 1)
+
+    results = reap.reap(reap.find_orphans(USERID, 24*HOUR, True))
+    assert old in results['deleted']
+    assert simulator.list_datasets(f'{USERID}.ZTSPOOL.**') == [young]
+
+
+
+def write_dead_ledger(claims: list, age_hours: float) -> str:
+    # The ledger of a process on this host that was killed before it could
+    # release what it claimed.
+    proc = subprocess.Popen(['true'])
+    proc.wait()
+    ledger_path = ledger.get_ledger_path(USERID)
+    assert ledger.check_ledger_path(ledger_path)
+    file_name = f'{ledger_path}/{os.uname().nodename}_{proc.pid}.jsonl'
+    ts = time.time() - age_hours*HOUR
+    with open(file_name, 'w') as f:
+        for kind, name in claims:
+            f.write(json.dumps({'action': 'claim', 'kind': kind, 'name': name, 'ts': ts}) + '\n')
+    return file_name
+
+
+def test_resources_of_dead_processes_are_reaped(simulator):
+    old = create_spool_dataset(simulator, 48)
+    temp_file = f'/tmp/{USERID}_ZTTEMP_{os.getpid()}_{time.time_ns()}.txt'
+    open(temp_file, 'w').close()
+    file_name = write_dead_ledger([(ledger.DATASET, old), (ledger.FILE, temp_file)], 48)
+
+    orphans = reap.find_orphans(USERID, 24*HOUR)
+    assert sorted(orphans) == sorted([(ledger.DATASET, old, file_name), (ledger.FILE, temp_file, file_name)])
+    results = reap.reap(orphans)
+    assert sorted(results['deleted']) == sorted([old, temp_file])
+    assert not os.path.exists(temp_file)
+    assert simulator.list_datasets(f'{USERID}.ZTSPOOL.**') == []
+
+    # Once everything it claimed is released, the dead process's ledger goes.
+    assert ledger.read_ledger(file_name) == {}
+    assert reap.prune_ledgers(USERID) == 1
+    assert not os.path.exists(file_name)
+
+
+def test_young_resources_of_dead_processes_are_left_alone(simulator):
+    young = create_spool_dataset(simulator, 1)
+    write_dead_ledger([(ledger.DATASET, young)], 1)
+    assert reap.find_orphans(USERID, 24*HOUR) == []
+
+
+def test_only_temporary_resources_are_taken_from_a_ledger(simulator, scratch):
+    victim = scratch / f'{USERID}_ZTTEMP_1.txt'
+    victim.write_text('not temporary\n')
+    simulator.create(f'{USERID}.SOURCE', 'PDS')
+    write_dead_ledger([(ledger.DATASET, f'{USERID}.SOURCE'),
+                       (ledger.DATASET, 'OTHER.ZTSPOOL.P0000001.T0000001'),
+                       (ledger.FILE, str(victim)),
+                       (ledger.FILE, f'/tmp/../{victim}'),
+                       (ledger.FILE, '/etc/passwd')], 48)
+
+    assert reap.find_orphans(USERID, 24*HOUR) == []
+
+
+def test_ledger_directory_others_can_get_into_is_not_used(scratch, capsys):
+    ledger_path = ledger.get_ledger_path(USERID)
+    os.makedirs(ledger_path, mode=0o700)
+    write_dead_ledger([(ledger.DATASET, f'{USERID}.ZTSPOOL.P0000001.T0000001')], 48)
+    os.chmod(ledger_path, 0o777)
+
+    assert ledger.list_ledgers(ledger_path) == []
+    assert reap.find_orphans(USERID, 24*HOUR) == []
+    ledger.claim(ledger.DATASET, f'{USERID}.ZTSPOOL.P0000001.T0000002')
+    ledger.release(ledger.DATASET, f'{USERID}.ZTSPOOL.P0000001.T0000002')
+    assert len(os.listdir(ledger_path)) == 1
+    assert f'not using ledger directory {ledger_path}' in capsys.readouterr().err
+
+
+def test_ledger_directory_is_created_private(scratch):
+    ledger.claim(ledger.DATASET, f'{USERID}.ZTSPOOL.P0000001.T0000001')
+    try:
+        assert os.stat(ledger.get_ledger_path(USERID)).st_mode & 0o777 == 0o700
+    finally:
+        ledger.release(ledger.DATASET, f'{USERID}.ZTSPOOL.P0000001.T0000001')
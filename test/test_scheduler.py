@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from conftest import import_orig, read_log
+
+scheduler = import_orig('scheduler')
+stage = import_orig('stage')
+
+
+class TimedStage:
+    """
+    A stand-in for a pipeline stage that notes when it starts and finishes.
+    """
+    def __init__(self, log, num: int, name: str, depends_on: list, timeline: list):
+        self.log = log
+        self.num = num
+        self.name = name
+        self.depends_on = depends_on
+        self.timeline = timeline
+        self.rc = 0
+
+    def run(self, cmd_env: dict) -> None:
+        self.timeline.append(('start', self.name))
+        time.sleep(0.2)
+        self.timeline.append(('end', self.name))
+
+    def set_log(self, log) -> None:
+        self.log = log
+
+
+def timed_stages(log, depends_on: dict, timeline: list) -> list:
+    return [TimedStage(log, num, name, deps, timeline)
+            for num, (name, deps) in enumerate(depends_on.items())]
+
+
+def test_stages_wait_for_what_they_depend_on(pipeline_log):
+    timeline = []
+    stages = timed_stages(pipeline_log, {'a': [], 'b': ['a'], 'c': [], 'd': ['b', 'c']}, timeline)
+
+    assert scheduler.Scheduler(pipeline_log, stages, 2).run({}) == 0
+    assert timeline.index(('end', 'a')) < timeline.index(('start', 'b'))
+    assert timeline.index(('end', 'b')) < timeline.index(('start', 'd'))
+    assert timeline.index(('end', 'c')) < timeline.index(('start', 'd'))
+    # Neither a nor c depends on anything, so they ran at the same time.
+    assert timeline.index(('start', 'c')) < timeline.index(('end', 'a'))
+
+
+def test_stages_without_depends_on_run_in_order(pipeline_log):
+    timeline = []
+    stages = timed_stages(pipeline_log, {'a': None, 'b': None, 'c': None}, timeline)
+
+    scheduler.Scheduler(pipeline_log, stages, 4).run({})
+    assert timeline == [(event, name) for name in 'abc' for event in ('start', 'end')]
+
+
+@pytest.mark.parametrize('depends_on', [{'a': ['b'], 'b': ['a']},
+                                        {'a': [], 'b': ['c'], 'c': ['d'], 'd': ['b']},
+                                        {'a': ['a']},
+                                        {'a': ['nowhere']}])
+def test_bad_graphs_are_rejected_before_anything_runs(pipeline_log, depends_on):
+    timeline = []
+    with pytest.raises(Exception):
+        scheduler.Scheduler(pipeline_log, timed_stages(pipeline_log, depends_on, timeline), 2)
+    assert timeline == []
+
+
+def test_cycles_are_reported(pipeline_log):
+    stages = timed_stages(pipeline_log, {'a': [], 'b': ['c'], 'c': ['b']}, [])
+    with pytest.raises(Exception):
+        scheduler.Scheduler(pipeline_log, stages, 2)
+    assert 'Error - circular depends_on between stages: [1, 2]' in read_log(pipeline_log)
+
+
+def test_stages_running_together_log_one_after_the_other(pipeline_log):
+    slow = stage.Stage(pipeline_log, [{'Name': 'slow'}, {'Depends_on': []},
+                                      {'Cmd': 'echo slow-1'}, {'Cmd': 'sleep 0.5'}, {'Cmd': 'echo slow-2'}], 0)
+    fast = stage.Stage(pipeline_log, [{'Name': 'fast'}, {'Depends_on': []},
+                                      {'Cmd': 'echo fast-1'}, {'Cmd': 'sleep 0.1'}, {'Cmd': 'echo fast-2'}], 1)
+
+    assert scheduler.Scheduler(pipeline_log, [slow, fast], 2).run({}) == 0
+    # The fast stage finished first, so its lines come first, all together.
+    lines = [line.split(' (')[0] for line in read_log(pipeline_log) if not line.startswith('[')]
+    assert lines == ['--- fast ---------------------------', 'fast-1', 'fast-2', '--- fast complete',
+                     '--- slow ---------------------------', 'slow-1', 'slow-2', '--- slow complete']
+    assert slow.log is pipeline_log
@@ -1,7 +1,43 @@
-# content of test_sample.py
-def inc(x):
-    return x + 1
+from conftest import USERID
+from ztron import run, batch, daemon
+from ztron.mvs import backend
 
 
-def test_answer():
-    assert inc(3) == 5
\ No newline at end of file
+def test_help_lists_every_command(capsys):
+    assert run.main(['--help']) == 0
+    out = capsys.readouterr().out
+    for command in ('ztron reap', 'ztron serve', 'ztron submit', 'ztron bench', '--jobs', '--job JOB'):
+        assert command in out
+
+
+def test_job_runs_on_the_simulator(write_job, scratch):
+    job_file = write_job(backend_opts={'name': 'simulator', 'path': scratch / 'ds'}, members=['M1', 'M2'])
+    simulator = backend.select({'name': 'simulator', 'path': str(scratch / 'ds')})
+    for member in ('M1', 'M2'):
+        simulator.write(f'{USERID}.SOURCE({member})', f'{member}\n')
+
+    assert run.run_job({'job': job_file, 'userid': '', 'log_type': 'info'}) == 0
+    assert simulator.list_members(f'{USERID}.TARGET') == ['M1', 'M2']
+
+
+def test_batch_runs_every_job_and_reports_a_bad_one(write_job, scratch):
+    backend_opts = {'name': 'simulator', 'path': scratch / 'ds'}
+    job_files = [write_job(name, backend_opts, members=['M1']) for name in ('job1', 'job2')]
+    bad_file = scratch / 'bad.yml'
+    bad_file.write_text('Name: [bad\n')
+    simulator = backend.select({'name': 'simulator', 'path': str(scratch / 'ds')})
+    simulator.write(f'{USERID}.SOURCE(M1)', 'M1\n')
+
+    all_results = batch.run_batch(job_files + [str(bad_file)], workers=2)
+
+    assert [results['rc'] for results in all_results] == [0, 0, 1]
+    assert [results['name'] for results in all_results[:2]] == ['job1', 'job2']
+    assert all_results[2]['error'] is not None
+    assert simulator.list_members(f'{USERID}.TARGET') == ['M1']
+
+
+def test_submit_exits_with_an_rc_that_fits_in_an_exit_status(monkeypatch):
+    replies = [{'event': 'log', 'level': 'info', 'message': 'copied'},
+               {'event': 'done', 'rc': 300, 'error': None}]
+    monkeypatch.setattr(daemon, 'request', lambda socket_path, message: iter(replies))
+    assert daemon.submit('job.yml', socket_path='unused') == 255
@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import USERID
+from ztron.mvs import backend, spool
+
+
+@pytest.fixture
+def simulator(scratch, monkeypatch):
+    # The pool runs on the default backend when it has no job log.
+    monkeypatch.setenv('ZTRON_BACKEND', backend.BACKEND_SIMULATOR)
+    return backend.get_backend()
+
+
+def test_pool_reuses_released_dataset(simulator, scratch):
+    pool = spool.SpoolPool(USERID, str(scratch / 'spool'), size=1)
+    first = pool.acquire()
+    assert first.startswith(f'{USERID}.ZTPOOL.')
+    pool.release(first)
+
+    assert pool.acquire() == first
+    with pool.locked() as contents:
+        assert [entry['name'] for entry in contents['in_use']] == [first]
+        assert contents['idle'] == []
+
+
+def test_pool_empties_reused_dataset(simulator, scratch):
+    pool = spool.SpoolPool(USERID, str(scratch / 'spool'), size=1)
+    name = pool.acquire()
+    simulator.write(name, 'LAST JOB OUTPUT\n')
+    pool.release(name)
+
+    assert pool.acquire() == name
+    assert simulator.read(name) == ''
+
+
+def test_pool_overflow_gets_temporary_dataset(simulator, scratch):
+    pool = spool.SpoolPool(USERID, str(scratch / 'spool'), size=1)
+    pooled = pool.acquire()
+    extra = pool.acquire()
+    assert extra.startswith(f'{USERID}.ZTSPOOL.')
+
+    # A dataset from outside the pool is deleted when it's released.
+    pool.release(extra)
+    assert simulator.read(extra) is None
+    pool.release(pooled)
+    assert simulator.read(pooled) == ''
+
+
+def test_unread_output_of_released_dataset_is_not_read(simulator, scratch):
+    pool = spool.SpoolPool(USERID, str(scratch / 'spool'), size=1)
+    name = pool.acquire()
+    simulator.write(name, 'FIRST JOB OUTPUT\n')
+    read_early = spool.SpoolOutput(name)
+    read_early.get_lines()
+    read_late = spool.SpoolOutput(name)
+    pool.release(name)
+
+    # The next job's output goes in the same dataset.
+    assert pool.acquire() == name
+    simulator.write(name, 'SECOND JOB OUTPUT\n')
+
+    assert read_early.get_lines() == ['FIRST JOB OUTPUT']
+    assert read_late.is_released()
+    assert read_late.get_lines() == [f'... spool dataset {name} was released before it was read ...']
+    assert spool.SpoolOutput(name).get_lines() == ['SECOND JOB OUTPUT']
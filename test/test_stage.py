@@ -0,0 +1,92 @@
+import re, time
+
+from conftest import import_orig, read_log
+
+stage = import_orig('stage')
+log = import_orig('log')
+log_file = import_orig('log_file')
+
+
+def build_stage(log, *cmds: str, **opts) -> 'stage.Stage':
+    items = [{'Name': 'test'}] + [{key.capitalize(): value} for key, value in opts.items()]
+    return stage.Stage(log, items + [{'Cmd': c} for c in cmds], 0)
+
+
+def output_lines(log) -> list:
+    return [line for line in read_log(log) if not line.startswith(('[', '---'))]
+
+
+def test_parallel_commands_log_in_command_order(pipeline_log):
+    stg = build_stage(pipeline_log, 'sleep 0.6; echo first', 'echo second', 'sleep 0.3; echo third',
+                      parallel=3)
+    start_time = time.time()
+    stg.run({})
+
+    assert time.time() - start_time < 1.0
+    assert output_lines(pipeline_log) == ['first', 'second', 'third']
+    assert stg.rc == 0
+
+
+def test_first_failing_command_sets_the_stage_rc(pipeline_log):
+    stg = build_stage(pipeline_log, 'sleep 0.2; exit 3', 'exit 5', 'true', parallel=3)
+    stg.run({})
+    assert stg.rc == 3
+    assert all(c.get_log() is pipeline_log for c in stg.cmds)
+
+
+def ispinfo_outputs(log) -> list:
+    # The <OUTPUT> of each gateway answer is the gateway's pid and the command.
+    return [line.removeprefix('<OUTPUT>').removesuffix('</OUTPUT>').split(': ')
+            for line in read_log(log) if line.startswith('<OUTPUT>')]
+
+
+def test_adjacent_tso_commands_are_batched(pipeline_log):
+    stg = build_stage(pipeline_log, 'TSO A', 'TSO B', 'echo shell', 'TSO C', 'TSO D', 'TSO E', 'TSO F',
+                      batch=3)
+    units = stg.build_units()
+
+    assert [type(unit).__name__ for unit in units] == ['TsoBatch', 'Cmd', 'TsoBatch', 'Cmd']
+    assert [c.get_cmd() for c in units[0].cmds] == ['TSO A', 'TSO B']
+    assert [c.get_cmd() for c in units[2].cmds] == ['TSO C', 'TSO D', 'TSO E']
+    assert units[3].get_cmd() == 'TSO F'
+
+
+def test_batch_shares_one_gateway_call(pipeline_log, cmd_env):
+    stg = build_stage(pipeline_log, 'TSO A', 'TSO B', 'TSO C', 'TSO D', batch=3)
+    stg.run(cmd_env)
+
+    outputs = ispinfo_outputs(pipeline_log)
+    assert [command for pid, command in outputs] == ['A', 'B', 'C', 'D']
+    pids = [pid for pid, command in outputs]
+    assert pids[0] == pids[1] == pids[2] != pids[3]
+    assert stg.rc == 0
+
+
+def test_each_batched_command_keeps_its_own_rc(pipeline_log, cmd_env):
+    stg = build_stage(pipeline_log, 'TSO A', 'TSO EXIT 4', 'TSO C', batch=3)
+    batch = stg.build_units()[0]
+
+    assert batch.run(cmd_env) == [0, 4, 0]
+    assert [c.rc for c in batch.cmds] == [0, 4, 0]
+    assert re.search(r'<RC>4</RC>', batch.cmds[1].out)
+
+
+def test_commands_after_a_gateway_abend_fail(pipeline_log, cmd_env):
+    stg = build_stage(pipeline_log, 'TSO A', 'TSO ABEND', 'TSO C', batch=3)
+    assert stg.build_units()[0].run(cmd_env) == [0, 12, 12]
+
+
+def test_stage_end_writes_a_buffered_stage(pipeline_log):
+    pipeline_log.set_flush_policy(log_file.FLUSH_STAGE)
+    build_stage(log.LogBuffer(pipeline_log), 'echo done').run({})
+
+    # Nothing but the end of the stage flushed the log file.
+    with open(pipeline_log.main_log_file.abs_log_file_path) as f:
+        assert 'done' in f.read().splitlines()
+
+
+def test_buffered_stage_traces_to_the_pipeline(pipeline_log):
+    build_stage(log.LogBuffer(pipeline_log), 'true', 'true', parallel=2).run({})
+    names = [event['name'] for event in pipeline_log.tracer.events]
+    assert names.count('cmd') == 2
+    assert names.count('stage') == 1
@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+from conftest import import_orig, read_log
+
+stream = import_orig('stream')
+stage = import_orig('stage')
+
+
+def test_stream_forwards_every_line_and_keeps_the_tail():
+    lines = []
+    out = stream.OutputStream(io.BytesIO(b''.join(b'line %d\n' % i for i in range(500))),
+                              lines.append, tail_lines=3)
+    out.start()
+    out.cleanup()
+
+    assert lines == [f'line {i}' for i in range(500)]
+    assert out.n_lines == 500
+    assert out.get_tail() == b'line 497\nline 498\nline 499'
+
+
+def test_ispinfo_filter_passes_only_the_ispinfo_block():
+    lines = []
+    ispinfo = stream.IspinfoFilter(lines.append)
+    for line in ['ISPZINT: processing request', 'chatter <ISPINFO>', '<OUTPUT>A</OUTPUT>',
+                 '</ISPINFO> more chatter', 'ISPZINT: request complete',
+                 '<ISPINFO><RC>0</RC></ISPINFO>']:
+        ispinfo(line)
+    assert lines == ['<ISPINFO>', '<OUTPUT>A</OUTPUT>', '</ISPINFO>', '<ISPINFO><RC>0</RC></ISPINFO>']
+
+
+def test_streamed_command_logs_everything_and_keeps_the_tail(pipeline_log):
+    stg = stage.Stage(pipeline_log, [{'Name': 'test'}, {'Stream': True},
+                                     {'Cmd': 'seq 1 500; echo failed >&2; exit 2'}], 0)
+    stg.run({})
+
+    lines = read_log(pipeline_log)
+    assert [str(i) for i in range(1, 501)] == [line for line in lines if line.isdigit()]
+    c = stg.cmds[0]
+    assert c.rc == stg.rc == 2
+    assert c.out.decode().splitlines() == [str(i) for i in range(401, 501)]
+    assert c.err == b'failed'
+    assert 'retcode: 2' in lines
+
+
+def test_streamed_tso_command_logs_only_the_ispinfo_block(pipeline_log, cmd_env):
+    stg = stage.Stage(pipeline_log, [{'Name': 'test'}, {'Stream': True}, {'Cmd': 'TSO A'}], 0)
+    stg.run(cmd_env)
+
+    lines = read_log(pipeline_log)
+    assert lines[lines.index('<ISPINFO>') - 1] == '[TSO]> A'
+    assert not any(line.startswith('ISPZINT:') for line in lines)
+    assert stg.rc == 0
+
+
+def test_stream_and_parallel_are_rejected(pipeline_log):
+    with pytest.raises(Exception):
+        stage.Stage(pipeline_log, [{'Name': 'test'}, {'Stream': True}, {'Parallel': 2}], 0)